@@ -1,7 +1,410 @@
-from flask import Flask, request, abort, jsonify
-from flask_cors import CORS
+import os
+import threading
+from functools import wraps
+from itertools import islice
+from dateutil import parser as date_parser
+from flask import (Flask, Response, g, request, abort, jsonify,
+                   make_response, stream_with_context)
+from sqlalchemy.orm import selectinload
 from models import *
+import auth
 from auth import AuthError, requires_auth
+from search import search
+from serializer import SerializerJSONEncoder, encode_rows, row_encoder
+from timing import init_timing, timed
+from compression import init_compression
+from cors import init_cors
+from metrics import init_metrics
+from cache import (LRUCache, RECORD_CACHE_SIZE, RECORD_CACHE_TTL,
+                   create_response_cache)
+
+# rows read from the database (and written out) at a time by the exports
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+
+
+# ----------------------------------------------------------------- #
+# Helpers.
+# ----------------------------------------------------------------- #
+
+'''
+get_page_args(sort)
+    reads the `limit` and `after` query parameters of a list endpoint.
+    `limit` defaults to (and is capped at) MAX_PAGE_SIZE, `after` is the
+    `next_cursor` returned by the previous page: an id, or when the list is
+    sorted by another column (`sort`), an opaque cursor (see keyset_page).
+'''
+
+
+def get_page_args(sort=None):
+    try:
+        limit = int(request.args.get('limit', MAX_PAGE_SIZE))
+        after = request.args.get('after', None)
+        if after is not None:
+            after = int(after) if sort is None or sort.key == 'id' \
+                else decode_cursor(after, sort)
+    except ValueError:
+        abort(400)
+
+    if limit < 1:
+        abort(400)
+    return min(limit, MAX_PAGE_SIZE), after
+
+
+'''
+get_sort_args(model, allowed)
+    reads the `sort` query parameter, a column name out of `allowed`,
+    prefixed with '-' for a descending order. Defaults to the id.
+'''
+
+
+def get_sort_args(model, allowed):
+    sort = request.args.get('sort', 'id')
+    descending = sort.startswith('-')
+    name = sort.lstrip('-')
+    if name not in allowed:
+        abort(400)
+    return getattr(model, name), descending
+
+
+'''
+get_fields_arg(model, allowed)
+    reads the `fields` query parameter, a comma separated list of column
+    names out of `allowed`, and returns those columns, the id first. None
+    when the parameter is not given.
+'''
+
+
+def get_fields_arg(model, allowed):
+    value = request.args.get('fields', None)
+    if value is None:
+        return None
+    names = [name.strip() for name in value.split(',')]
+    if not all(name in allowed for name in names):
+        abort(400)
+    names = ['id'] + [name for name in dict.fromkeys(names) if name != 'id']
+    return [getattr(model, name) for name in names]
+
+
+def get_date_arg(name):
+    value = request.args.get(name, None)
+    if value is None:
+        return None
+    try:
+        return date_parser.parse(value).replace(tzinfo=None)
+    except (ValueError, OverflowError):
+        abort(400)
+
+
+def get_int_arg(name):
+    value = request.args.get(name, None)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        abort(400)
+
+
+'''
+filter_movies(query) / filter_actors(query)
+    apply the filters of the list endpoints: `released_after` (inclusive),
+    `released_before` (exclusive) and `title_prefix` on movies; `gender`,
+    `min_age` and `max_age` (both inclusive) on actors. Each one is backed
+    by an index, see the models.
+'''
+
+
+def filter_movies(query):
+    released_after = get_date_arg('released_after')
+    if released_after is not None:
+        query = query.filter(Movies.release_date >= released_after)
+    released_before = get_date_arg('released_before')
+    if released_before is not None:
+        query = query.filter(Movies.release_date < released_before)
+    title_prefix = request.args.get('title_prefix', None)
+    if title_prefix:
+        query = query.filter(
+            Movies.title.startswith(title_prefix, autoescape=True))
+    return query
+
+
+def filter_actors(query):
+    gender = request.args.get('gender', None)
+    if gender is not None:
+        query = query.filter(Actors.gender == gender)
+    min_age = get_int_arg('min_age')
+    if min_age is not None:
+        query = query.filter(Actors.age >= min_age)
+    max_age = get_int_arg('max_age')
+    if max_age is not None:
+        query = query.filter(Actors.age <= max_age)
+    return query
+
+
+'''
+search_response(model, column, field, collection)
+    ranked, paginated search for the `q` query parameter, see search.py.
+    `limit` (default 20, capped at MAX_PAGE_SIZE) results per page, `page`
+    counts from 1.
+'''
+
+
+def search_response(model, column, field, collection):
+    text = request.args.get('q', '').strip()
+    if not text:
+        abort(400)
+    try:
+        limit = min(int(request.args.get('limit', 20)), MAX_PAGE_SIZE)
+        page = int(request.args.get('page', 1))
+    except ValueError:
+        abort(400)
+    if limit < 1 or page < 1:
+        abort(400)
+
+    results, has_more = search(
+        model, column, text, limit, offset=(page - 1) * limit)
+    return jsonify({
+        'success': True,
+        collection: [
+            {'id': row_id, field: value, 'score': round(score, 4)}
+            for row_id, value, score in results],
+        'next_page': page + 1 if has_more else None
+    })
+
+
+'''
+export_response(model, collection)
+    streams every row of `model`'s table to the client as a JSON document
+    ({"success": true, "<collection>": [...]}) or, with ?format=ndjson, as
+    one JSON object per line. Rows are read as plain tuples through a
+    server-side cursor EXPORT_BATCH_SIZE at a time and encoded and written
+    out batch by batch (see serializer.py), so memory use does not grow
+    with the size of the table.
+'''
+
+
+def export_response(model, collection):
+    export_format = request.args.get('format', 'json')
+    if export_format not in ('json', 'ndjson'):
+        abort(400)
+
+    columns = model.__table__.columns
+    names = [column.key for column in columns]
+    query = db.session.query(*columns).order_by(model.id)
+    encode = row_encoder(names)
+
+    def generate():
+        rows = iter(query.yield_per(EXPORT_BATCH_SIZE))
+        if export_format == 'json':
+            yield '{"success": true, "%s": [' % collection
+
+        separator = ''
+        while True:
+            batch = list(islice(rows, EXPORT_BATCH_SIZE))
+            if not batch:
+                break
+            if export_format == 'ndjson':
+                yield ''.join(encode(row) + '\n' for row in batch)
+            else:
+                # the objects of the batch, without the array's brackets
+                yield separator + encode_rows(batch, names)[1:-1]
+                separator = ','
+
+        if export_format == 'json':
+            yield ']}'
+
+    mimetype = 'application/x-ndjson' if export_format == 'ndjson' \
+        else 'application/json'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+
+'''
+validate_movie(data, partial) / validate_actor(data, partial)
+    check one record sent to a bulk endpoint and return the column values
+    to write, or raise ValueError describing what is wrong with it. With
+    `partial` (bulk PATCH) only the fields that are present are checked,
+    but at least one of them must be.
+'''
+
+
+def validate_fields(data, fields, partial):
+    if not isinstance(data, dict):
+        raise ValueError('record must be a JSON object')
+    present = [field for field in fields if data.get(field) is not None]
+    if partial and not present:
+        raise ValueError(' or '.join(fields) + ' is required')
+    if not partial and len(present) != len(fields):
+        raise ValueError(', '.join(fields[:-1]) + ' and ' + fields[-1] +
+                         ' are required')
+    return present
+
+
+def validate_movie(data, partial=False):
+    values = {}
+    for field in validate_fields(data, ('title', 'release_date'), partial):
+        if field == 'release_date':
+            try:
+                # stored without time zone, as PostgreSQL does with the raw
+                # string
+                values[field] = date_parser.parse(
+                    str(data[field])).replace(tzinfo=None)
+            except (ValueError, OverflowError):
+                raise ValueError('release_date is not a valid date')
+        else:
+            values[field] = str(data[field])
+    return values
+
+
+def validate_actor(data, partial=False):
+    values = {}
+    for field in validate_fields(data, ('name', 'age', 'gender'), partial):
+        if field == 'age':
+            try:
+                values[field] = int(data[field])
+            except (TypeError, ValueError):
+                raise ValueError('age must be an integer')
+        else:
+            values[field] = str(data[field])
+    return values
+
+
+'''
+get_ids(data, key)
+    reads the non-empty list of integer ids sent to a bulk PATCH/DELETE
+    (or, under 'actor_ids', to the cast endpoints)
+'''
+
+
+def get_ids(data, key='ids'):
+    ids = data.get(key, None) if isinstance(data, dict) else None
+    if (not isinstance(ids, list) or len(ids) == 0 or
+            not all(isinstance(item, int) for item in ids)):
+        abort(400)
+    return sorted(set(ids))
+
+
+'''
+bulk_insert_response(model, validate, collection)
+    validates every record of the JSON array in the request body and, if
+    they are all valid, writes them in one transaction (see bulk_insert).
+    Otherwise nothing is written and the errors are reported per item.
+    `batch_size` in the query string overrides BULK_BATCH_SIZE.
+'''
+
+
+def bulk_insert_response(model, validate, collection):
+    data = request.get_json()
+    if not isinstance(data, list) or len(data) == 0:
+        abort(400)
+    try:
+        batch_size = int(request.args.get('batch_size', BULK_BATCH_SIZE))
+    except ValueError:
+        abort(400)
+    if batch_size < 1:
+        abort(400)
+
+    records = []
+    errors = []
+    for index, item in enumerate(data):
+        try:
+            records.append(validate(item))
+        except ValueError as error:
+            errors.append({'index': index, 'message': str(error)})
+
+    if errors:
+        return jsonify({
+            'success': False,
+            'error': 422,
+            'message': 'unprocessable',
+            'errors': errors
+        }), 422
+
+    try:
+        ids = bulk_insert(model, records, batch_size)
+    except Exception as error:
+        print(f"\nerror => {error}\n")
+        abort(422)
+
+    return jsonify({
+        'success': True,
+        'message': f'{len(ids)} {collection} inserted into DB',
+        'ids': ids
+    })
+
+
+'''
+bulk_update_response(model, validate) / bulk_delete_response(model)
+    apply a change to, or delete, every id listed in the request body
+    ({"ids": [...], "changes": {...}}) with a single statement, and report
+    which ids did not exist.
+'''
+
+
+def bulk_update_response(model, validate):
+    data = request.get_json()
+    ids = get_ids(data)
+    try:
+        values = validate(data.get('changes', None), partial=True)
+    except ValueError as error:
+        return jsonify({
+            'success': False,
+            'error': 422,
+            'message': str(error)
+        }), 422
+
+    try:
+        updated = bulk_update(model, ids, values)
+    except Exception as error:
+        print(f"\nerror => {error}\n")
+        abort(500)
+
+    return jsonify({
+        'success': True,
+        'updated': updated,
+        'missing': sorted(set(ids) - set(updated))
+    })
+
+
+def bulk_delete_response(model):
+    ids = get_ids(request.get_json())
+    try:
+        deleted = bulk_delete(model, ids)
+    except Exception as error:
+        print(f"\nerror => {error}\n")
+        abort(500)
+
+    return jsonify({
+        'success': True,
+        'deleted': deleted,
+        'missing': sorted(set(ids) - set(deleted))
+    })
+
+
+'''
+conditional_get(table_name)
+    tags the responses of a list endpoint with an ETag made from the
+    version of its table, and answers a matching If-None-Match with a 304
+    before any row is read or serialized. The ETag is kept in g.etag,
+    which the response cache makes part of its keys: a worker whose cache
+    was not invalidated by a write made in another one cannot serve the
+    old body under the new ETag.
+'''
+
+
+def conditional_get(table_name):
+    def conditional_get_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            etag = g.etag = f'{table_name}-{get_version(table_name)}'
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+            if response.status_code in (200, 304):
+                response.set_etag(etag, weak=True)
+            return response
+        return wrapper
+    return conditional_get_decorator
 
 
 # ----------------------------------------------------------------- #
@@ -13,20 +416,48 @@ def create_app(test_config=None):
     app = Flask(__name__)
     # app.url_map.strict_slashes = False
     setup_db(app)
+    # keep list responses in the order they were sorted in
+    app.config['JSON_SORT_KEYS'] = False
+    # responses are encoded by serializer.py: orjson when it is installed,
+    # datetimes as ISO-8601
+    app.json_encoder = SerializerJSONEncoder
+
+    # cache of the read endpoints, invalidated by the write endpoints
+    response_cache = create_response_cache()
+    app.extensions['response_cache'] = response_cache
+    # recently read movies and actors, invalidated by PATCH and DELETE
+    record_cache = LRUCache(RECORD_CACHE_SIZE, RECORD_CACHE_TTL)
+    app.extensions['record_cache'] = record_cache
+
+    def get_record(model, namespace, record_id):
+        key = f'{namespace}:{record_id}'
+        record = record_cache.get(key)
+        if record is not None:
+            return record, 'HIT'
+        instance = model.query.get(record_id)
+        if instance is None:
+            abort(404)
+        record = instance.format()
+        record_cache.set(key, record)
+        return record, 'MISS'
 
-    # CORS app
-    cors = CORS(app, resources={r"/api/*": {"origins": "*"}})
-
-    # CORS Headers
-    @app.after_request
-    def after_request(response):
-        response.headers.add(
-            'Access-Control-Allow-Headers',
-            'Content-Type,Authorization,true')
-        response.headers.add(
-            'Access-Control-Allow-Methods',
-            'GET, DELETE, POST, PATCH, OPTIONS')
-        return response
+    def forget_records(namespace, ids):
+        for record_id in ids:
+            record_cache.delete(f'{namespace}:{record_id}')
+
+    # request counts, errors and latencies of this worker; registered first
+    # so its latencies include the other hooks
+    metrics = init_metrics(app)
+
+    # per-phase timings of each request, when REQUEST_TIMING is on
+    timing_histograms = init_timing(app)
+
+    # gzip / brotli / zstd bodies above COMPRESSION_MIN_SIZE; registered
+    # after the timing so its time is part of the request's
+    init_compression(app)
+
+    # CORS headers, precomputed, and preflights answered before routing
+    init_cors(app)
 
     # ----------------------------------------------------------------- #
     # Controllers
@@ -44,6 +475,38 @@ def create_app(test_config=None):
             # 'movie_titles': {movie.id: movie.title for movie in movies},
         })
 
+    # Connection pool statistics of the worker serving the request (the
+    # pool gauges are also part of /metrics)
+    @app.route('/pool-stats', methods=['GET'])
+    @requires_auth('get:stats')
+    def get_pool_stats(payload):
+        stats = pool_stats()
+        app.logger.info('connection pool: %s', stats['status'])
+        return jsonify({
+            'success': True,
+            'pool_stats': stats
+        })
+
+    # Request timing histograms of the worker serving the request (also
+    # part of /metrics)
+    @app.route('/timings', methods=['GET'])
+    @requires_auth('get:stats')
+    def get_timings(payload):
+        return jsonify({
+            'success': True,
+            'enabled': app.config['REQUEST_TIMING'],
+            'histograms': timing_histograms.snapshot()
+        })
+
+    # Prometheus metrics of every worker sharing METRICS_DIR, or of the
+    # worker serving the request. Like /pool-stats and /timings, which
+    # they include, they need get:stats: the scraper sends a bearer token
+    @app.route('/metrics', methods=['GET'])
+    @requires_auth('get:stats')
+    def get_metrics(payload):
+        return Response(metrics.render(timing_histograms),
+                        mimetype='text/plain; version=0.0.4')
+
     # ============================
     # Movies:
     # ============================
@@ -51,19 +514,65 @@ def create_app(test_config=None):
     # Get Movies
     @app.route('/movie', methods=['GET'])
     @requires_auth('get:movie')
+    @conditional_get('movies')
+    @response_cache.cached('movies')
     def get_movies(payload):
-        movies = Movies.query.all()
+        sort, descending = get_sort_args(
+            Movies, ('id', 'title', 'release_date'))
+        limit, after = get_page_args(sort)
+        fields = get_fields_arg(Movies, ('id', 'title', 'release_date'))
+        # clients need not keep the order of the keys of a JSON object, so
+        # sorted movies are returned as a list, as with fields
+        if fields is None and 'sort' in request.args:
+            fields = [Movies.id, Movies.title]
+        # plain rows of the selected columns, no ORM instances, and of the
+        # sort column that the cursor of the next page is made of
+        columns = fields or [Movies.id, Movies.title]
+        if not any(column is sort for column in columns):
+            columns = columns + [sort]
+        query = db.session.query(*columns)
+        movies, next_cursor = keyset_page(
+            filter_movies(query), Movies.id, after, limit, sort, descending)
         if (len(movies) == 0):
             abort(404)
         try:
+            # the rows are encoded here, the rest of the body by jsonify
+            with timed('serialize'):
+                movies = encode_rows(movies, [c.key for c in fields]) \
+                    if fields else {movie.id: movie.title for movie in movies}
             return jsonify({
                 'success': True,
-                'movies': {movie.id: movie.title for movie in movies}
+                'movies': movies,
+                'next_cursor': next_cursor
             })
 
         except BaseException:
             abort(422)
 
+    # Export all movies
+    @app.route('/movie/export', methods=['GET'])
+    @requires_auth('get:movie')
+    def export_movies(payload):
+        return export_response(Movies, 'movies')
+
+    # Get a single movie
+    @app.route('/movie/<int:movie_id>', methods=['GET'])
+    @requires_auth('get:movie')
+    def get_movie(payload, movie_id):
+        movie, cache_status = get_record(Movies, 'movies', movie_id)
+        response = jsonify({
+            'success': True,
+            'movie': movie
+        })
+        response.headers['X-Cache'] = cache_status
+        return response
+
+    # Search movies by title
+    @app.route('/movie/search', methods=['GET'])
+    @requires_auth('get:movie')
+    def search_movies(payload):
+        return search_response(Movies, Movies.title, 'title', 'movies')
+
     @app.route('/add-movie', methods=['POST'])
     @requires_auth('post:add-movie')
     def add_movie(payload):
@@ -78,11 +587,13 @@ def create_app(test_config=None):
                 abort(422)
 
             else:
-                # Create the movie instance
-                movie = Movies(title=title, release_date=release_date)
+                # Create the movie instance, with the date parsed so that
+                # every database stores it the same way
+                movie = Movies(**validate_movie(data))
 
                 # insert the new movie into db
                 movie.insert()
+                response_cache.invalidate('movies')
 
                 return jsonify({
                     'success': True,
@@ -95,6 +606,15 @@ def create_app(test_config=None):
             print(f"\nerror => {error}\n")
             abort(422)
 
+    # Add many movies at once:
+
+    @app.route('/add-movies', methods=['POST'])
+    @requires_auth('post:add-movie')
+    def add_movies(payload):
+        response = bulk_insert_response(Movies, validate_movie, 'movies')
+        response_cache.invalidate('movies')
+        return response
+
     # Edit an existing movie:
 
     @app.route('/movie/<int:movie_id>', methods=['PATCH'])
@@ -103,31 +623,30 @@ def create_app(test_config=None):
     def update_movie(payload, movie_id):
 
         data = request.get_json()
-        # extract that specific movie to be updated from the db
-        movie = Movies.query.filter(Movies.id == movie_id).one_or_none()
-
-        # if movie not found, exit with 404
-        if not movie:
-            abort(404)
-
         try:
-            # Ensure that all required fields to create a movie are supplied
-            if 'title' in data:
-                movie.title = data['title']
-            if 'release_date' in data:
-                movie.release_date = data['release_date']
-
-            movie.update()
-
-            return jsonify({
-                'success': True,
-                'movie': movie.format(),
-            }), 200
+            # only the fields that are supplied get updated
+            values = validate_movie(data, partial=True)
+        except ValueError:
+            abort(422)
 
+        try:
+            # update that specific movie and get it back, in one statement
+            movie = Movies.update_by_id(movie_id, values)
         except Exception as error:
             print(f"\nerror => {error}\n")
             abort(500)
 
+        # if movie not found, exit with 404
+        if not movie:
+            abort(404)
+        response_cache.invalidate('movies')
+        forget_records('movies', [movie_id])
+
+        return jsonify({
+            'success': True,
+            'movie': Movies.format_row(movie),
+        }), 200
+
     # Delete an existing movie:
 
     @app.route('/movie/<int:movie_id>', methods=['DELETE'])
@@ -137,19 +656,35 @@ def create_app(test_config=None):
         if not movie_id:
             abort(404)
 
-        # Get the movie to be deleted
-        to_delete_movie = Movies.query.filter(
-            Movies.id == movie_id).one_or_none()
-        if not to_delete_movie:
+        # delete the movie, a single statement tells whether it existed
+        if not Movies.delete_by_id(movie_id):
             abort(404)
-        # delete the movie
-        to_delete_movie.delete()
+        response_cache.invalidate('movies')
+        forget_records('movies', [movie_id])
 
         return jsonify({
             'success': True,
             'movie_id': movie_id
         }), 200
 
+    # Edit or delete many movies at once:
+
+    @app.route('/movies', methods=['PATCH'])
+    @requires_auth('patch:movie')
+    def update_movies(payload):
+        response = bulk_update_response(Movies, validate_movie)
+        response_cache.invalidate('movies')
+        forget_records('movies', request.get_json()['ids'])
+        return response
+
+    @app.route('/movies', methods=['DELETE'])
+    @requires_auth('delete:movie')
+    def delete_movies(payload):
+        response = bulk_delete_response(Movies)
+        response_cache.invalidate('movies')
+        forget_records('movies', request.get_json()['ids'])
+        return response
+
     # ============================
     # actors:
     # ============================
@@ -158,18 +693,64 @@ def create_app(test_config=None):
 
     @app.route('/actor', methods=['GET'])
     @requires_auth('get:actor')
+    @conditional_get('actors')
+    @response_cache.cached('actors')
     def get_actors(payload):
-        actors = Actors.query.all()
+        sort, descending = get_sort_args(Actors, ('id', 'name'))
+        limit, after = get_page_args(sort)
+        fields = get_fields_arg(Actors, ('id', 'name', 'age', 'gender'))
+        # sorted actors are returned as a list, see get_movies
+        if fields is None and 'sort' in request.args:
+            fields = [Actors.id, Actors.name]
+        # plain rows of the selected columns, no ORM instances, and of the
+        # sort column that the cursor of the next page is made of
+        columns = fields or [Actors.id, Actors.name]
+        if not any(column is sort for column in columns):
+            columns = columns + [sort]
+        query = db.session.query(*columns)
+        actors, next_cursor = keyset_page(
+            filter_actors(query), Actors.id, after, limit, sort, descending)
         if (len(actors) == 0):
             abort(404)
         try:
+            with timed('serialize'):
+                actors = encode_rows(actors, [c.key for c in fields]) \
+                    if fields else {actor.id: actor.name for actor in actors}
             return jsonify({
                 'success': True,
-                'actors': {actor.id: actor.name for actor in actors}
+                'actors': actors,
+                'next_cursor': next_cursor
             })
         except BaseException:
             abort(422)
 
+    # Export all actors
+
+    @app.route('/actor/export', methods=['GET'])
+    @requires_auth('get:actor')
+    def export_actors(payload):
+        return export_response(Actors, 'actors')
+
+    # Get a single actor
+
+    @app.route('/actor/<int:actor_id>', methods=['GET'])
+    @requires_auth('get:actor')
+    def get_actor(payload, actor_id):
+        actor, cache_status = get_record(Actors, 'actors', actor_id)
+        response = jsonify({
+            'success': True,
+            'actor': actor
+        })
+        response.headers['X-Cache'] = cache_status
+        return response
+
+    # Search actors by name
+
+    @app.route('/actor/search', methods=['GET'])
+    @requires_auth('get:actor')
+    def search_actors(payload):
+        return search_response(Actors, Actors.name, 'name', 'actors')
+
     # Add new actor
 
     @app.route('/add-actor', methods=['POST'])
@@ -193,6 +774,7 @@ def create_app(test_config=None):
 
                 # insert the new actor into db
                 actor.insert()
+                response_cache.invalidate('actors')
 
                 return jsonify({
                     'success': True,
@@ -204,6 +786,15 @@ def create_app(test_config=None):
             print(f"\nerror => {error}\n")
             abort(422)
 
+    # Add many actors at once:
+
+    @app.route('/add-actors', methods=['POST'])
+    @requires_auth('post:add-actor')
+    def add_actors(payload):
+        response = bulk_insert_response(Actors, validate_actor, 'actors')
+        response_cache.invalidate('actors')
+        return response
+
     # Edit an existing actor:
 
     @app.route('/actor/<int:actor_id>', methods=['PATCH'])
@@ -212,33 +803,30 @@ def create_app(test_config=None):
     def update_actor(payload, actor_id):
 
         data = request.get_json()
-        # extract that specific actor to be updated from the db
-        actor = Actors.query.filter(Actors.id == actor_id).one_or_none()
-
-        # if actor not found, exit with 404
-        if not actor:
-            abort(404)
-
         try:
-            # Ensure that all required fields to create a actor are supplied
-            if 'name' in data:
-                actor.name = data['name']
-            if 'age' in data:
-                actor.age = data['age']
-            if 'gender' in data:
-                actor.gender = data['gender']
-
-            actor.update()
-
-            return jsonify({
-                'success': True,
-                'actor': actor.format(),
-            }), 200
+            # only the fields that are supplied get updated
+            values = validate_actor(data, partial=True)
+        except ValueError:
+            abort(422)
 
+        try:
+            # update that specific actor and get it back, in one statement
+            actor = Actors.update_by_id(actor_id, values)
         except Exception as error:
             print(f"\nerror => {error}\n")
             abort(500)
 
+        # if actor not found, exit with 404
+        if not actor:
+            abort(404)
+        response_cache.invalidate('actors')
+        forget_records('actors', [actor_id])
+
+        return jsonify({
+            'success': True,
+            'actor': Actors.format_row(actor),
+        }), 200
+
     # Delete an existing actor:
 
     @app.route('/actor/<int:actor_id>', methods=['DELETE'])
@@ -248,19 +836,125 @@ def create_app(test_config=None):
         if not actor_id:
             abort(404)
 
-        # Get the actor to be deleted
-        to_delete_actor = Actors.query.filter(
-            Actors.id == actor_id).one_or_none()
-        if not to_delete_actor:
+        # delete the actor, a single statement tells whether it existed
+        if not Actors.delete_by_id(actor_id):
             abort(404)
-        # delete the actor
-        to_delete_actor.delete()
+        response_cache.invalidate('actors')
+        forget_records('actors', [actor_id])
 
         return jsonify({
             'success': True,
             'actor_id': actor_id
         }), 200
 
+    # Edit or delete many actors at once:
+
+    @app.route('/actors', methods=['PATCH'])
+    @requires_auth('patch:actor')
+    def update_actors(payload):
+        response = bulk_update_response(Actors, validate_actor)
+        response_cache.invalidate('actors')
+        forget_records('actors', request.get_json()['ids'])
+        return response
+
+    @app.route('/actors', methods=['DELETE'])
+    @requires_auth('delete:actor')
+    def delete_actors(payload):
+        response = bulk_delete_response(Actors)
+        response_cache.invalidate('actors')
+        forget_records('actors', request.get_json()['ids'])
+        return response
+
+    # ============================
+    # Casting:
+    # ============================
+
+    # Get movies with their casts, one page at a time. selectinload reads
+    # the casts of the whole page with one more query, instead of one per
+    # movie
+    @app.route('/casting', methods=['GET'])
+    @requires_auth('get:movie')
+    def get_casting(payload):
+        limit, after = get_page_args()
+        movies, next_cursor = keyset_page(
+            Movies.query.options(selectinload(Movies.cast)), Movies.id,
+            after, limit)
+        if (len(movies) == 0):
+            abort(404)
+        return jsonify({
+            'success': True,
+            'movies': [
+                dict(movie.format(),
+                     cast=[actor.format() for actor in movie.cast])
+                for movie in movies],
+            'next_cursor': next_cursor
+        })
+
+    # Get the cast of a movie
+    @app.route('/movie/<int:movie_id>/cast', methods=['GET'])
+    @requires_auth('get:movie')
+    def get_movie_cast(payload, movie_id):
+        movie = Movies.query.options(
+            selectinload(Movies.cast)).get(movie_id)
+        if movie is None:
+            abort(404)
+        return jsonify({
+            'success': True,
+            'movie_id': movie_id,
+            'cast': [actor.format() for actor in movie.cast]
+        })
+
+    # Get the movies of an actor
+    @app.route('/actor/<int:actor_id>/movies', methods=['GET'])
+    @requires_auth('get:actor')
+    def get_actor_movies(payload, actor_id):
+        actor = Actors.query.options(
+            selectinload(Actors.movies)).get(actor_id)
+        if actor is None:
+            abort(404)
+        return jsonify({
+            'success': True,
+            'actor_id': actor_id,
+            'movies': [movie.format() for movie in actor.movies]
+        })
+
+    # Add actors to, or remove them from, the cast of a movie
+    @app.route('/movie/<int:movie_id>/cast', methods=['POST'])
+    @requires_auth('patch:movie')
+    def add_movie_cast(payload, movie_id):
+        actor_ids = get_ids(request.get_json(), 'actor_ids')
+        if Movies.query.get(movie_id) is None:
+            abort(404)
+        try:
+            added, missing = add_cast(movie_id, actor_ids)
+        except Exception as error:
+            print(f"\nerror => {error}\n")
+            abort(422)
+
+        return jsonify({
+            'success': True,
+            'movie_id': movie_id,
+            'added': added,
+            'missing': missing
+        })
+
+    @app.route('/movie/<int:movie_id>/cast', methods=['DELETE'])
+    @requires_auth('patch:movie')
+    def remove_movie_cast(payload, movie_id):
+        actor_ids = get_ids(request.get_json(), 'actor_ids')
+        try:
+            removed = remove_cast(movie_id, actor_ids)
+        except Exception as error:
+            print(f"\nerror => {error}\n")
+            abort(500)
+
+        return jsonify({
+            'success': True,
+            'movie_id': movie_id,
+            'removed': removed,
+            'missing': sorted(set(actor_ids) - set(removed))
+        })
+
     # ----------------------------------------------------------------- #
     # Error Handling
     # ----------------------------------------------------------------- #
@@ -323,7 +1017,53 @@ def create_app(test_config=None):
     return app
 
 
-APP = create_app()
+# ----------------------------------------------------------------- #
+# Entry points.
+# ----------------------------------------------------------------- #
+
+'''
+get_app()
+    the app of this process, created by create_app() on first use rather
+    than when this module is imported, so the tests, manage.py and the
+    helpers importing it do not pay for it. `APP` (gunicorn app:APP) is
+    the same app, looked up through the module's __getattr__.
+'''
+
+_app = None
+_app_lock = threading.Lock()
+
+
+def get_app():
+    global _app
+    with _app_lock:
+        if _app is None:
+            _app = create_app()
+    return _app
+
+
+def __getattr__(name):
+    if name == 'APP':
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+'''
+warm_up(app)
+    does ahead of the first request what is otherwise done on it: creates
+    the database engine (and imports its driver) and loads python-jose and
+    the signing keys (see auth.warm_up). With gunicorn --preload it runs in
+    the master (see gunicorn.conf.py), so the forked workers share the
+    result. It does not connect to the database: no connection may be
+    shared between the workers.
+'''
+
+
+def warm_up(app):
+    if app.config.get("SQLALCHEMY_DATABASE_URI"):
+        with app.app_context():
+            db.get_engine(app)
+    auth.warm_up()
+
 
 if __name__ == '__main__':
-    APP.run(host='0.0.0.0', port=8080, debug=True)
+    get_app().run(host='0.0.0.0', port=8080, debug=True)
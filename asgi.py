@@ -0,0 +1,513 @@
+import asyncio
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+from urllib.parse import parse_qsl
+from app import get_app
+from auth import (AuthError, check_permissions, get_verified_payload_async,
+                  parse_auth_header)
+from models import (Actors, Movies, MAX_PAGE_SIZE, database_path,
+                    engine_options)
+import cors
+from compression import compress_body
+from serializer import dumps
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+try:
+    import aiosqlite
+except ImportError:
+    aiosqlite = None
+
+
+# Get necessary Environment Variables:
+# threads serving the requests that are handed over to the Flask app
+WSGI_THREADS = int(os.getenv("WSGI_THREADS", 20))
+
+# the CORS headers of the Flask app's responses, and of its answer to
+# preflights, see cors.py
+CORS_HEADERS = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in cors.CORS_HEADERS]
+PREFLIGHT_HEADERS = [
+    (name.lower().encode('latin-1'), value.encode('latin-1'))
+    for name, value in cors.PREFLIGHT_HEADERS]
+
+
+# ----------------------------------------------------------------- #
+# Async database access.
+# ----------------------------------------------------------------- #
+
+'''
+PostgresDatabase / SQLiteDatabase
+    run read queries without blocking the event loop, through asyncpg on
+    PostgreSQL (a pool sized like the SQLAlchemy one, see engine_options)
+    and aiosqlite on SQLite. Queries use asyncpg's $1, $2... placeholders
+    and fetch() returns the rows as tuples.
+'''
+
+
+class PostgresDatabase:
+    def __init__(self, url):
+        self.url = url
+        self.options = engine_options(url)
+        self.pool = None
+
+    async def connect(self):
+        size = self.options['pool_size']
+        self.pool = await asyncpg.create_pool(
+            self.url, min_size=size,
+            max_size=size + self.options['max_overflow'],
+            max_inactive_connection_lifetime=self.options['pool_recycle'])
+
+    async def fetch(self, query, *args):
+        rows = await self.pool.fetch(
+            query, *args, timeout=self.options['pool_timeout'])
+        return [tuple(row) for row in rows]
+
+    async def close(self):
+        await self.pool.close()
+
+
+class SQLiteDatabase:
+    def __init__(self, path):
+        self.path = path
+        self.connection = None
+
+    async def connect(self):
+        self.connection = await aiosqlite.connect(self.path)
+
+    async def fetch(self, query, *args):
+        # $n placeholders become positional ones
+        order = [int(number) - 1 for number in re.findall(r'\$(\d+)', query)]
+        query = re.sub(r'\$\d+', '?', query)
+        async with self.connection.execute(
+                query, [args[index] for index in order]) as cursor:
+            return await cursor.fetchall()
+
+    async def close(self):
+        await self.connection.close()
+
+
+def create_database(url):
+    # None when there is no async driver for the database, then every
+    # request is served by the Flask app
+    if not url:
+        return None
+    if url.startswith(('postgres://', 'postgresql://')) and asyncpg:
+        return PostgresDatabase(url)
+    if url.startswith('sqlite:///') and aiosqlite:
+        return SQLiteDatabase(url[len('sqlite:///'):])
+    return None
+
+
+# ----------------------------------------------------------------- #
+# Responses.
+# ----------------------------------------------------------------- #
+
+class Row:
+    # attribute access to a fetched row, for the models' format_row
+    def __init__(self, columns, values):
+        self.__dict__.update(zip(columns, values))
+
+
+def as_datetime(value):
+    # SQLite hands DATETIME columns back as text
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def json_response(body, status=200, headers=()):
+    data = dumps(body)
+    return status, [(b'content-type', b'application/json'), *headers], \
+        data.encode('utf-8')
+
+
+def error_response(status, message):
+    # same body as the Flask app's errorhandlers
+    return json_response({
+        'success': False,
+        'error': status,
+        'message': message
+    }, status)
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    candidates = [item.strip() for item in if_none_match.split(',')]
+    return '*' in candidates or f'"{etag}"' in candidates or \
+        f'W/"{etag}"' in candidates
+
+
+# ----------------------------------------------------------------- #
+# WSGI bridge.
+# ----------------------------------------------------------------- #
+
+'''
+run_wsgi(wsgi_app, scope, body, send, loop)
+    serves one request with the Flask app, in a worker thread. Every chunk
+    of the response is handed to the event loop as soon as it is produced,
+    so streamed responses (the exports) stay streamed.
+'''
+
+
+def wsgi_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        if name in environ:
+            value = environ[name] + ',' + value
+        environ[name] = value
+    # the body has been read in full, chunked or not
+    environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+
+def run_wsgi(wsgi_app, scope, body, send, loop):
+    def send_from_thread(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [
+            (name.lower().encode('latin-1'), value.encode('latin-1'))
+            for name, value in headers]
+
+    def send_start():
+        send_from_thread({
+            'type': 'http.response.start',
+            'status': response['status'],
+            'headers': response['headers']
+        })
+
+    result = wsgi_app(wsgi_environ(scope, body), start_response)
+    started = False
+    try:
+        for chunk in result:
+            if not started:
+                send_start()
+                started = True
+            if chunk:
+                send_from_thread({
+                    'type': 'http.response.body',
+                    'body': chunk,
+                    'more_body': True
+                })
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    if not started:
+        send_start()
+    send_from_thread({'type': 'http.response.body', 'body': b''})
+
+
+# ----------------------------------------------------------------- #
+# ASGI app.
+# ----------------------------------------------------------------- #
+
+'''
+AsyncApp
+    the ASGI entry point. The read endpoints that take most of the traffic
+    (GET /movie, /actor and single movies and actors) are served by async
+    handlers, so a worker keeps serving other requests while it waits for
+    the database or the signing keys. They answer like their Flask
+    counterparts: same bodies, ETags, record cache and metrics, except
+    that lists are read from the database every time (X-Cache: MISS)
+    instead of the response cache. Every other request, including those
+    reads when they use parameters the async handlers do not support
+    (filters and sort orders), is passed to the Flask app and served in a
+    pool of WSGI_THREADS threads.
+'''
+
+
+class AsyncApp:
+    def __init__(self, wsgi_app, database):
+        self.wsgi_app = wsgi_app
+        self.database = database
+        # shared with the Flask app, whose PATCH and DELETE invalidate it
+        self.record_cache = wsgi_app.extensions['record_cache']
+        self.executor = ThreadPoolExecutor(WSGI_THREADS)
+        self._connected = False
+        self._connect_lock = None
+        # requests served here are counted with the Flask app's
+        self.metrics = wsgi_app.extensions['metrics']
+        self.encodings = wsgi_app.config['COMPRESSION_ENCODINGS']
+        self.compression_min_size = wsgi_app.config['COMPRESSION_MIN_SIZE']
+        # (path, Flask rule, permission, handler, integer query parameters)
+        self.routes = [
+            (re.compile(r'/movie'), '/movie', 'get:movie', self.get_movies,
+             ('limit', 'after')),
+            (re.compile(r'/actor'), '/actor', 'get:actor', self.get_actors,
+             ('limit', 'after')),
+            (re.compile(r'/movie/(\d+)'), '/movie/<int:movie_id>',
+             'get:movie', self.get_movie, ()),
+            (re.compile(r'/actor/(\d+)'), '/actor/<int:actor_id>',
+             'get:actor', self.get_actor, ()),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+
+        started_at = time.perf_counter()
+        request_headers = dict(scope['headers'])
+        if cors.is_preflight(
+                scope['method'],
+                request_headers.get(b'access-control-request-method')):
+            # answered here, as the Flask app's middleware would
+            await send({
+                'type': 'http.response.start',
+                'status': 204,
+                'headers': PREFLIGHT_HEADERS
+            })
+            await send({'type': 'http.response.body', 'body': b''})
+            self.observe_request('OPTIONS', 'preflight', 'none', 204,
+                                 started_at)
+            return
+
+        response = None
+        if self.database is not None and scope['method'] == 'GET':
+            response = await self.dispatch(scope)
+        if response is None:
+            return await self.call_wsgi(scope, receive, send)
+
+        rule, permission, (status, headers, body) = response
+        # compressed like the Flask app's responses
+        accept_encoding = request_headers.get(b'accept-encoding', b'')
+        body, encoding = compress_body(
+            body, accept_encoding.decode('latin-1'), self.encodings,
+            self.compression_min_size)
+        headers = headers + [(b'vary', b'Accept-Encoding')]
+        if encoding is not None:
+            headers.append((b'content-encoding', encoding.encode('latin-1')))
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': headers + CORS_HEADERS
+        })
+        await send({'type': 'http.response.body', 'body': body})
+        self.observe_request('GET', rule, permission, status, started_at)
+
+    # counted and flushed to the snapshot files like the Flask app's
+    # requests (see record_metrics in metrics.py)
+    def observe_request(self, method, rule, permission, status, started_at):
+        self.metrics.observe_request(method, rule, permission, status,
+                                     time.perf_counter() - started_at)
+        self.metrics.maybe_flush(self.wsgi_app.extensions.get('timing'))
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.connect()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._connected:
+                    await self.database.close()
+                    self._connected = False
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def connect(self):
+        # servers without lifespan support connect on the first request
+        if self.database is None or self._connected:
+            return
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if not self._connected:
+                await self.database.connect()
+                self._connected = True
+
+    async def dispatch(self, scope):
+        for path, rule, permission, handler, parameters in self.routes:
+            match = path.fullmatch(scope['path'])
+            if match:
+                break
+        else:
+            return None
+
+        args = {}
+        for name, value in parse_qsl(scope['query_string'].decode('latin-1'),
+                                     keep_blank_values=True):
+            # anything else, or invalid values, is left to the Flask app
+            if name not in parameters:
+                return None
+            try:
+                args.setdefault(name, int(value))
+            except ValueError:
+                return None
+
+        headers = {
+            name.decode('latin-1'): value.decode('latin-1')
+            for name, value in scope['headers']}
+        try:
+            token = parse_auth_header(headers.get('authorization'))
+            payload = await get_verified_payload_async(token)
+            check_permissions(permission, payload)
+        except AuthError as error:
+            return rule, permission, json_response({
+                'success': False,
+                'error': error.status_code,
+                'message': error.error
+            }, error.status_code)
+
+        await self.connect()
+        response = await handler(headers, *match.groups(), **args)
+        if response is None:
+            return None
+        return rule, permission, response
+
+    async def call_wsgi(self, scope, receive, send):
+        body = []
+        while True:
+            message = await receive()
+            body.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            self.executor, run_wsgi, self.wsgi_app, scope, b''.join(body),
+            send, loop)
+
+    # ============================
+    # Handlers
+    # ============================
+
+    async def get_page(self, table, column, headers, limit, after):
+        if limit < 1:
+            return None
+        limit = min(limit, MAX_PAGE_SIZE)
+
+        rows = await self.database.fetch(
+            'SELECT version FROM table_versions WHERE name = $1', table)
+        etag = f'{table}-{rows[0][0] if rows else 0}'
+        etag_header = (b'etag', f'W/"{etag}"'.encode('latin-1'))
+        if etag_matches(headers.get('if-none-match'), etag):
+            return 304, [etag_header], b''
+
+        # one extra row tells whether another page follows
+        if after is None:
+            rows = await self.database.fetch(
+                f'SELECT id, {column} FROM {table} ORDER BY id LIMIT $1',
+                limit + 1)
+        else:
+            rows = await self.database.fetch(
+                f'SELECT id, {column} FROM {table} WHERE id > $1 '
+                f'ORDER BY id LIMIT $2', after, limit + 1)
+        if len(rows) == 0:
+            return error_response(404, 'resource not found')
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1][0]
+        return json_response({
+            'success': True,
+            table: {row_id: value for row_id, value in rows},
+            'next_cursor': next_cursor
+        }, headers=[etag_header, (b'x-cache', b'MISS')])
+
+    async def get_record(self, namespace, key, query, columns, format_row,
+                         record_id):
+        cache_key = f'{namespace}:{record_id}'
+        record = self.record_cache.get(cache_key)
+        cache_status = 'HIT'
+        if record is None:
+            rows = await self.database.fetch(query, record_id)
+            if len(rows) == 0:
+                return error_response(404, 'resource not found')
+            record = format_row(Row(columns, rows[0]))
+            self.record_cache.set(cache_key, record)
+            cache_status = 'MISS'
+        return json_response({
+            'success': True,
+            key: record
+        }, headers=[(b'x-cache', cache_status.encode('latin-1'))])
+
+    async def get_movies(self, headers, limit=MAX_PAGE_SIZE, after=None):
+        return await self.get_page('movies', 'title', headers, limit, after)
+
+    async def get_actors(self, headers, limit=MAX_PAGE_SIZE, after=None):
+        return await self.get_page('actors', 'name', headers, limit, after)
+
+    async def get_movie(self, headers, movie_id):
+        def format_row(row):
+            row.release_date = as_datetime(row.release_date)
+            return Movies.format_row(row)
+
+        return await self.get_record(
+            'movies', 'movie',
+            'SELECT id, title, release_date FROM movies WHERE id = $1',
+            ('id', 'title', 'release_date'), format_row, int(movie_id))
+
+    async def get_actor(self, headers, actor_id):
+        return await self.get_record(
+            'actors', 'actor',
+            'SELECT id, name, age, gender FROM actors WHERE id = $1',
+            ('id', 'name', 'age', 'gender'), Actors.format_row,
+            int(actor_id))
+
+
+def create_asgi_app(wsgi_app=None, database_url=database_path):
+    if wsgi_app is None:
+        wsgi_app = get_app()
+    return AsyncApp(wsgi_app, create_database(database_url))
+
+
+'''
+get_asgi_app()
+    the ASGI app of this process, around app.get_app(), created on first
+    use like it. `ASGI_APP` (uvicorn asgi:ASGI_APP) is the same app.
+'''
+
+_asgi_app = None
+_asgi_app_lock = threading.Lock()
+
+
+def get_asgi_app():
+    global _asgi_app
+    with _asgi_app_lock:
+        if _asgi_app is None:
+            _asgi_app = create_asgi_app()
+    return _asgi_app
+
+
+def __getattr__(name):
+    if name == 'ASGI_APP':
+        return get_asgi_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
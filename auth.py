@@ -1,9 +1,14 @@
 import os
+import asyncio
 import json
-from flask import request, _request_ctx_stack, abort
+import hashlib
+import threading
+import time
+from flask import request, _request_ctx_stack, abort, g
+from collections import OrderedDict
 from functools import wraps
-from jose import jwt
 from urllib.request import urlopen
+from timing import timed
 
 
 # Get necessary Environment Variables:
@@ -11,6 +16,17 @@ AUTH0_DOMAIN = os.getenv("AUTH0_DOMAIN")
 ALGORITHMS = os.getenv("ALGORITHMS")
 API_AUDIENCE = os.getenv("API_AUDIENCE")
 
+# Where to load the signing keys from. Defaults to the Auth0 tenant, but can
+# point at a local file (file:///path/jwks.json) or a stub server for tests.
+JWKS_URL = os.getenv(
+    "JWKS_URL", f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+# seconds a fetched key set is trusted before it is reloaded
+JWKS_CACHE_TTL = int(os.getenv("JWKS_CACHE_TTL", 600))
+# minimum seconds between forced reloads caused by an unknown 'kid'
+JWKS_MIN_REFRESH_INTERVAL = int(os.getenv("JWKS_MIN_REFRESH_INTERVAL", 30))
+# number of verified tokens kept in memory (0 disables the cache)
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 1024))
+
 
 # AuthError Exception
 '''
@@ -25,16 +41,202 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+# JWKS Cache
+'''
+JWKSCache
+    keeps the identity provider's key set in memory so that a request
+    does not pay for an outbound HTTPS round trip. Each key is parsed into a
+    public-key object once per load, so verifying a token does not rebuild
+    it from the modulus and exponent again. The set is reloaded when
+    the TTL runs out, or early when a token names a 'kid' we do not know
+    (key rotation). Only one thread reloads at a time; the others wait for
+    it and reuse its result instead of fetching again.
+'''
+
+
+class JWKSCache:
+    def __init__(self, url, ttl=JWKS_CACHE_TTL,
+                 min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL):
+        self.url = url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self._keys = {}
+        self._fetched_at = None
+        self._lock = threading.Lock()
+        # key lookups served from memory, and those that reloaded the keys
+        self.hits = 0
+        self.misses = 0
+
+    def _fetch(self):
+        jsonurl = urlopen(self.url)
+        return json.loads(jsonurl.read())
+
+    def _refresh(self, seen_fetched_at):
+        with self._lock:
+            # somebody else reloaded the keys while we were waiting
+            if self._fetched_at != seen_fetched_at:
+                return
+            try:
+                with timed('jwks'):
+                    jwks = self._fetch()
+            except Exception as error:
+                if not self._keys:
+                    raise AuthError({
+                        'code': 'jwks_unavailable',
+                        'description': 'Unable to load the signing keys.'
+                    }, 401)
+                # keep serving the keys we have, retry a bit later
+                print(f"\nerror => {error}\n")
+                self._fetched_at = (time.monotonic() - self.ttl +
+                                    self.min_refresh_interval)
+                return
+            self._keys = build_key_index(jwks)
+            self._fetched_at = time.monotonic()
+
+    def get_key(self, kid):
+        refreshed = False
+        fetched_at = self._fetched_at
+        if fetched_at is None or time.monotonic() - fetched_at >= self.ttl:
+            self._refresh(fetched_at)
+            refreshed = True
+
+        key = self._keys.get(kid)
+        if key is None:
+            # unknown kid: the keys may have been rotated, reload once
+            fetched_at = self._fetched_at
+            if time.monotonic() - fetched_at >= self.min_refresh_interval:
+                self._refresh(fetched_at)
+                refreshed = True
+                key = self._keys.get(kid)
+        if refreshed:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return key
+
+    def load(self):
+        # load the key set now if it was never loaded, e.g. before the
+        # workers fork (see warm_up)
+        fetched_at = self._fetched_at
+        if fetched_at is None:
+            self._refresh(fetched_at)
+
+    def peek(self, kid):
+        # the key if it can be served from memory right now, without
+        # (re)loading the key set
+        fetched_at = self._fetched_at
+        if fetched_at is None or time.monotonic() - fetched_at >= self.ttl:
+            return None
+        return self._keys.get(kid)
+
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+            self._fetched_at = None
+
+
+def prepare_key(key):
+    from jose import jwk
+    # parse a JWK into the crypto backend's native public-key object, which
+    # python-jose then uses as is instead of re-parsing 'n' and 'e'
+    constructed = jwk.construct(key, key.get('alg', 'RS256'))
+    # the cryptography backend calls it prepared_key, the others
+    # _prepared_key
+    return getattr(constructed, 'prepared_key', None) or \
+        constructed._prepared_key
+
+
+def build_key_index(jwks):
+    index = {}
+    for key in jwks['keys']:
+        if key.get('kty') != 'RSA' or 'kid' not in key:
+            continue
+        try:
+            index[key['kid']] = prepare_key(key)
+        except Exception as error:
+            print(f"\nerror => {error}\n")
+    return index
+
+
+jwks_cache = JWKSCache(JWKS_URL)
+
+
+# Verified Token Cache
+'''
+TokenCache
+    remembers the payload of tokens that already passed verification, so a
+    client presenting the same bearer token again skips the RSA signature
+    check. Entries are keyed by a SHA-256 digest of the token (the token
+    itself is never stored), expire at the token's 'exp' claim and the
+    least recently used entry is dropped once the cache is full.
+'''
+
+
+class TokenCache:
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # lookups answered from the cache or not, exported as metrics
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _digest(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token):
+        key = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            payload, expires_at = entry
+            if time.time() >= expires_at:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def set(self, token, payload):
+        expires_at = payload.get('exp')
+        # tokens without an expiry are always verified
+        if self.maxsize <= 0 or not isinstance(expires_at, (int, float)):
+            return
+        key = self._digest(token)
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+token_cache = TokenCache()
+
+
 # Auth Header
 def get_token_auth_header():
+    return parse_auth_header(request.headers.get('Authorization'))
+
 
-    if 'Authorization' not in request.headers:
+def parse_auth_header(auth_header):
+
+    if auth_header is None:
         raise AuthError({
             'code': 'authorization_header_missing',
             'description': 'Authorization header is expected but not found!'
         }, 401)
 
-    auth_header = request.headers['Authorization']
     # Get the token parts
     token_parts = auth_header.split(' ')
 
@@ -71,42 +273,31 @@ def check_permissions(permissions, payload):
 
 
 def verify_decode_jwt(token):
-    # GET THE PUBLIC KEY FROM AUTH0
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
-
+    from jose import jwt
     # GET THE DATA IN THE HEADER
     unverified_header = jwt.get_unverified_header(token)
 
-    # CHOOSE OUR KEY
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    # CHOOSE OUR KEY (cached and pre-parsed, see JWKSCache)
+    rsa_key = jwks_cache.get_key(unverified_header['kid'])
 
     # Finally, verify!!!
-    if rsa_key:
+    if rsa_key is not None:
         try:
             # USE THE KEY TO VALIDATE THE JWT
-            payload = jwt.decode(
-                token,
-                rsa_key,
-                algorithms=ALGORITHMS,
-                audience=API_AUDIENCE,
-                issuer='https://' + AUTH0_DOMAIN + '/'
-            )
+            with timed('jwt'):
+                payload = jwt.decode(
+                    token,
+                    (rsa_key,),
+                    algorithms=ALGORITHMS,
+                    audience=API_AUDIENCE,
+                    issuer='https://' + AUTH0_DOMAIN + '/'
+                )
 
             return payload
 
@@ -127,24 +318,81 @@ def verify_decode_jwt(token):
                 'code': 'invalid_header',
                 'description': 'Unable to parse authentication token.'
             }, 400)
-        except Exception:
-            raise AuthError({
-                'code': 'invalid_header',
-                'description': 'Unable to find the appropriate key.'
-            }, 400)
+    raise AuthError({
+        'code': 'invalid_header',
+        'description': 'Unable to find the appropriate key.'
+    }, 400)
+
+
+def get_verified_payload(token):
+    # reuse the payload of a token we already verified
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = verify_decode_jwt(token)
+        token_cache.set(token, payload)
+    return payload
+
+
+'''
+get_verified_payload_async(token)
+    get_verified_payload for the async handlers (see asgi.py). Loading the
+    signing keys is a blocking HTTP request, so when they are not in
+    memory it runs in a worker thread instead of on the event loop; the
+    signature check itself is CPU work and stays inline.
+'''
+
+
+async def get_verified_payload_async(token):
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+    from jose import jwt
+    try:
+        kid = jwt.get_unverified_header(token).get('kid')
+    except Exception:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 400)
+    if kid is not None and jwks_cache.peek(kid) is None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, jwks_cache.get_key, kid)
+    return get_verified_payload(token)
+
+
+'''
+warm_up()
+    python-jose (and the crypto backend under it) is imported on the first
+    token verified rather than with this module, and the signing keys are
+    fetched on first use. warm_up() does both ahead of the first request;
+    called in gunicorn's master before it forks (--preload), every worker
+    starts with the parsed keys.
+'''
+
+
+def warm_up():
+    from jose import jwt  # noqa: F401
+    try:
+        jwks_cache.load()
+    except AuthError as error:
+        # the workers will try again on their first request
+        print(f"\nerror => {error.error}\n")
 
 
 def requires_auth(permission=''):
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            # try:
-            #     payload = verify_decode_jwt(token)
-            # except BaseException:
-            #     abort(401)
-            check_permissions(permission, payload)
+            # the permission label of the request metrics
+            g.permission = permission
+            with timed('auth'):
+                token = get_token_auth_header()
+                payload = get_verified_payload(token)
+                # try:
+                #     payload = verify_decode_jwt(token)
+                # except BaseException:
+                #     abort(401)
+                check_permissions(permission, payload)
             return f(payload, *args, **kwargs)
         return wrapper
     return requires_auth_decorator
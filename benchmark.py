@@ -0,0 +1,411 @@
+'''
+benchmark.py
+    offline load test of every endpoint of app.py. Requests are signed with
+    a locally generated RSA key (served as a JWKS file), run in process
+    through the Flask test client against a freshly seeded SQLite database
+    or a local PostgreSQL one, and the latency percentiles (p50, p95, p99)
+    and requests per second of each endpoint are printed and saved as JSON.
+
+    python benchmark.py --movies 10000 --actors 10000 --requests 500 \\
+        --output results.json --baseline previous.json
+
+    --database-url points at a PostgreSQL database to use instead of a
+    temporary SQLite file. Its tables are dropped and created again.
+'''
+
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+
+# ----------------------------------------------------------------- #
+# Scenarios.
+# ----------------------------------------------------------------- #
+
+# records sent or changed per request by the bulk endpoints
+BATCH = 10
+
+'''
+Context
+    the ids of the seeded rows and of the rows set aside for the
+    endpoints that delete them, one per request
+'''
+
+
+class Context:
+    def __init__(self, movie_ids, actor_ids):
+        self.movie_ids = movie_ids
+        self.actor_ids = actor_ids
+        self.disposable = {}
+
+    def movie_id(self, i):
+        return self.movie_ids[i % len(self.movie_ids)]
+
+    def actor_id(self, i):
+        return self.actor_ids[i % len(self.actor_ids)]
+
+    def ids(self, ids, i):
+        return [ids[(i * BATCH + offset) % len(ids)]
+                for offset in range(BATCH)]
+
+
+def movie_values(i):
+    return {'title': f'Benchmark movie {i}',
+            'release_date': datetime(2000, 1, 1) + timedelta(days=i % 10000)}
+
+
+def movie_record(i):
+    # the same, as sent to the API
+    values = movie_values(i)
+    return dict(values, release_date=values['release_date'].isoformat())
+
+
+def actor_record(i):
+    return {'name': f'Benchmark actor {i}', 'age': 20 + i % 60,
+            'gender': 'female' if i % 2 else 'male'}
+
+
+def dispose(model_name, record, per_request=1):
+    # set aside rows for a scenario that deletes them
+    def prepare(ctx, count):
+        import models
+        model = getattr(models, model_name)
+        ctx.disposable[model.__tablename__] = models.bulk_insert(model, [
+            record(i) for i in range(count * per_request)])
+    return prepare
+
+
+# (method, rule, build(ctx, i) -> (path, JSON body), prepare(ctx, count))
+SCENARIOS = [
+    ('GET', '/', lambda ctx, i: ('/', None), None),
+    ('GET', '/pool-stats', lambda ctx, i: ('/pool-stats', None), None),
+    ('GET', '/timings', lambda ctx, i: ('/timings', None), None),
+    ('GET', '/metrics', lambda ctx, i: ('/metrics', None), None),
+
+    ('GET', '/movie', lambda ctx, i: (
+        f'/movie?limit=20&after={ctx.movie_id(i)}', None), None),
+    ('GET', '/movie/export', lambda ctx, i: ('/movie/export', None), None),
+    ('GET', '/movie/search', lambda ctx, i: (
+        f'/movie/search?q=movie {i % 1000}', None), None),
+    ('GET', '/movie/<int:movie_id>', lambda ctx, i: (
+        f'/movie/{ctx.movie_id(i)}', None), None),
+    ('POST', '/add-movie', lambda ctx, i: (
+        '/add-movie', movie_record(i)), None),
+    ('POST', '/add-movies', lambda ctx, i: (
+        '/add-movies', [movie_record(i * BATCH + j) for j in range(BATCH)]),
+     None),
+    ('PATCH', '/movie/<int:movie_id>', lambda ctx, i: (
+        f'/movie/{ctx.movie_id(i)}', {'title': f'Patched movie {i}'}), None),
+    ('DELETE', '/movie/<int:movie_id>', lambda ctx, i: (
+        f"/movie/{ctx.disposable['movies'][i]}", None),
+     dispose('Movies', movie_values)),
+    ('PATCH', '/movies', lambda ctx, i: (
+        '/movies', {'ids': ctx.ids(ctx.movie_ids, i),
+                    'changes': {'title': f'Bulk patched movie {i}'}}), None),
+    ('DELETE', '/movies', lambda ctx, i: (
+        '/movies', {'ids': ctx.ids(ctx.disposable['movies'], i)}),
+     dispose('Movies', movie_values, BATCH)),
+
+    ('GET', '/actor', lambda ctx, i: (
+        f'/actor?limit=20&after={ctx.actor_id(i)}', None), None),
+    ('GET', '/actor/export', lambda ctx, i: ('/actor/export', None), None),
+    ('GET', '/actor/search', lambda ctx, i: (
+        f'/actor/search?q=actor {i % 1000}', None), None),
+    ('GET', '/actor/<int:actor_id>', lambda ctx, i: (
+        f'/actor/{ctx.actor_id(i)}', None), None),
+    ('POST', '/add-actor', lambda ctx, i: (
+        '/add-actor', actor_record(i)), None),
+    ('POST', '/add-actors', lambda ctx, i: (
+        '/add-actors', [actor_record(i * BATCH + j) for j in range(BATCH)]),
+     None),
+    ('PATCH', '/actor/<int:actor_id>', lambda ctx, i: (
+        f'/actor/{ctx.actor_id(i)}', {'age': 20 + i % 60}), None),
+    ('DELETE', '/actor/<int:actor_id>', lambda ctx, i: (
+        f"/actor/{ctx.disposable['actors'][i]}", None),
+     dispose('Actors', actor_record)),
+    ('PATCH', '/actors', lambda ctx, i: (
+        '/actors', {'ids': ctx.ids(ctx.actor_ids, i),
+                    'changes': {'age': 20 + i % 60}}), None),
+    ('DELETE', '/actors', lambda ctx, i: (
+        '/actors', {'ids': ctx.ids(ctx.disposable['actors'], i)}),
+     dispose('Actors', actor_record, BATCH)),
+
+    ('GET', '/casting', lambda ctx, i: (
+        f'/casting?limit=20&after={ctx.movie_id(i)}', None), None),
+    ('GET', '/movie/<int:movie_id>/cast', lambda ctx, i: (
+        f'/movie/{ctx.movie_id(i)}/cast', None), None),
+    ('GET', '/actor/<int:actor_id>/movies', lambda ctx, i: (
+        f'/actor/{ctx.actor_id(i)}/movies', None), None),
+    ('POST', '/movie/<int:movie_id>/cast', lambda ctx, i: (
+        f'/movie/{ctx.movie_id(i)}/cast',
+        {'actor_ids': ctx.ids(ctx.actor_ids, i)}), None),
+    ('DELETE', '/movie/<int:movie_id>/cast', lambda ctx, i: (
+        f'/movie/{ctx.movie_id(i)}/cast',
+        {'actor_ids': ctx.ids(ctx.actor_ids, i)}), None),
+]
+
+
+def check_coverage(app):
+    # every endpoint of the app has exactly one scenario
+    routes = {
+        (method, rule.rule)
+        for rule in app.url_map.iter_rules() if rule.endpoint != 'static'
+        for method in rule.methods - {'HEAD', 'OPTIONS'}}
+    scenarios = {(method, rule) for method, rule, _, _ in SCENARIOS}
+    missing = sorted(routes - scenarios)
+    unknown = sorted(scenarios - routes)
+    if missing or unknown:
+        raise RuntimeError(
+            f'benchmark scenarios out of date, missing: {missing}, '
+            f'unknown: {unknown}')
+
+
+# ----------------------------------------------------------------- #
+# Measurements.
+# ----------------------------------------------------------------- #
+
+def percentile(sorted_values, percent):
+    # nearest-rank percentile
+    index = max(0, math.ceil(percent / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies, statuses, elapsed):
+    latencies = sorted(latencies)
+    counts = {}
+    for status in statuses:
+        counts[str(status)] = counts.get(str(status), 0) + 1
+    return {
+        'requests': len(latencies),
+        'errors': sum(1 for status in statuses if status >= 400),
+        'statuses': counts,
+        'rps': round(len(latencies) / elapsed, 1),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def measure(client, headers, scenario, ctx, requests, warmup, concurrency):
+    method, rule, build, prepare = scenario
+    if prepare is not None:
+        prepare(ctx, warmup + requests)
+
+    def call(i):
+        path, body = build(ctx, i)
+        start = time.perf_counter()
+        res = client.open(
+            path, method=method, headers=headers,
+            data=json.dumps(body) if body is not None else None)
+        # read the whole body, streamed responses included
+        res.get_data()
+        return time.perf_counter() - start, res.status_code
+
+    for i in range(warmup):
+        call(i)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(call, range(warmup, warmup + requests)))
+    elapsed = time.perf_counter() - start
+    return summarize([latency for latency, _ in results],
+                     [status for _, status in results], elapsed)
+
+
+# ----------------------------------------------------------------- #
+# Setup.
+# ----------------------------------------------------------------- #
+
+def seed(movie_count, actor_count, cast_size):
+    from models import Actors, Movies, bulk_insert, db, movie_cast
+    movie_ids = bulk_insert(Movies, [
+        movie_values(i) for i in range(movie_count)])
+    actor_ids = bulk_insert(Actors, [
+        actor_record(i) for i in range(actor_count)])
+    cast = {
+        (movie_id, actor_ids[(i + j) % len(actor_ids)])
+        for i, movie_id in enumerate(movie_ids) for j in range(cast_size)}
+    if cast:
+        db.session.execute(movie_cast.insert(), [
+            {'movie_id': movie_id, 'actor_id': actor_id}
+            for movie_id, actor_id in sorted(cast)])
+        db.session.commit()
+    return Context(movie_ids, actor_ids)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def run(options):
+    workdir = tempfile.TemporaryDirectory()
+    database_url = options.database_url or \
+        'sqlite:///' + os.path.join(workdir.name, 'benchmark.db')
+    # auth.py reads these when it is imported; they are only set for the
+    # import, the database is bound with setup_db() below
+    defaults = {'AUTH0_DOMAIN': 'casting-agency.test',
+                'ALGORITHMS': 'RS256',
+                'API_AUDIENCE': 'casting_agency'}
+    missing = [name for name in defaults if name not in os.environ]
+    os.environ.update((name, defaults[name]) for name in missing)
+    try:
+        import auth
+        from app import create_app
+        from models import db, setup_db
+        from local_auth import generate_key, make_token, write_jwks
+    finally:
+        for name in missing:
+            del os.environ[name]
+
+    pem, jwk = generate_key('benchmark')
+    jwks_path = os.path.join(workdir.name, 'jwks.json')
+    write_jwks(jwks_path, [jwk])
+    token = make_token(pem, 'benchmark', [
+        'get:movie', 'get:actor', 'post:add-movie', 'post:add-actor',
+        'patch:movie', 'patch:actor', 'delete:movie', 'delete:actor',
+        'get:stats'])
+    headers = {'Authorization': 'Bearer ' + token,
+               'Content-Type': 'application/json'}
+
+    app = create_app()
+    setup_db(app, database_url)
+    check_coverage(app)
+    if options.no_cache:
+        app.extensions['response_cache'].backend = None
+        app.extensions['record_cache'].maxsize = 0
+
+    results = {
+        'meta': {
+            'started_at': datetime.utcnow().isoformat() + 'Z',
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'database': database_url.split(':', 1)[0],
+            'movies': options.movies,
+            'actors': options.actors,
+            'cast_size': options.cast_size,
+            'requests': options.requests,
+            'warmup': options.warmup,
+            'concurrency': options.concurrency,
+            'token_cache_size': options.token_cache_size,
+            'cache': not options.no_cache,
+        },
+        'endpoints': {}
+    }
+
+    original_caches = (auth.jwks_cache, auth.token_cache)
+    auth.jwks_cache = auth.JWKSCache('file://' + jwks_path)
+    auth.token_cache = auth.TokenCache(options.token_cache_size)
+    try:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            ctx = seed(options.movies, options.actors, options.cast_size)
+            db.session.remove()
+
+            client = app.test_client()
+            for scenario in SCENARIOS:
+                name = f'{scenario[0]} {scenario[1]}'
+                if options.only and options.only not in name:
+                    continue
+                results['endpoints'][name] = measure(
+                    client, headers, scenario, ctx, options.requests,
+                    options.warmup, options.concurrency)
+                db.session.remove()
+            db.get_engine(app).dispose()
+    finally:
+        auth.jwks_cache, auth.token_cache = original_caches
+        workdir.cleanup()
+    return results
+
+
+# ----------------------------------------------------------------- #
+# Report.
+# ----------------------------------------------------------------- #
+
+def change(new, old):
+    if not old:
+        return ''
+    return f'{(new - old) / old * 100:+.0f}%'
+
+
+def report(results, baseline=None, out=sys.stdout):
+    previous = (baseline or {}).get('endpoints', {})
+    out.write(f"{'endpoint':<38}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}"
+              f"{'p99 ms':>9}{'errors':>8}" +
+              (f"{'rps':>8}{'p95':>8}" if baseline else '') + '\n')
+    for name, stats in results['endpoints'].items():
+        line = (f"{name:<38}{stats['rps']:>9.1f}{stats['p50_ms']:>9.2f}"
+                f"{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}"
+                f"{stats['errors']:>8}")
+        if baseline:
+            old = previous.get(name, {})
+            line += (f"{change(stats['rps'], old.get('rps')):>8}"
+                     f"{change(stats['p95_ms'], old.get('p95_ms')):>8}")
+        out.write(line + '\n')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Offline latency and throughput benchmark of the API.')
+    parser.add_argument('--movies', type=int, default=1000,
+                        help='movies to seed (default 1000)')
+    parser.add_argument('--actors', type=int, default=1000,
+                        help='actors to seed (default 1000)')
+    parser.add_argument('--cast-size', type=int, default=5,
+                        help='actors in the cast of each movie (default 5)')
+    parser.add_argument('--requests', type=int, default=200,
+                        help='measured requests per endpoint (default 200)')
+    parser.add_argument('--warmup', type=int, default=10,
+                        help='unmeasured requests first (default 10)')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='requests in flight at once (default 1)')
+    parser.add_argument('--token-cache-size', type=int, default=1024,
+                        help='verified tokens cache, 0 verifies the '
+                        'signature on every request (default 1024)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='disable the response and record caches')
+    parser.add_argument('--only', help='only endpoints whose name '
+                        "contains this, e.g. 'GET /movie'")
+    parser.add_argument('--database-url',
+                        help='PostgreSQL database to use (its tables are '
+                        'dropped), defaults to a temporary SQLite file')
+    parser.add_argument('--output', default='benchmark-results.json',
+                        help='where to save the results')
+    parser.add_argument('--baseline',
+                        help='results of a previous run to compare with')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    results = run(options)
+    with open(options.output, 'w') as output:
+        json.dump(results, output, indent=2)
+
+    baseline = None
+    if options.baseline:
+        with open(options.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    report(results, baseline)
+    print(f'\nresults saved to {options.output}')
+
+    errors = sum(stats['errors'] for stats in results['endpoints'].values())
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,286 @@
+import os
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import g, request, make_response
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+# Get necessary Environment Variables:
+# 'lru' (in-process, per worker), 'redis' (shared by all workers) or 'none'
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "lru")
+# number of responses kept by the in-process backend
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 256))
+# seconds a response is kept. With the in-process backend this also bounds
+# how long another worker may serve a response that was invalidated here.
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 60))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# recently read single records kept per worker, and for how many seconds
+RECORD_CACHE_SIZE = int(os.getenv("RECORD_CACHE_SIZE", 1024))
+RECORD_CACHE_TTL = int(os.getenv("RECORD_CACHE_TTL", 30))
+
+
+# ----------------------------------------------------------------- #
+# Backends.
+# ----------------------------------------------------------------- #
+
+'''
+LRUCache
+    in-process backend: a bounded, thread-safe LRU dict whose entries
+    expire after `ttl` seconds. Counters (used for invalidation) are kept
+    apart from the entries so they are never evicted.
+'''
+
+
+class LRUCache:
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def update(self, key, value):
+        # replace a value without extending its life
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (value, entry[1])
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def counter(self, key):
+        return self._counters.get(key, 0)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+'''
+SharedCache
+    backend shared by every worker, on top of any client with the redis
+    get / set(ex=) / incr / delete interface. Values are stored as JSON.
+    Errors talking to the client are treated as cache misses so an outage
+    of the cache does not take the API down with it; an invalidation that
+    fails leaves the entries to expire after `ttl` seconds.
+'''
+
+
+class SharedCache:
+    def __init__(self, client, ttl=RESPONSE_CACHE_TTL, prefix='casting:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        try:
+            raw = self.client.get(self.prefix + key)
+        except Exception as error:
+            print(f"\nerror => {error}\n")
+            return None
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value):
+        try:
+            self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+        except Exception as error:
+            print(f"\nerror => {error}\n")
+
+    def update(self, key, value):
+        # every worker sees invalidations here, so the entry may live on
+        self.set(key, value)
+
+    def delete(self, key):
+        try:
+            self.client.delete(self.prefix + key)
+        except Exception as error:
+            print(f"\nerror => {error}\n")
+
+    def counter(self, key):
+        try:
+            return int(self.client.get(self.prefix + key) or 0)
+        except Exception as error:
+            print(f"\nerror => {error}\n")
+            return 0
+
+    def incr(self, key):
+        # the write it follows is committed, failing here would only turn
+        # its success into an error
+        try:
+            return self.client.incr(self.prefix + key)
+        except Exception as error:
+            print(f"\nerror => {error}\n")
+            return None
+
+
+'''
+LocalClient
+    a stand-in for a redis client, for tests and single-process setups
+'''
+
+
+class LocalClient:
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._values[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        expires_at = time.monotonic() + ex if ex else None
+        with self._lock:
+            self._values[key] = (value, expires_at)
+
+    def delete(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._values.get(key, (0, None))[0]) + 1
+            self._values[key] = (value, None)
+            return value
+
+
+# ----------------------------------------------------------------- #
+# Response cache.
+# ----------------------------------------------------------------- #
+
+'''
+ResponseCache
+    caches successful responses of read endpoints. Entries are grouped in
+    namespaces ('movies', 'actors'); invalidating a namespace bumps its
+    generation, which is part of every key, so all of its entries are
+    dropped at once without having to find them. The ETag of the response
+    being made (g.etag, see conditional_get in app.py) is part of the key
+    too, so an entry is never served under the ETag of a later version of
+    its table, even when the write happened in another worker and only
+    invalidated the in-process cache there. Responses carry an
+    X-Cache: HIT / MISS header. A ResponseCache without a backend caches
+    nothing.
+'''
+
+
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _key(self, namespace):
+        generation = self.backend.counter('generation:' + namespace)
+        return (f'{namespace}:{generation}:{g.get("etag")}:'
+                f'{request.full_path}')
+
+    def cached(self, namespace):
+        def cached_decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if self.backend is None:
+                    return f(*args, **kwargs)
+
+                key = self._key(namespace)
+                entry = self.backend.get(key)
+                if entry is not None:
+                    response = make_response(
+                        entry['body'], entry['status'])
+                    response.mimetype = entry['mimetype']
+                    response.headers['X-Cache'] = 'HIT'
+                    g._response_cache_entry = (key, entry)
+                    return response
+
+                response = make_response(f(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed:
+                    entry = {
+                        'body': response.get_data(as_text=True),
+                        'status': response.status_code,
+                        'mimetype': response.mimetype
+                    }
+                    self.backend.set(key, entry)
+                    g._response_cache_entry = (key, entry)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return cached_decorator
+
+    # compressed bodies of the cached response being served, stored in
+    # its entry under 'encoded' (base64, so the shared backend can keep
+    # them as JSON)
+    def encoded(self, encoding):
+        cached = g.get('_response_cache_entry')
+        if cached is None:
+            return None
+        data = cached[1].get('encoded', {}).get(encoding)
+        return base64.b64decode(data) if data is not None else None
+
+    def store_encoded(self, encoding, data):
+        cached = g.get('_response_cache_entry')
+        if cached is None:
+            return
+        # a new entry: other requests may be reading the one in the cache
+        key, entry = cached
+        entry = dict(entry, encoded=dict(
+            entry.get('encoded', {}),
+            **{encoding: base64.b64encode(data).decode('ascii')}))
+        g._response_cache_entry = (key, entry)
+        self.backend.update(key, entry)
+
+    def invalidate(self, namespace):
+        if self.backend is not None:
+            self.backend.incr('generation:' + namespace)
+
+
+def create_response_cache(backend=RESPONSE_CACHE_BACKEND):
+    if backend == 'none':
+        return ResponseCache(None)
+    if backend == 'redis':
+        if redis is None:
+            raise RuntimeError(
+                'RESPONSE_CACHE_BACKEND=redis needs the redis package')
+        return ResponseCache(SharedCache(redis.Redis.from_url(REDIS_URL)))
+    return ResponseCache(LRUCache())
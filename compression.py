@@ -0,0 +1,144 @@
+import gzip
+import os
+from flask import request
+from werkzeug.http import parse_accept_header
+
+from timing import timed
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Get necessary Environment Variables:
+# smallest body, in bytes, worth compressing
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+# encodings offered, in order of preference when the client accepts several
+# equally; the ones whose package is not installed are left out, an empty
+# list turns compression off
+COMPRESSION_ENCODINGS = [
+    encoding.strip() for encoding in
+    os.getenv("COMPRESSION_ENCODINGS", "br,zstd,gzip").split(',')
+    if encoding.strip()]
+# levels tuned for responses compressed on the fly rather than for size
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 4))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", 3))
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson',
+                          'text/plain', 'text/html'}
+
+
+def gzip_compress(data):
+    return gzip.compress(data, GZIP_LEVEL)
+
+
+def brotli_compress(data):
+    return brotli.compress(data, quality=BROTLI_QUALITY)
+
+
+def zstd_compress(data):
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+
+# Content-Encoding -> compress(bytes), for the packages that are installed
+COMPRESSORS = {'gzip': gzip_compress}
+if brotli is not None:
+    COMPRESSORS['br'] = brotli_compress
+if zstandard is not None:
+    COMPRESSORS['zstd'] = zstd_compress
+
+
+def available_encodings(encodings=COMPRESSION_ENCODINGS):
+    return [encoding for encoding in encodings if encoding in COMPRESSORS]
+
+
+'''
+choose_encoding(accept_encoding, encodings)
+    the encoding out of `encodings` the client prefers according to its
+    Accept-Encoding header (q-values and '*' included), ties going to the
+    first one; None when it accepts none of them
+'''
+
+
+def choose_encoding(accept_encoding, encodings):
+    if not accept_encoding or not encodings:
+        return None
+    return parse_accept_header(accept_encoding).best_match(encodings)
+
+
+'''
+compress_body(body, accept_encoding, encodings, min_size)
+    (body, encoding): `body` compressed with the encoding the client
+    prefers, or as it is (and None) when it is smaller than `min_size` or
+    the client accepts no encoding we offer
+'''
+
+
+def compress_body(body, accept_encoding, encodings=None,
+                  min_size=COMPRESSION_MIN_SIZE):
+    if encodings is None:
+        encodings = available_encodings()
+    if len(body) < min_size:
+        return body, None
+    encoding = choose_encoding(accept_encoding, encodings)
+    if encoding is None:
+        return body, None
+    with timed('compress'):
+        return COMPRESSORS[encoding](body), encoding
+
+
+# ----------------------------------------------------------------- #
+# Flask integration.
+# ----------------------------------------------------------------- #
+
+'''
+init_compression(app, min_size, encodings)
+    compresses the JSON and text responses of `app` of at least
+    `min_size` bytes, with the encoding negotiated from Accept-Encoding.
+    Streamed responses (the exports) are sent as they are. For a response
+    served from, or stored in, the response cache the compressed bytes are
+    cached along with it, so a hit is not compressed again.
+'''
+
+
+def init_compression(app, min_size=COMPRESSION_MIN_SIZE,
+                     encodings=COMPRESSION_ENCODINGS):
+    encodings = available_encodings(encodings)
+    app.config['COMPRESSION_ENCODINGS'] = encodings
+    app.config['COMPRESSION_MIN_SIZE'] = min_size
+    if not encodings:
+        return
+
+    @app.after_request
+    def compress_response(response):
+        if (response.mimetype not in COMPRESSIBLE_MIMETYPES or
+                response.direct_passthrough or response.is_streamed or
+                response.status_code in (204, 206, 304) or
+                'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+
+        if response.calculate_content_length() < min_size:
+            return response
+        encoding = choose_encoding(
+            request.headers.get('Accept-Encoding'), encodings)
+        if encoding is None:
+            return response
+
+        response_cache = app.extensions.get('response_cache')
+        data = response_cache.encoded(encoding) if response_cache else None
+        if data is None:
+            with timed('compress'):
+                data = COMPRESSORS[encoding](response.get_data())
+            if response_cache is not None:
+                response_cache.store_encoded(encoding, data)
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        return response
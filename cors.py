@@ -0,0 +1,63 @@
+import os
+import time
+
+
+# Get necessary Environment Variables:
+# the origin browsers may call the API from, '*' for any
+CORS_ALLOW_ORIGIN = os.getenv("CORS_ALLOW_ORIGIN", "*")
+# seconds browsers may cache a preflight response
+CORS_MAX_AGE = int(os.getenv("CORS_MAX_AGE", 86400))
+
+# the headers of every response, made once
+CORS_HEADERS = [
+    ('Access-Control-Allow-Origin', CORS_ALLOW_ORIGIN),
+    ('Access-Control-Allow-Headers', 'Content-Type,Authorization,true'),
+    ('Access-Control-Allow-Methods', 'GET, DELETE, POST, PATCH, OPTIONS'),
+]
+# and those of the answer to a preflight request
+PREFLIGHT_HEADERS = CORS_HEADERS + [
+    ('Access-Control-Max-Age', str(CORS_MAX_AGE)),
+    ('Content-Length', '0'),
+]
+
+
+def is_preflight(method, access_control_request_method):
+    # an OPTIONS request sent by a browser before a cross-origin request
+    return method == 'OPTIONS' and access_control_request_method is not None
+
+
+'''
+CORSMiddleware
+    wraps the WSGI app: answers preflight requests itself, with a 204 and
+    PREFLIGHT_HEADERS, before Flask creates a request context, routes or
+    authenticates anything; adds CORS_HEADERS to every other response.
+    Preflights are still counted in the metrics, under the route
+    'preflight'.
+'''
+
+
+class CORSMiddleware:
+    def __init__(self, wsgi_app, metrics=None):
+        self.wsgi_app = wsgi_app
+        self.metrics = metrics
+
+    def __call__(self, environ, start_response):
+        if is_preflight(environ['REQUEST_METHOD'],
+                        environ.get('HTTP_ACCESS_CONTROL_REQUEST_METHOD')):
+            started_at = time.perf_counter()
+            start_response('204 No Content', list(PREFLIGHT_HEADERS))
+            if self.metrics is not None:
+                self.metrics.observe_request(
+                    'OPTIONS', 'preflight', 'none', 204,
+                    time.perf_counter() - started_at)
+            return []
+
+        def start_cors_response(status, headers, exc_info=None):
+            return start_response(status, headers + CORS_HEADERS, exc_info)
+        return self.wsgi_app(environ, start_cors_response)
+
+
+def init_cors(app):
+    app.wsgi_app = CORSMiddleware(
+        app.wsgi_app, app.extensions.get('metrics'))
+    return app.wsgi_app
@@ -0,0 +1,20 @@
+from metrics import clear_metrics_dir
+
+
+'''
+gunicorn settings, read from ./gunicorn.conf.py by default. Run with
+--preload to create the app once in the master and warm it up there (see
+app.warm_up): the workers are forked with it instead of each importing
+and building their own.
+'''
+
+
+def on_starting(server):
+    # snapshots of the previous run's workers, see metrics.py
+    clear_metrics_dir()
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        from app import get_app, warm_up
+        warm_up(get_app())
@@ -0,0 +1,65 @@
+import base64
+import json
+import time
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+
+import auth
+
+
+# ----------------------------------------------------------------- #
+# Local signing keys.
+# ----------------------------------------------------------------- #
+
+'''
+generate_key(kid) / write_jwks(path, jwks) / make_token(pem, kid, ...)
+    stand-ins for Auth0, for the offline tests and benchmark.py: an RSA
+    key pair (the private key as PEM, the public one as a JWK), a JWKS file
+    to point JWKSCache at with a file:// URL, and tokens signed with the
+    key, for the issuer and audience auth.py expects.
+'''
+
+
+def b64url_uint(value):
+    data = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def generate_key(kid):
+    private_key = rsa.generate_private_key(
+        public_exponent=65537, key_size=2048, backend=default_backend())
+    numbers = private_key.public_key().public_numbers()
+    pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption())
+    jwk = {
+        'kty': 'RSA',
+        'kid': kid,
+        'use': 'sig',
+        'alg': 'RS256',
+        'n': b64url_uint(numbers.n),
+        'e': b64url_uint(numbers.e)
+    }
+    return pem, jwk
+
+
+def write_jwks(path, jwks):
+    with open(path, 'w') as jwks_file:
+        json.dump({'keys': jwks}, jwks_file)
+
+
+def make_token(pem, kid, permissions, expires_in=3600):
+    now = int(time.time())
+    claims = {
+        'iss': 'https://' + auth.AUTH0_DOMAIN + '/',
+        'aud': auth.API_AUDIENCE,
+        'sub': 'auth0|test',
+        'iat': now,
+        'exp': now + expires_in,
+        'permissions': permissions
+    }
+    return jwt.encode(claims, pem, algorithm='RS256', headers={'kid': kid})
@@ -1,11 +1,21 @@
 from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
 
-from app import APP
+from app import get_app
 from models import db
 
-migrate = Migrate(APP, db)
-manager = Manager(APP)
+migrate = Migrate(db=db)
+
+
+def create_manage_app():
+    # the app is created when a command runs, not when this module is
+    # imported
+    app = get_app()
+    migrate.init_app(app)
+    return app
+
+
+manager = Manager(create_manage_app)
 
 manager.add_command('db', MigrateCommand)
 
@@ -0,0 +1,328 @@
+import glob
+import json
+import os
+import threading
+import time
+from flask import g, has_app_context, request
+
+import auth
+from models import pool_stats
+from timing import Histogram, TIMING_BUCKETS
+
+
+# Get necessary Environment Variables:
+# directory shared by the gunicorn workers of one server, where each worker
+# writes the snapshot of its metrics; unset, /metrics only reports the
+# worker that serves it
+METRICS_DIR = os.getenv("METRICS_DIR")
+# how often, in seconds, a worker rewrites its snapshot while serving
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 5))
+
+# name -> (type, help) of every exported metric
+METRICS = {
+    'http_requests_total': (
+        'counter', 'Requests served, by method, route and status code.'),
+    'http_errors_total': (
+        'counter', 'Error responses (4xx and 5xx), by status code.'),
+    'http_request_duration_seconds': (
+        'histogram', 'Time to serve a request, by route and permission.'),
+    'request_phase_duration_seconds': (
+        'histogram', 'Time spent in each phase of a request '
+        '(REQUEST_TIMING only).'),
+    'db_queries_per_request': (
+        'histogram', 'SQL statements run per request (REQUEST_TIMING only).'),
+    'auth_cache_requests_total': (
+        'counter', 'Lookups in the auth caches, by cache and result.'),
+    'db_pool_connections': (
+        'gauge', 'Connections of the database pool, by state.'),
+    'db_pool_size': ('gauge', 'Configured size of the database pool.'),
+    'workers': ('gauge', 'Live workers whose metrics are reported.'),
+}
+
+# histograms observed in milliseconds and exported in seconds
+MILLISECOND_HISTOGRAMS = {'http_request_duration_seconds',
+                          'request_phase_duration_seconds'}
+
+
+def format_labels(**labels):
+    # 'method="GET",route="/movie"', the label set as it is exported
+    return ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\')
+                         .replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in labels.items())
+
+
+def pid_is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# ----------------------------------------------------------------- #
+# Collector.
+# ----------------------------------------------------------------- #
+
+'''
+Metrics
+    the counters and histograms of one worker. Recording a request only
+    touches this process's memory; workers share nothing but, when
+    `directory` is set, a snapshot file each, rewritten at most every
+    `flush_interval` seconds and merged when /metrics is scraped.
+'''
+
+
+class Metrics:
+    def __init__(self, directory=METRICS_DIR,
+                 flush_interval=METRICS_FLUSH_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        # (name, labels) -> value / Histogram
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        # the first request is written out right away
+        self._flushed_at = None
+
+    def inc(self, name, labels='', value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets=TIMING_BUCKETS):
+        key = (name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(
+                    key, Histogram(buckets))
+        histogram.observe(value)
+
+    def observe_request(self, method, route, permission, status, seconds):
+        self.inc('http_requests_total', format_labels(
+            method=method, route=route, status=status))
+        if status >= 400:
+            self.inc('http_errors_total', format_labels(status=status))
+        self.observe('http_request_duration_seconds',
+                     format_labels(route=route, permission=permission),
+                     seconds * 1000)
+
+    def snapshot(self, timing=None):
+        # this worker's metrics: {'pid', 'counters', 'histograms', 'gauges'},
+        # each of the last three as {name: {labels: value}}
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = dict(self._histograms)
+        snapshot = {'pid': os.getpid(), 'counters': {}, 'histograms': {},
+                    'gauges': {}}
+        for (name, labels), value in counters.items():
+            snapshot['counters'].setdefault(name, {})[labels] = value
+        for (name, labels), histogram in histograms.items():
+            snapshot['histograms'].setdefault(name, {})[labels] = \
+                histogram.snapshot()
+
+        for cache_name in ('token', 'jwks'):
+            cache = getattr(auth, cache_name + '_cache')
+            results = snapshot['counters'].setdefault(
+                'auth_cache_requests_total', {})
+            results[format_labels(cache=cache_name, result='hit')] = \
+                cache.hits
+            results[format_labels(cache=cache_name, result='miss')] = \
+                cache.misses
+
+        if timing is not None:
+            for phase, histogram in timing.snapshot().items():
+                if phase == 'db_queries':
+                    snapshot['histograms']['db_queries_per_request'] = {
+                        '': histogram}
+                else:
+                    snapshot['histograms'].setdefault(
+                        'request_phase_duration_seconds', {})[
+                        format_labels(phase=phase)] = histogram
+
+        if not has_app_context():
+            return snapshot
+        try:
+            stats = pool_stats()
+        except Exception as error:
+            print(f"\nerror => {error}\n")
+        else:
+            gauges = snapshot['gauges']
+            for state in ('checkedin', 'checkedout', 'overflow'):
+                if state in stats:
+                    gauges.setdefault('db_pool_connections', {})[
+                        format_labels(state=state)] = stats[state]
+            if 'size' in stats:
+                gauges['db_pool_size'] = {'': stats['size']}
+        return snapshot
+
+    # ============================
+    # Per-worker snapshot files
+    # ============================
+
+    def path(self, pid=None):
+        return os.path.join(self.directory,
+                            f'metrics-{pid or os.getpid()}.json')
+
+    def flush(self, snapshot):
+        # write then rename, so readers never see half a file
+        path = self.path()
+        temporary_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temporary_path, 'w') as snapshot_file:
+            json.dump(snapshot, snapshot_file)
+        os.replace(temporary_path, path)
+        self._flushed_at = time.monotonic()
+
+    def maybe_flush(self, timing=None):
+        if self.directory is None or (
+                self._flushed_at is not None and
+                time.monotonic() - self._flushed_at < self.flush_interval):
+            return
+        try:
+            self.flush(self.snapshot(timing))
+        except Exception as error:
+            print(f"\nerror => {error}\n")
+
+    def collect(self, timing=None):
+        # the snapshots of every worker; this one's is always fresh
+        own = self.snapshot(timing)
+        if self.directory is None:
+            return [own]
+        self.flush(own)
+        snapshots = [own]
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            if path == self.path():
+                continue
+            try:
+                with open(path) as snapshot_file:
+                    snapshots.append(json.load(snapshot_file))
+            except (OSError, ValueError) as error:
+                print(f"\nerror => {error}\n")
+        return snapshots
+
+    def render(self, timing=None):
+        return render(merge(self.collect(timing)))
+
+
+'''
+merge(snapshots)
+    adds up the snapshots of several workers. Counters and histograms of
+    workers that exited are kept, so totals never go down when gunicorn
+    replaces a worker; gauges only count live workers.
+'''
+
+
+def merge(snapshots):
+    merged = {'counters': {}, 'histograms': {}, 'gauges': {}}
+    live = 0
+    for snapshot in snapshots:
+        for name, series in snapshot['counters'].items():
+            totals = merged['counters'].setdefault(name, {})
+            for labels, value in series.items():
+                totals[labels] = totals.get(labels, 0) + value
+        for name, series in snapshot['histograms'].items():
+            totals = merged['histograms'].setdefault(name, {})
+            for labels, histogram in series.items():
+                total = totals.setdefault(
+                    labels, {'buckets': {}, 'count': 0, 'sum': 0})
+                for bound, count in histogram['buckets'].items():
+                    total['buckets'][bound] = \
+                        total['buckets'].get(bound, 0) + count
+                total['count'] += histogram['count']
+                total['sum'] += histogram['sum']
+        if snapshot['pid'] != os.getpid() and \
+                not pid_is_alive(snapshot['pid']):
+            continue
+        live += 1
+        for name, series in snapshot['gauges'].items():
+            totals = merged['gauges'].setdefault(name, {})
+            for labels, value in series.items():
+                totals[labels] = totals.get(labels, 0) + value
+    merged['gauges']['workers'] = {'': live}
+    return merged
+
+
+def format_value(value):
+    if isinstance(value, float) and not value.is_integer():
+        return repr(round(value, 6))
+    return str(int(value))
+
+
+def render(merged):
+    # Prometheus text exposition format, version 0.0.4
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        series = merged[kind + 's'].get(name)
+        if not series:
+            continue
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind != 'histogram':
+            for labels, value in sorted(series.items()):
+                lines.append(f'{name}{{{labels}}} {format_value(value)}'
+                             if labels else f'{name} {format_value(value)}')
+            continue
+        scale = 1000 if name in MILLISECOND_HISTOGRAMS else 1
+        for labels, histogram in sorted(series.items()):
+            prefix = labels + ',' if labels else ''
+            for bound, count in histogram['buckets'].items():
+                if bound != '+Inf':
+                    bound = f'{float(bound) / scale:g}'
+                lines.append(
+                    f'{name}_bucket{{{prefix}le="{bound}"}} {count}')
+            suffix = f'{{{labels}}}' if labels else ''
+            lines.append(f'{name}_sum{suffix} '
+                         f'{format_value(histogram["sum"] / scale)}')
+            lines.append(f'{name}_count{suffix} {histogram["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def clear_metrics_dir(directory=METRICS_DIR):
+    # snapshots of a previous run; call before the workers start (gunicorn's
+    # on_starting hook)
+    if directory is None:
+        return
+    for path in glob.glob(os.path.join(directory, 'metrics-*.json*')):
+        os.remove(path)
+
+
+# ----------------------------------------------------------------- #
+# Flask integration.
+# ----------------------------------------------------------------- #
+
+'''
+init_metrics(app)
+    records every request of `app` in app.extensions['metrics'], the
+    collector of this worker, including the errors answered by the
+    errorhandlers. Call it before registering other after_request hooks
+    so the recorded latency includes them.
+'''
+
+
+def init_metrics(app, directory=METRICS_DIR,
+                 flush_interval=METRICS_FLUSH_INTERVAL):
+    metrics = Metrics(directory, flush_interval)
+    app.extensions['metrics'] = metrics
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+
+    @app.before_request
+    def start_metrics():
+        g._metrics_started_at = time.perf_counter()
+
+    @app.after_request
+    def record_metrics(response):
+        started_at = g.pop('_metrics_started_at', None)
+        if started_at is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe_request(
+            request.method, route, g.get('permission') or 'none',
+            response.status_code, time.perf_counter() - started_at)
+        metrics.maybe_flush(app.extensions.get('timing'))
+        return response
+
+    return metrics
@@ -0,0 +1,33 @@
+"""table versions for ETags
+
+Revision ID: 3b7e2c91d4a6
+Revises: 0f164e45d8a2
+Create Date: 2026-10-18 10:12:41.530918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7e2c91d4a6'
+down_revision = '0f164e45d8a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    table_versions = op.create_table(
+        'table_versions',
+        sa.Column('name', sa.String(length=64), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(table_versions, [
+        {'name': 'movies', 'version': 1},
+        {'name': 'actors', 'version': 1},
+    ])
+
+
+def downgrade():
+    op.drop_table('table_versions')
@@ -0,0 +1,36 @@
+"""casting: which actors play in which movies
+
+Revision ID: 5e8f3a6b2c17
+Revises: a4c9e27f1b85
+Create Date: 2026-10-18 14:10:36.512907
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8f3a6b2c17'
+down_revision = 'a4c9e27f1b85'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'movie_cast',
+        sa.Column('movie_id', sa.Integer(), nullable=False),
+        sa.Column('actor_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['actor_id'], ['actors.id'],
+                                ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['movie_id'], ['movies.id'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('movie_id', 'actor_id')
+    )
+    op.create_index('ix_movie_cast_actor_id', 'movie_cast',
+                    ['actor_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_movie_cast_actor_id', table_name='movie_cast')
+    op.drop_table('movie_cast')
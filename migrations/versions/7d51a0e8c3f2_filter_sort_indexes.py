@@ -0,0 +1,40 @@
+"""indexes for filtering and sorting movies and actors
+
+Revision ID: 7d51a0e8c3f2
+Revises: 3b7e2c91d4a6
+Create Date: 2026-10-18 11:02:17.204511
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d51a0e8c3f2'
+down_revision = '3b7e2c91d4a6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_movies_release_date_id', 'movies',
+                    ['release_date', 'id'], unique=False)
+    op.create_index('ix_movies_title_id', 'movies',
+                    ['title', 'id'], unique=False)
+    op.create_index('ix_movies_title_pattern', 'movies', ['title'],
+                    unique=False,
+                    postgresql_ops={'title': 'varchar_pattern_ops'})
+    op.create_index('ix_actors_gender_age', 'actors',
+                    ['gender', 'age'], unique=False)
+    op.create_index('ix_actors_age', 'actors', ['age'], unique=False)
+    op.create_index('ix_actors_name_id', 'actors',
+                    ['name', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_actors_name_id', table_name='actors')
+    op.drop_index('ix_actors_age', table_name='actors')
+    op.drop_index('ix_actors_gender_age', table_name='actors')
+    op.drop_index('ix_movies_title_pattern', table_name='movies')
+    op.drop_index('ix_movies_title_id', table_name='movies')
+    op.drop_index('ix_movies_release_date_id', table_name='movies')
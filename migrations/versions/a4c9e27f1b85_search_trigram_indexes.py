@@ -0,0 +1,31 @@
+"""trigram indexes for searching movie titles and actor names
+
+Revision ID: a4c9e27f1b85
+Revises: 7d51a0e8c3f2
+Create Date: 2026-10-18 13:24:51.880312
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c9e27f1b85'
+down_revision = '7d51a0e8c3f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_movies_title_trgm', 'movies', ['title'],
+                    unique=False, postgresql_using='gin',
+                    postgresql_ops={'title': 'gin_trgm_ops'})
+    op.create_index('ix_actors_name_trgm', 'actors', ['name'],
+                    unique=False, postgresql_using='gin',
+                    postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_actors_name_trgm', table_name='actors')
+    op.drop_index('ix_movies_title_trgm', table_name='movies')
@@ -0,0 +1,50 @@
+"""table versions bumped by triggers
+
+Revision ID: c8d2f6a1e9b4
+Revises: 5e8f3a6b2c17
+Create Date: 2026-10-18 21:42:17.306158
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8d2f6a1e9b4'
+down_revision = '5e8f3a6b2c17'
+branch_labels = None
+depends_on = None
+
+tables = ('movies', 'actors')
+operations = ('INSERT', 'UPDATE', 'DELETE')
+
+
+def upgrade():
+    op.execute("""
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM changed) THEN
+        INSERT INTO table_versions (name, version) VALUES (TG_TABLE_NAME, 1)
+        ON CONFLICT (name) DO UPDATE
+        SET version = table_versions.version + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql""")
+    for table in tables:
+        for operation in operations:
+            transition = 'OLD' if operation == 'DELETE' else 'NEW'
+            op.execute(f"""
+CREATE TRIGGER {table}_{operation.lower()}_version
+AFTER {operation} ON {table}
+REFERENCING {transition} TABLE AS changed
+FOR EACH STATEMENT EXECUTE PROCEDURE bump_table_version()""")
+
+
+def downgrade():
+    for table in tables:
+        for operation in operations:
+            op.execute(
+                f'DROP TRIGGER {table}_{operation.lower()}_version '
+                f'ON {table}')
+    op.execute('DROP FUNCTION bump_table_version()')
@@ -1,6 +1,13 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event, select, tuple_
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
 from datetime import datetime
+import base64
+import json
 import os
+import sqlite3
 
 
 # ----------------------------------------------------------------- #
@@ -15,28 +22,131 @@ database_name = "casting_agency"
 # For heroku:
 database_path = os.getenv("DATABASE_URL")
 
+# largest page a list endpoint returns, also used when no limit is given
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 1000))
+# rows written per INSERT statement by the bulk endpoints
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", 500))
+
 db = SQLAlchemy()
 
 '''
-setup_db(app)
-    binds a flask application and a SQLAlchemy service
+engine_options(database_path)
+    connection pool settings for each worker process, from the environment:
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT (seconds to wait for a
+    free connection), DB_POOL_RECYCLE (seconds before a connection is
+    replaced) and DB_POOL_PRE_PING (check connections before use, so ones
+    dropped while idle are not handed out).
+'''
+
+
+def engine_options(database_path):
+    options = {
+        'pool_pre_ping': os.getenv(
+            "DB_POOL_PRE_PING", "true").lower() in ('1', 'true', 'yes'),
+        'pool_recycle': int(os.getenv("DB_POOL_RECYCLE", 1800)),
+    }
+    # SQLite uses its own pools, which have no size to configure
+    if database_path and not database_path.startswith('sqlite'):
+        options['pool_size'] = int(os.getenv("DB_POOL_SIZE", 5))
+        options['max_overflow'] = int(os.getenv("DB_MAX_OVERFLOW", 10))
+        options['pool_timeout'] = int(os.getenv("DB_POOL_TIMEOUT", 30))
+    return options
+
+
+'''
+setup_db(app, database_path, **overrides)
+    binds a flask application and a SQLAlchemy service. The pool settings
+    are those of engine_options() for the database being bound, also when
+    the app was bound to another one before; keyword arguments (e.g.
+    pool_size=2) win over them.
 '''
 
 
-def setup_db(app, database_path=database_path):
+def setup_db(app, database_path=database_path, **overrides):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = dict(
+        engine_options(database_path), **overrides)
     db.app = app
     db.init_app(app)
     # db.create_all()
 
 
+'''
+pool_stats()
+    the state of this worker's connection pool, to help size the pools
+'''
+
+
+def pool_stats():
+    pool = db.engine.pool
+    stats = {
+        'pid': os.getpid(),
+        'pool': type(pool).__name__,
+        'status': pool.status(),
+    }
+    # only QueuePool (the default outside SQLite) keeps these counters
+    for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+        if hasattr(pool, name):
+            stats[name] = getattr(pool, name)()
+    return stats
+
+
+# SQLite only enforces foreign keys (and their ON DELETE CASCADE) when
+# asked to, on every connection
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
 # ----------------------------------------------------------------- #
 # Models.
 # ----------------------------------------------------------------- #
 
+# the trigram search indexes need pg_trgm, also when tables are created
+# with db.create_all() rather than the migrations
+event.listen(
+    db.Model.metadata, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(
+        dialect='postgresql'))
+
+'''
+movie_cast
+    which actors play in which movies. Rows go away with their movie or
+    actor (ON DELETE CASCADE), also when those are deleted with a single
+    statement by the helpers below.
+'''
+
+movie_cast = db.Table(
+    'movie_cast',
+    db.Column('movie_id', db.Integer,
+              db.ForeignKey('movies.id', ondelete='CASCADE'),
+              primary_key=True),
+    db.Column('actor_id', db.Integer,
+              db.ForeignKey('actors.id', ondelete='CASCADE'),
+              primary_key=True),
+    # the primary key serves lookups by movie, this one the filmographies
+    db.Index('ix_movie_cast_actor_id', 'actor_id'),
+)
+
+
 class Movies(db.Model):
     __tablename__ = 'movies'
+    # indexes backing the filters and sort orders of GET /movie, the
+    # trailing id makes them usable for keyset pagination
+    __table_args__ = (
+        db.Index('ix_movies_release_date_id', 'release_date', 'id'),
+        db.Index('ix_movies_title_id', 'title', 'id'),
+        # LIKE 'prefix%' on PostgreSQL needs the pattern operator class
+        db.Index('ix_movies_title_pattern', 'title',
+                 postgresql_ops={'title': 'varchar_pattern_ops'}),
+        # trigram index for the title search
+        db.Index('ix_movies_title_trgm', 'title', postgresql_using='gin',
+                 postgresql_ops={'title': 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String, nullable=False)
@@ -44,6 +154,13 @@ class Movies(db.Model):
         db.DateTime,
         nullable=False,
         default=datetime.utcnow)
+    # the database deletes the casting rows, so deleting a movie does not
+    # need to load its cast first
+    cast = db.relationship(
+        'Actors', secondary=movie_cast, order_by='Actors.id',
+        passive_deletes=True,
+        backref=db.backref(
+            'movies', order_by='Movies.id', passive_deletes=True))
 
     # define dunder repr method to help in db troubleshooting
     def __repr__(self):
@@ -68,18 +185,45 @@ class Movies(db.Model):
         db.session.delete(self)
         db.session.commit()
 
+    # delete a movie by id without loading it first, returns whether it
+    # existed
+    @classmethod
+    def delete_by_id(cls, movie_id):
+        return delete_by_id(cls, movie_id)
+
+    # update a movie by id in one statement, returns the updated row or
+    # None when it does not exist
+    @classmethod
+    def update_by_id(cls, movie_id, values):
+        return update_by_id(cls, movie_id, values)
+
     # format the returned value for a movie
     #  record
     def format(self):
+        return Movies.format_row(self)
+
+    # same, for a row returned by a query (anything with the column
+    # attributes)
+    @staticmethod
+    def format_row(row):
         return {
-            'id': self.id,
-            'title': self.title,
-            'release_date': self.release_date,
+            'id': row.id,
+            'title': row.title,
+            'release_date': row.release_date,
         }
 
 
 class Actors(db.Model):
     __tablename__ = 'actors'
+    # indexes backing the filters and sort orders of GET /actor
+    __table_args__ = (
+        db.Index('ix_actors_gender_age', 'gender', 'age'),
+        db.Index('ix_actors_age', 'age'),
+        db.Index('ix_actors_name_id', 'name', 'id'),
+        # trigram index for the name search
+        db.Index('ix_actors_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -110,10 +254,379 @@ class Actors(db.Model):
         db.session.delete(self)
         db.session.commit()
 
+    # delete an actor by id without loading it first, returns whether it
+    # existed
+    @classmethod
+    def delete_by_id(cls, actor_id):
+        return delete_by_id(cls, actor_id)
+
+    # update an actor by id in one statement, returns the updated row or
+    # None when it does not exist
+    @classmethod
+    def update_by_id(cls, actor_id, values):
+        return update_by_id(cls, actor_id, values)
+
     # format the returned value for an actor record
     def format(self):
+        return Actors.format_row(self)
+
+    # same, for a row returned by a query (anything with the column
+    # attributes)
+    @staticmethod
+    def format_row(row):
         return {
-            'id': self.id,
-            'name': self.name,
-            'age': self.age,
-            'gender': self.gender}
+            'id': row.id,
+            'name': row.name,
+            'age': row.age,
+            'gender': row.gender}
+
+
+'''
+TableVersion
+    one row per table, whose version is bumped by triggers on the table in
+    the statement that inserts, updates or deletes its rows (see
+    version_triggers() below), raw SQL included. Reading it is a primary
+    key lookup, which makes it a cheap ETag for the whole table that all
+    workers agree on.
+'''
+
+
+class TableVersion(db.Model):
+    __tablename__ = 'table_versions'
+
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<TableVersion name='{self.name}' version='{self.version}'>"
+
+
+'''
+version_triggers(table)
+    makes every INSERT, UPDATE and DELETE on `table` bump its version with
+    an upsert, so writes take no extra round trip and a table's first write
+    does not race to create its row. On PostgreSQL (10 or later) the
+    triggers run once per statement that changed rows, through its
+    transition table; SQLite only has triggers for each row. The version
+    row stays locked until the write commits, which the helpers of this
+    module do right after it.
+'''
+
+# PL/pgSQL resolves `changed` to the transition table of the trigger
+event.listen(
+    db.Model.metadata, 'before_create',
+    DDL("""
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM changed) THEN
+        INSERT INTO table_versions (name, version) VALUES (TG_TABLE_NAME, 1)
+        ON CONFLICT (name) DO UPDATE
+        SET version = table_versions.version + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql""").execute_if(dialect='postgresql'))
+
+
+def version_triggers(table):
+    for operation in ('INSERT', 'UPDATE', 'DELETE'):
+        name = f'{table.name}_{operation.lower()}_version'
+        # a trigger with a transition table handles a single event
+        transition = 'OLD' if operation == 'DELETE' else 'NEW'
+        event.listen(table, 'after_create', DDL(f"""
+CREATE TRIGGER {name} AFTER {operation} ON {table.name}
+REFERENCING {transition} TABLE AS changed
+FOR EACH STATEMENT EXECUTE PROCEDURE bump_table_version()""").execute_if(
+            dialect='postgresql'))
+        event.listen(table, 'after_create', DDL(f"""
+CREATE TRIGGER {name} AFTER {operation} ON {table.name}
+BEGIN
+    INSERT INTO table_versions (name, version) VALUES ('{table.name}', 1)
+    ON CONFLICT (name) DO UPDATE SET version = version + 1;
+END""").execute_if(dialect='sqlite'))
+
+
+version_triggers(Movies.__table__)
+version_triggers(Actors.__table__)
+
+
+def get_version(name):
+    version = db.session.query(TableVersion.version).filter(
+        TableVersion.name == name).scalar()
+    return version or 0
+
+
+'''
+add_cast(movie_id, actor_ids) / remove_cast(movie_id, actor_ids)
+    add actors to, or remove them from, the cast of a movie in one
+    transaction. add_cast returns the ids that were added and the ones of
+    actors that do not exist; actors already in the cast are left as they
+    are. remove_cast returns the ids that were removed.
+'''
+
+
+def add_cast(movie_id, actor_ids):
+    actors = Actors.__table__
+    try:
+        found = {row[0] for row in db.session.execute(
+            select([actors.c.id]).where(actors.c.id.in_(actor_ids)))}
+        cast = {row[0] for row in db.session.execute(
+            select([movie_cast.c.actor_id]).where(
+                movie_cast.c.movie_id == movie_id))}
+        added = sorted(found - cast)
+        if added:
+            db.session.execute(movie_cast.insert(), [
+                {'movie_id': movie_id, 'actor_id': actor_id}
+                for actor_id in added])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return added, sorted(set(actor_ids) - found)
+
+
+def remove_cast(movie_id, actor_ids):
+    try:
+        removed = sorted(row[0] for row in db.session.execute(
+            select([movie_cast.c.actor_id]).where(
+                (movie_cast.c.movie_id == movie_id) &
+                movie_cast.c.actor_id.in_(actor_ids))))
+        if removed:
+            db.session.execute(movie_cast.delete().where(
+                (movie_cast.c.movie_id == movie_id) &
+                movie_cast.c.actor_id.in_(removed)))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return removed
+
+
+# ----------------------------------------------------------------- #
+# Query helpers.
+# ----------------------------------------------------------------- #
+
+'''
+keyset_page(query, column, after, limit, sort, descending)
+    returns one page of rows that come after the `after` cursor, plus the
+    cursor of the next page or None when this is the last one. Rows are
+    ordered by `sort` (defaults to `column`, the primary key) with `column`
+    breaking ties, and the page starts right after the cursor, so it is
+    found with an index range scan instead of an OFFSET scan over the
+    skipped rows. When sorting by `column`, cursors are its values.
+    Otherwise they hold the (sort, id) of the last row of the previous
+    page, see encode_cursor(), so the page does not depend on that row
+    still being there unchanged; the rows must then carry `sort`.
+'''
+
+
+def keyset_page(query, column, after=None, limit=MAX_PAGE_SIZE, sort=None,
+                descending=False):
+    by_id = sort is None or sort is column
+    if by_id:
+        order = [column]
+        if after is not None:
+            query = query.filter(column < after if descending
+                                 else column > after)
+    else:
+        order = [sort, column]
+        if after is not None:
+            position = tuple_(sort, column)
+            query = query.filter(position < after if descending
+                                 else position > after)
+    if descending:
+        order = [item.desc() for item in order]
+
+    # fetch one extra row to know whether another page follows
+    rows = query.order_by(*order).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = getattr(rows[-1], column.key)
+        if not by_id:
+            next_cursor = encode_cursor(getattr(rows[-1], sort.key),
+                                        next_cursor)
+    return rows, next_cursor
+
+
+'''
+encode_cursor(value, row_id) / decode_cursor(cursor, sort)
+    the opaque cursor of a page sorted by another column than the id: the
+    sort value and id of the last row, as URL-safe base64 JSON. decode_cursor
+    converts the value back to the type of the `sort` column and raises a
+    ValueError when the cursor is not one of these.
+'''
+
+
+def encode_cursor(value, row_id):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    data = json.dumps([value, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(
+            cursor + '=' * (-len(cursor) % 4)))
+        if sort.type.python_type is datetime:
+            value = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'invalid cursor {cursor!r}')
+    if not isinstance(value, sort.type.python_type) or \
+            not isinstance(row_id, int):
+        raise ValueError(f'invalid cursor {cursor!r}')
+    return value, row_id
+
+
+def supports_returning():
+    # PostgreSQL can hand back rows from INSERT/UPDATE/DELETE ... RETURNING
+    return db.engine.dialect.implicit_returning
+
+
+'''
+bulk_insert(model, records, batch_size)
+    inserts a list of already validated column dicts in one transaction and
+    returns their new ids, in order. On PostgreSQL each batch is a single
+    multi-row INSERT ... RETURNING id. Elsewhere (SQLite) each batch is one
+    executemany, after which the ids are read back: SQLite gives every new
+    row the largest id + 1, and the transaction holds the write lock from
+    its first INSERT, so the batch's rows are the last len(batch) ids.
+'''
+
+
+def bulk_insert(model, records, batch_size=BULK_BATCH_SIZE):
+    table = model.__table__
+    ids = []
+    try:
+        for start in range(0, len(records), batch_size):
+            batch = records[start:start + batch_size]
+            if supports_returning():
+                result = db.session.execute(
+                    table.insert().values(batch).returning(table.c.id))
+                ids.extend(row[0] for row in result)
+            else:
+                db.session.execute(table.insert(), batch)
+                result = db.session.execute(
+                    select([table.c.id]).order_by(table.c.id.desc()).limit(
+                        len(batch)))
+                ids.extend(sorted(row[0] for row in result))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return ids
+
+
+'''
+bulk_update(model, ids, values) / bulk_delete(model, ids)
+    apply the same change to (or delete) every row whose id is in `ids`
+    with one set-based UPDATE/DELETE ... WHERE id IN (...) in a single
+    transaction, and return the ids that were actually found. PostgreSQL
+    reports them through RETURNING id; elsewhere they are selected first,
+    in the same transaction.
+'''
+
+
+def _execute_for_ids(model, statement, ids):
+    id_column = model.__table__.c.id
+    try:
+        if supports_returning():
+            result = db.session.execute(statement.returning(id_column))
+            found = [row[0] for row in result]
+        else:
+            result = db.session.execute(
+                select([id_column]).where(id_column.in_(ids)))
+            found = [row[0] for row in result]
+            db.session.execute(statement)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return sorted(found)
+
+
+def bulk_update(model, ids, values):
+    table = model.__table__
+    statement = table.update().where(table.c.id.in_(ids)).values(**values)
+    return _execute_for_ids(model, statement, ids)
+
+
+def bulk_delete(model, ids):
+    table = model.__table__
+    statement = table.delete().where(table.c.id.in_(ids))
+    return _execute_for_ids(model, statement, ids)
+
+
+'''
+session_instance(model, record_id)
+    the instance of that row held by the session, if any. The statements of
+    the helpers below go around the session, which would expire the
+    instance on commit and leave it unreadable once the request's session
+    is removed: delete_by_id detaches it first, as deleting it through the
+    session does, and update_by_id loads the updated row into it after the
+    commit.
+'''
+
+
+def session_instance(model, record_id):
+    return db.session.identity_map.get(identity_key(model, record_id))
+
+
+'''
+delete_by_id(model, record_id)
+    deletes one row with a single DELETE ... WHERE id = :id (RETURNING id
+    on PostgreSQL) and tells from the affected rows whether it existed, so
+    no SELECT is needed beforehand.
+'''
+
+
+def delete_by_id(model, record_id):
+    table = model.__table__
+    statement = table.delete().where(table.c.id == record_id)
+    try:
+        if supports_returning():
+            result = db.session.execute(statement.returning(table.c.id))
+            found = len(result.fetchall()) > 0
+        else:
+            found = db.session.execute(statement).rowcount > 0
+        instance = session_instance(model, record_id)
+        if found and instance is not None:
+            db.session.expunge(instance)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return found
+
+
+'''
+update_by_id(model, record_id, values)
+    updates one row with a single UPDATE ... WHERE id = :id RETURNING * and
+    returns the updated row (None if there is no such id), so the handler
+    neither loads the row first nor reloads it after the commit. Databases
+    without RETURNING read the row back in the same transaction.
+'''
+
+
+def update_by_id(model, record_id, values):
+    table = model.__table__
+    statement = table.update().where(table.c.id == record_id).values(
+        **values)
+    try:
+        if supports_returning():
+            row = db.session.execute(statement.returning(*table.c)).first()
+        else:
+            db.session.execute(statement)
+            row = db.session.execute(
+                select([table]).where(table.c.id == record_id)).first()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    instance = session_instance(model, record_id)
+    if row is not None and instance is not None:
+        for column in table.c:
+            set_committed_value(instance, column.key, row[column])
+    return row
@@ -0,0 +1,117 @@
+import re
+import threading
+from flask import current_app
+from sqlalchemy import func, or_
+from models import db, get_version
+
+
+# ----------------------------------------------------------------- #
+# Search.
+# ----------------------------------------------------------------- #
+
+'''
+search(model, column, text, limit, offset)
+    ranked search of `text` in `column` (Movies.title, Actors.name).
+    Returns up to `limit` results after skipping `offset`, best first, as
+    (id, value, score) tuples, and whether more results follow.
+
+    On PostgreSQL this is a pg_trgm query (fuzzy match or substring),
+    served by the GIN trigram indexes and ranked by similarity. Other
+    databases (SQLite for offline tests) fall back to an in-memory inverted
+    index of the column's words.
+'''
+
+
+def search(model, column, text, limit, offset=0):
+    if db.engine.dialect.name == 'postgresql':
+        results = trigram_search(model, column, text, limit + 1, offset)
+    else:
+        results = inverted_index(model, column).search(
+            text, limit + 1, offset)
+    return results[:limit], len(results) > limit
+
+
+def escape_like(text):
+    return text.replace('/', '//').replace('%', '/%').replace('_', '/_')
+
+
+def trigram_search(model, column, text, limit, offset):
+    # pg_trgm's similarity operator is '%', which drivers using the format
+    # paramstyle (psycopg2) expect doubled
+    operator = '%%' if db.engine.dialect.paramstyle in (
+        'format', 'pyformat') else '%'
+    score = func.similarity(column, text).label('score')
+    rows = db.session.query(model.id, column, score).filter(or_(
+        column.op(operator)(text),
+        column.ilike('%' + escape_like(text) + '%', escape='/')
+    )).order_by(score.desc(), model.id).offset(offset).limit(limit).all()
+    return [(row[0], row[1], float(row[2])) for row in rows]
+
+
+# ----------------------------------------------------------------- #
+# In-memory fallback.
+# ----------------------------------------------------------------- #
+
+'''
+InvertedIndex
+    maps every lower-cased word of a column to the ids of the rows that
+    contain it. A query word matches a word it is equal to (worth 1) or a
+    prefix of (worth 0.5); a row's score is the average over the query
+    words of its best match, so rows matching more of the query rank
+    higher.
+'''
+
+
+def tokenize(text):
+    return re.findall(r'\w+', (text or '').lower())
+
+
+class InvertedIndex:
+    def __init__(self, rows):
+        self.values = {}
+        self.postings = {}
+        for row_id, value in rows:
+            self.values[row_id] = value
+            for word in set(tokenize(value)):
+                self.postings.setdefault(word, set()).add(row_id)
+
+    def search(self, text, limit, offset=0):
+        words = tokenize(text)
+        if not words:
+            return []
+
+        scores = {}
+        for query_word in words:
+            best = {}
+            for word, row_ids in self.postings.items():
+                if word == query_word:
+                    weight = 1.0
+                elif word.startswith(query_word):
+                    weight = 0.5
+                else:
+                    continue
+                for row_id in row_ids:
+                    best[row_id] = max(best.get(row_id, 0), weight)
+            for row_id, weight in best.items():
+                scores[row_id] = scores.get(row_id, 0) + weight / len(words)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(row_id, self.values[row_id], score)
+                for row_id, score in ranked[offset:offset + limit]]
+
+
+_indexes_lock = threading.Lock()
+
+
+def inverted_index(model, column):
+    # one index per table and app, rebuilt when the table version changes
+    indexes = current_app.extensions.setdefault('search_indexes', {})
+    name = model.__tablename__
+    version = get_version(name)
+    with _indexes_lock:
+        cached = indexes.get(name)
+        if cached is None or cached[0] != version:
+            rows = db.session.query(model.id, column).all()
+            cached = (version, InvertedIndex(rows))
+            indexes[name] = cached
+    return cached[1]
@@ -2,13 +2,15 @@
 # Imports
 # ---------------------------------------------------------
 
+import gzip
 import json
 import os
 import unittest
 # from flask import url_for
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from app import create_app
-from models import setup_db, Actors, Movies
+from models import setup_db, db, Actors, Movies
 
 
 # ---------------------------------------------------------
@@ -71,6 +73,72 @@ class AgencyTestCase(unittest.TestCase):
         """Executed after reach test"""
         pass
 
+    def count_statements(self, request):
+        """Run request() and return the SQL statements it executed"""
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            res = request()
+        finally:
+            event.remove(
+                db.engine, 'before_cursor_execute', before_cursor_execute)
+        return res, statements
+
+    def test_get_pool_stats(self):
+        res = self.client().get('/pool-stats', headers=exec_producer_auth)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertIn('checkedout', data['pool_stats'])
+
+    def test_401_get_pool_stats_without_token(self):
+        res = self.client().get('/pool-stats')
+
+        self.assertEqual(res.status_code, 401)
+
+    def test_get_timings(self):
+        res = self.client().get('/timings', headers=exec_producer_auth)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertIn('histograms', data)
+
+    def test_401_get_timings_without_token(self):
+        res = self.client().get('/timings')
+
+        self.assertEqual(res.status_code, 401)
+
+    def test_preflight_is_answered_without_auth(self):
+        res = self.client().open('/movie/1', method='OPTIONS', headers={
+            'Origin': 'http://localhost:3000',
+            'Access-Control-Request-Method': 'PATCH'})
+
+        self.assertEqual(res.status_code, 204)
+        self.assertIn('Access-Control-Max-Age', res.headers)
+        self.assertEqual(res.headers['Access-Control-Allow-Origin'], '*')
+
+    def test_get_metrics(self):
+        self.client().get('/movie')
+        res = self.client().get('/metrics', headers=exec_producer_auth)
+        text = res.data.decode()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('http_errors_total{status="401"} 1', text)
+        self.assertIn('http_request_duration_seconds_count{route="/movie",'
+                      'permission="get:movie"} 1', text)
+        self.assertIn('db_pool_connections{state="checkedout"}', text)
+
+    def test_401_get_metrics_without_token(self):
+        res = self.client().get('/metrics')
+
+        self.assertEqual(res.status_code, 401)
+
     # *************************************************
     # Movies Tests
     # *************************************************
@@ -99,10 +167,261 @@ class AgencyTestCase(unittest.TestCase):
         movies = Movies.query.all()
         self.assertEqual(len(data['movies']), len(movies))
 
+    def test_get_movies_paginated_by_cursor(self):
+        for i in range(3):
+            Movies(
+                title=f"test_get_movies_paginated_{i}",
+                release_date="2021-03-01T21:30:00.000Z").insert()
+
+        res = self.client().get(
+            f"/movie?limit=2",
+            content_type=assistant_auth['Content-Type'],
+            headers=assistant_auth)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['movies']), 2)
+        self.assertIsNotNone(data['next_cursor'])
+
+        res = self.client().get(
+            f"/movie?limit=2&after={data['next_cursor']}",
+            content_type=assistant_auth['Content-Type'],
+            headers=assistant_auth)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['movies']), 1)
+        self.assertIsNone(data['next_cursor'])
+
+    def test_get_movies_filtered_and_sorted(self):
+        for title, release_date in (
+                ("test_filter_b", "2031-01-10T00:00:00.000Z"),
+                ("test_filter_a", "2031-01-20T00:00:00.000Z"),
+                ("test_filter_c", "2031-03-01T00:00:00.000Z")):
+            Movies(title=title, release_date=release_date).insert()
+
+        res = self.client().get(
+            f"/movie?title_prefix=test_filter_&released_after=2031-01-01"
+            f"&released_before=2031-02-01&sort=-title",
+            headers=assistant_auth)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [movie['title'] for movie in data['movies']],
+            ["test_filter_b", "test_filter_a"])
+
+    def test_get_movies_sorted_by_title_across_pages(self):
+        for title in ("test_sort_c", "test_sort_a", "test_sort_b"):
+            Movies(
+                title=title, release_date="2021-03-01T21:30:00.000Z").insert()
+
+        titles = []
+        url = f"/movie?title_prefix=test_sort_&sort=title&limit=2"
+        while url:
+            data = json.loads(
+                self.client().get(url, headers=assistant_auth).data)
+            titles.extend(movie['title'] for movie in data['movies'])
+            url = (f"/movie?title_prefix=test_sort_&sort=title&limit=2"
+                   f"&after={data['next_cursor']}"
+                   if data['next_cursor'] else None)
+
+        self.assertEqual(titles, ["test_sort_a", "test_sort_b", "test_sort_c"])
+
+    def test_get_movies_with_selected_fields(self):
+        Movies(title="test_fields",
+               release_date="2021-03-01T21:30:00.000Z").insert()
+
+        res = self.client().get(
+            f"/movie?title_prefix=test_fields&fields=release_date",
+            headers=assistant_auth)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(list(data['movies'][0]), ['id', 'release_date'])
+
+    def test_get_movies_compressed(self):
+        for i in range(100):
+            Movies(title=f"test_get_movies_compressed_{i}",
+                   release_date="2021-03-01T21:30:00.000Z").insert()
+
+        res = self.client().get(
+            f"/movie", headers=dict(assistant_auth, **{
+                'Accept-Encoding': 'gzip'}))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        data = json.loads(gzip.decompress(res.data))
+        self.assertEqual(len(data['movies']), 100)
+
+    def test_400_get_movies_unknown_field(self):
+        res = self.client().get(f"/movie?fields=budget",
+                                headers=assistant_auth)
+        self.assertEqual(res.status_code, 400)
+
+    def test_400_get_movies_invalid_sort(self):
+        res = self.client().get(f"/movie?sort=budget", headers=assistant_auth)
+        self.assertEqual(res.status_code, 400)
+
+    def test_400_get_movies_invalid_limit(self):
+        res = self.client().get(
+            f"/movie?limit=abc",
+            content_type=assistant_auth['Content-Type'],
+            headers=assistant_auth)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(data['success'])
+
+    def test_search_movies_ranked_and_paginated(self):
+        for title in ("Searchable Kombat", "Searchable Engines",
+                      "Unrelated"):
+            Movies(
+                title=title, release_date="2021-03-01T21:30:00.000Z").insert()
+
+        res = self.client().get(
+            f"/movie/search?q=searchable kombat&limit=1",
+            headers=assistant_auth)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['movies'][0]['title'], "Searchable Kombat")
+        self.assertEqual(data['next_page'], 2)
+
+        res = self.client().get(
+            f"/movie/search?q=searchable kombat&limit=1&page=2",
+            headers=assistant_auth)
+        data = json.loads(res.data)
+        self.assertEqual(data['movies'][0]['title'], "Searchable Engines")
+
+    def test_400_search_movies_without_query(self):
+        res = self.client().get(f"/movie/search?q=", headers=assistant_auth)
+        self.assertEqual(res.status_code, 400)
+
+    def test_export_movies_as_ndjson(self):
+        for i in range(3):
+            Movies(
+                title=f"test_export_movies_{i}",
+                release_date="2021-03-01T21:30:00.000Z").insert()
+
+        res = self.client().get(
+            f"/movie/export?format=ndjson",
+            content_type=assistant_auth['Content-Type'],
+            headers=assistant_auth)
+        lines = res.data.decode().splitlines()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(lines), Movies.query.count())
+        self.assertIn('title', json.loads(lines[0]))
+
+    def test_export_movies_as_json(self):
+        Movies(
+            title="test_export_movies_as_json",
+            release_date="2021-03-01T21:30:00.000Z").insert()
+
+        res = self.client().get(
+            f"/movie/export",
+            content_type=assistant_auth['Content-Type'],
+            headers=assistant_auth)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(len(data['movies']), Movies.query.count())
+
+    def test_get_movies_is_cached_until_a_movie_is_added(self):
+        Movies(
+            title="test_get_movies_is_cached",
+            release_date="2021-03-01T21:30:00.000Z").insert()
+
+        res = self.client().get(f"/movie", headers=assistant_auth)
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        res = self.client().get(f"/movie", headers=assistant_auth)
+        self.assertEqual(res.headers['X-Cache'], 'HIT')
+
+        self.client().post(
+            f"/add-movie",
+            data=json.dumps({
+                "title": "test_get_movies_is_cached_new_movie",
+                "release_date": "2021-03-01T21:30:00.000Z"
+            }),
+            content_type=exec_producer_auth['Content-Type'],
+            headers=exec_producer_auth)
+
+        res = self.client().get(f"/movie", headers=assistant_auth)
+        data = json.loads(res.data)
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertIn(
+            "test_get_movies_is_cached_new_movie", data['movies'].values())
+
+    def test_304_get_movies_not_modified(self):
+        Movies(
+            title="test_304_get_movies_not_modified",
+            release_date="2021-03-01T21:30:00.000Z").insert()
+
+        res = self.client().get(f"/movie", headers=assistant_auth)
+        etag = res.headers['ETag']
+        self.assertEqual(res.status_code, 200)
+
+        res, statements = self.count_statements(
+            lambda: self.client().get(
+                f"/movie",
+                headers=dict(assistant_auth, **{'If-None-Match': etag})))
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+        # only the table version is read
+        self.assertEqual(len(statements), 1)
+        self.assertIn('table_versions', statements[0])
+
+        # any write changes the ETag
+        Movies(
+            title="test_304_get_movies_not_modified_2",
+            release_date="2021-03-01T21:30:00.000Z").insert()
+        res = self.client().get(
+            f"/movie",
+            headers=dict(assistant_auth, **{'If-None-Match': etag}))
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
     def test_get_movies_method_dont_accept_post_request(self):
         res = self.client().post('/movie')
         self.assertEqual(res.status_code, 405)
 
+    def test_get_single_movie_cached_until_patched(self):
+        movie = Movies(
+            title="test_get_single_movie",
+            release_date="2021-03-01T21:30:00.000Z")
+        movie.insert()
+        movie_id = movie.id
+
+        res = self.client().get(f"/movie/{movie_id}", headers=assistant_auth)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertEqual(data['movie']['title'], "test_get_single_movie")
+
+        res = self.client().get(f"/movie/{movie_id}", headers=assistant_auth)
+        self.assertEqual(res.headers['X-Cache'], 'HIT')
+
+        self.client().patch(
+            f"/movie/{movie_id}",
+            data=json.dumps({'title': "test_get_single_movie_patched"}),
+            content_type=exec_producer_auth['Content-Type'],
+            headers=exec_producer_auth)
+
+        res = self.client().get(f"/movie/{movie_id}", headers=assistant_auth)
+        data = json.loads(res.data)
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertEqual(
+            data['movie']['title'], "test_get_single_movie_patched")
+
+    def test_404_get_nonexisting_movie(self):
+        res = self.client().get(f"/movie/100000", headers=assistant_auth)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertFalse(data['success'])
+
     # ********************
     # Post movies
     # ********************
@@ -142,6 +461,57 @@ class AgencyTestCase(unittest.TestCase):
         self.assertEqual(data['error'], 422)
         self.assertFalse(data['success'])
 
+    def test_successful_bulk_create_movies(self):
+        new_movies = [
+            {
+                "title": f"test_successful_bulk_create_movies_{i}",
+                "release_date": "2021-03-01T21:30:00.000Z"
+            } for i in range(5)]
+
+        res, statements = self.count_statements(
+            lambda: self.client().post(
+                f"/add-movies?batch_size=2",
+                data=json.dumps(new_movies),
+                content_type=exec_producer_auth['Content-Type'],
+                headers=exec_producer_auth))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(len(data['ids']), 5)
+        # one INSERT per batch, not per movie, and nothing else
+        self.assertEqual(len(statements), 3)
+        for statement in statements:
+            self.assertTrue(statement.startswith('INSERT INTO movies'))
+        for movie_id, movie in zip(data['ids'], new_movies):
+            self.assertEqual(Movies.query.get(movie_id).title, movie['title'])
+
+    def test_422_bulk_create_movies_reports_invalid_items(self):
+        new_movies = [
+            {
+                "title": "test_422_bulk_create_movies_valid",
+                "release_date": "2021-03-01T21:30:00.000Z"
+            },
+            {"title": "test_422_bulk_create_movies_missing_date"},
+            {"title": "test_422_bulk_create_movies_bad_date",
+             "release_date": "not a date"}
+        ]
+
+        res = self.client().post(
+            f"/add-movies",
+            data=json.dumps(new_movies),
+            content_type=exec_producer_auth['Content-Type'],
+            headers=exec_producer_auth)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertFalse(data['success'])
+        self.assertEqual(
+            [error['index'] for error in data['errors']], [1, 2])
+        # nothing is written when any item is invalid
+        self.assertEqual(Movies.query.filter(
+            Movies.title == new_movies[0]['title']).count(), 0)
+
     # ********************
     # PATCH movies
     # ********************
@@ -170,12 +540,34 @@ class AgencyTestCase(unittest.TestCase):
         self.assertEqual(data['movie']['title'], movie.title)
         self.assertEqual(
             data['movie']['release_date'],
-            "Mon, 01 Mar 2060 21:30:00 GMT")
+            "2060-03-01T21:30:00")
 
         updated_movie = Movies.query.filter(
             Movies.id == data['movie']['id']).one_or_none()
         self.assertEqual(updated_movie.id, movie.id)
 
+    def test_update_movie_runs_a_single_statement(self):
+        movie = Movies(
+            title="test_update_movie_runs_a_single_statement",
+            release_date="2024-03-01T21:30:00.000Z")
+        movie.insert()
+        movie_id = movie.id
+
+        res, statements = self.count_statements(
+            lambda: self.client().patch(
+                f"/movie/{movie_id}",
+                data=json.dumps({'title': "Patched in one statement"}),
+                content_type=exec_producer_auth['Content-Type'],
+                headers=exec_producer_auth))
+        data = json.loads(res.data)
+
+        # the table version used for ETags is bumped by a trigger, within
+        # the same statement
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['movie']['title'], "Patched in one statement")
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith('UPDATE movies'))
+
     # fail to update non existing movie
     def test_404_update_nonexisting_movie(self):
         movie_patch = {
@@ -196,6 +588,34 @@ class AgencyTestCase(unittest.TestCase):
         self.assertEqual(data['error'], 404)
         self.assertFalse(data['success'])
 
+    def test_successful_bulk_update_movies(self):
+        movies = [
+            Movies(
+                title=f"test_successful_bulk_update_movies_{i}",
+                release_date="2024-03-01T21:30:00.000Z")
+            for i in range(2)]
+        for movie in movies:
+            movie.insert()
+        ids = [movie.id for movie in movies]
+
+        res = self.client().patch(
+            f"/movies",
+            data=json.dumps({
+                'ids': ids + [100000],
+                'changes': {'title': "Bulk updated title"}
+            }),
+            content_type=exec_producer_auth['Content-Type'],
+            headers=exec_producer_auth)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['updated'], sorted(ids))
+        self.assertEqual(data['missing'], [100000])
+        for movie_id in ids:
+            self.assertEqual(
+                Movies.query.get(movie_id).title, "Bulk updated title")
+
     # ********************
     # DELETE movies
     # ********************
@@ -217,6 +637,25 @@ class AgencyTestCase(unittest.TestCase):
         self.assertTrue(data['success'])
         self.assertEqual(data['movie_id'], movie.id)
 
+    def test_delete_movie_runs_a_single_statement(self):
+        movie = Movies(
+            title="Movie to delete in one statement",
+            release_date="2025-03-01T21:30:00.000Z")
+        movie.insert()
+        movie_id = movie.id
+
+        res, statements = self.count_statements(
+            lambda: self.client().delete(
+                f"/movie/{movie_id}",
+                content_type=exec_producer_auth['Content-Type'],
+                headers=exec_producer_auth))
+
+        # no SELECT before the DELETE, and the table version is bumped by a
+        # trigger within it
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith('DELETE'))
+
     def test_404_delete_nonexisting_movie(self):
         # res = self.client().delete('/movie/10000')
         res = self.client().delete(
@@ -229,6 +668,116 @@ class AgencyTestCase(unittest.TestCase):
         self.assertEqual(data['error'], 404)
         self.assertFalse(data['success'])
 
+    def test_successful_bulk_delete_movies(self):
+        movies = [
+            Movies(title="Movie to bulk delete",
+                   release_date="2025-03-01T21:30:00.000Z")
+            for i in range(3)]
+        for movie in movies:
+            movie.insert()
+        ids = [movie.id for movie in movies]
+
+        res = self.client().delete(
+            f"/movies",
+            data=json.dumps({'ids': ids + [100000]}),
+            content_type=exec_producer_auth['Content-Type'],
+            headers=exec_producer_auth)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['deleted'], sorted(ids))
+        self.assertEqual(data['missing'], [100000])
+        self.assertEqual(
+            Movies.query.filter(Movies.id.in_(ids)).count(), 0)
+
+    def test_400_bulk_delete_movies_without_ids(self):
+        res = self.client().delete(
+            f"/movies",
+            data=json.dumps({'ids': []}),
+            content_type=exec_producer_auth['Content-Type'],
+            headers=exec_producer_auth)
+
+        self.assertEqual(res.status_code, 400)
+
+    # *************************************************
+    # Casting Tests
+    # *************************************************
+
+    def create_cast_movies(self, count):
+        """Insert `count` movies with two actors each"""
+        for i in range(count):
+            movie = Movies(
+                title=f"test_cast_movie_{i}",
+                release_date="2021-03-01T21:30:00.000Z")
+            movie.insert()
+            actors = [Actors(name=f"Cast {i}/{j}", age=30, gender="female")
+                      for j in range(2)]
+            for actor in actors:
+                actor.insert()
+            self.client().post(
+                f"/movie/{movie.id}/cast",
+                data=json.dumps({'actor_ids': [a.id for a in actors]}),
+                content_type=exec_producer_auth['Content-Type'],
+                headers=exec_producer_auth)
+
+    def test_movie_cast_and_actor_filmography(self):
+        movie = Movies(
+            title="test_movie_cast", release_date="2021-03-01T21:30:00.000Z")
+        movie.insert()
+        actor = Actors(name="Cast member", age=40, gender="male")
+        actor.insert()
+        movie_id, actor_id = movie.id, actor.id
+
+        res = self.client().post(
+            f"/movie/{movie_id}/cast",
+            data=json.dumps({'actor_ids': [actor_id, 100000]}),
+            content_type=exec_producer_auth['Content-Type'],
+            headers=exec_producer_auth)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['added'], [actor_id])
+        self.assertEqual(data['missing'], [100000])
+
+        data = json.loads(self.client().get(
+            f"/movie/{movie_id}/cast", headers=assistant_auth).data)
+        self.assertEqual([a['name'] for a in data['cast']], ["Cast member"])
+
+        data = json.loads(self.client().get(
+            f"/actor/{actor_id}/movies", headers=assistant_auth).data)
+        self.assertEqual(
+            [m['title'] for m in data['movies']], ["test_movie_cast"])
+
+        # deleting the movie removes it from the filmography
+        self.client().delete(f"/movie/{movie_id}", headers=exec_producer_auth)
+        data = json.loads(self.client().get(
+            f"/actor/{actor_id}/movies", headers=assistant_auth).data)
+        self.assertEqual(data['movies'], [])
+
+    def test_casting_query_count_does_not_grow_with_movies(self):
+        self.create_cast_movies(2)
+        res, few = self.count_statements(
+            lambda: self.client().get("/casting", headers=assistant_auth))
+        self.assertEqual(res.status_code, 200)
+
+        self.create_cast_movies(8)
+        res, many = self.count_statements(
+            lambda: self.client().get("/casting", headers=assistant_auth))
+        data = json.loads(res.data)
+
+        self.assertEqual(len(data['movies']), 10)
+        self.assertTrue(all(len(m['cast']) == 2 for m in data['movies']))
+        # one query for the movies and one for all of their casts
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(len(many), 2)
+
+    def test_assistant_fail_to_change_cast(self):
+        res = self.client().post(
+            f"/movie/1/cast",
+            data=json.dumps({'actor_ids': [1]}),
+            content_type=assistant_auth['Content-Type'],
+            headers=assistant_auth)
+        self.assertEqual(res.status_code, 403)
+
     # *************************************************
     # Actors Tests
     # *************************************************
@@ -255,6 +804,32 @@ class AgencyTestCase(unittest.TestCase):
         actors = Actors.query.all()
         self.assertEqual(len(data['actors']), len(actors))
 
+    def test_get_actors_filtered_by_gender_and_age(self):
+        Actors(name="Filter actor 1", age=25, gender="nonbinary").insert()
+        Actors(name="Filter actor 2", age=35, gender="nonbinary").insert()
+        Actors(name="Filter actor 3", age=45, gender="nonbinary").insert()
+
+        res = self.client().get(
+            f"/actor?gender=nonbinary&min_age=30&max_age=50&sort=-name",
+            headers=assistant_auth)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [actor['name'] for actor in data['actors']],
+            ["Filter actor 3", "Filter actor 2"])
+
+    def test_get_actors_with_selected_fields(self):
+        Actors(name="Fields actor", age=25, gender="nonbinary").insert()
+
+        res = self.client().get(
+            f"/actor?gender=nonbinary&fields=name,age", headers=assistant_auth)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['actors'][0]['name'], "Fields actor")
+        self.assertEqual(list(data['actors'][0]), ['id', 'name', 'age'])
+
     def test_get_actors_doesnt_accept_post_request(self):
         # res = self.client().post('/actor')
         res = self.client().post(
@@ -263,6 +838,24 @@ class AgencyTestCase(unittest.TestCase):
             headers=exec_producer_auth)
         self.assertEqual(res.status_code, 405)
 
+    def test_get_single_actor_forgotten_after_delete(self):
+        actor = Actors(name="Single actor", age=30, gender="male")
+        actor.insert()
+        actor_id = actor.id
+
+        res = self.client().get(f"/actor/{actor_id}", headers=assistant_auth)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['actor']['name'], "Single actor")
+
+        self.client().delete(
+            f"/actor/{actor_id}",
+            content_type=exec_producer_auth['Content-Type'],
+            headers=exec_producer_auth)
+
+        res = self.client().get(f"/actor/{actor_id}", headers=assistant_auth)
+        self.assertEqual(res.status_code, 404)
+
     # ********************
     # POST Actors
     # ********************
@@ -308,6 +901,32 @@ class AgencyTestCase(unittest.TestCase):
         self.assertEqual(data['error'], 422)
         self.assertFalse(data['success'])
 
+    def test_successful_bulk_create_actors(self):
+        new_actors = [
+            {'name': f"Bulk actor {i}", 'age': 20 + i, 'gender': "female"}
+            for i in range(3)]
+
+        res = self.client().post(
+            f"/add-actors",
+            data=json.dumps(new_actors),
+            content_type=exec_producer_auth['Content-Type'],
+            headers=exec_producer_auth)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(len(data['ids']), 3)
+        self.assertEqual(Actors.query.get(data['ids'][2]).age, 22)
+
+    def test_assistant_fail_to_bulk_create_actors(self):
+        res = self.client().post(
+            f"/add-actors",
+            data=json.dumps([{'name': "Actor", 'age': 1, 'gender': "male"}]),
+            content_type=assistant_auth['Content-Type'],
+            headers=assistant_auth)
+
+        self.assertEqual(res.status_code, 403)
+
     # ********************
     # PATCH Actors
     # ********************
@@ -355,6 +974,21 @@ class AgencyTestCase(unittest.TestCase):
         self.assertEqual(data['error'], 404)
         self.assertFalse(data['success'])
 
+    def test_422_bulk_update_actors_invalid_changes(self):
+        actor = Actors(name="Actor to bulk patch", age=40, gender="female")
+        actor.insert()
+
+        res = self.client().patch(
+            f"/actors",
+            data=json.dumps({'ids': [actor.id], 'changes': {'age': "old"}}),
+            content_type=exec_producer_auth['Content-Type'],
+            headers=exec_producer_auth)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertFalse(data['success'])
+        self.assertEqual(Actors.query.get(actor.id).age, 40)
+
     # ********************
     # DELETE Actors
     # ********************
@@ -0,0 +1,350 @@
+# ---------------------------------------------------------
+# Imports
+# ---------------------------------------------------------
+
+import asyncio
+import gzip
+import http.client
+import json
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import event
+
+from test_auth import CountingJWKSCache, LocalAppMixin
+
+import auth
+from asgi import AsyncApp, SQLiteDatabase, aiosqlite
+from local_auth import make_token
+from models import db, Actors, Movies
+
+try:
+    import uvicorn
+except ImportError:
+    uvicorn = None
+
+ALL_PERMISSIONS = ['get:movie', 'get:actor', 'post:add-movie',
+                   'post:add-actor', 'patch:movie', 'patch:actor',
+                   'delete:movie', 'delete:actor']
+
+
+# ---------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------
+
+class ASGITestMixin(LocalAppMixin):
+    """Creates a Flask app and its AsyncApp on a seeded SQLite database,
+    both behind a local JWKS"""
+
+    jwks_cache_class = CountingJWKSCache
+    permissions = ALL_PERMISSIONS
+    movie_count = 5
+
+    def seed(self):
+        for i in range(self.movie_count):
+            db.session.add(Movies(
+                title=f"Movie {i}", release_date=datetime(2021, 3, 1)))
+            db.session.add(Actors(name=f"Actor {i}", age=30,
+                                  gender="female"))
+
+    def setUp(self):
+        super().setUp()
+        self.asgi_app = AsyncApp(self.app,
+                                 SQLiteDatabase(self.database_path))
+
+    def tearDown(self):
+        if self.asgi_app._connected:
+            asyncio.run(self.asgi_app.database.close())
+        self.asgi_app.executor.shutdown()
+        super().tearDown()
+
+
+async def asgi_request(app, method, path, headers=None, body=b''):
+    """Send one request to an ASGI app, return (status, headers, body)"""
+    path, _, query_string = path.partition('?')
+    scope = {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'root_path': '',
+        'query_string': query_string.encode(),
+        'headers': [(name.lower().encode(), value.encode())
+                    for name, value in (headers or {}).items()],
+        'server': ('testserver', 80),
+        'client': ('127.0.0.1', 12345),
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    start = sent[0]
+    response_headers = {name.decode(): value.decode()
+                        for name, value in start['headers']}
+    return start['status'], response_headers, b''.join(
+        message.get('body', b'') for message in sent[1:])
+
+
+# ---------------------------------------------------------
+# Tests
+# ---------------------------------------------------------
+
+
+@unittest.skipIf(aiosqlite is None, 'aiosqlite is not installed')
+class AsyncAppTestCase(ASGITestMixin, unittest.TestCase):
+    """This class represents the ASGI entry point test cases"""
+
+    def request(self, method, path, headers=None, body=b''):
+        return asyncio.run(self.requests([(method, path, headers, body)]))[0]
+
+    async def requests(self, requests):
+        return [await asgi_request(self.asgi_app, *request)
+                for request in requests]
+
+    def count_wsgi_calls(self):
+        calls = []
+        call_wsgi = self.asgi_app.call_wsgi
+
+        async def counting_call_wsgi(*args):
+            calls.append(args[0]['path'])
+            return await call_wsgi(*args)
+
+        self.asgi_app.call_wsgi = counting_call_wsgi
+        return calls
+
+    def test_list_is_served_async_like_the_flask_app(self):
+        wsgi_calls = self.count_wsgi_calls()
+        status, headers, body = self.request(
+            'GET', '/movie?limit=2&after=1', self.headers)
+        expected = self.app.test_client().get(
+            '/movie?limit=2&after=1', headers=self.headers)
+
+        self.assertEqual(wsgi_calls, [])
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), expected.get_json())
+        self.assertEqual(headers['etag'], expected.headers['ETag'])
+        # never kept in the response cache, see AsyncApp
+        self.assertEqual(headers['x-cache'], 'MISS')
+        self.assertIn('access-control-allow-methods', headers)
+
+    def test_list_answers_304_for_current_etag(self):
+        _, headers, _ = self.request('GET', '/actor', self.headers)
+        status, _, body = self.request('GET', '/actor', dict(
+            self.headers, **{'If-None-Match': headers['etag']}))
+        self.assertEqual(status, 304)
+        self.assertEqual(body, b'')
+
+    def test_single_record_uses_the_shared_record_cache(self):
+        results = asyncio.run(self.requests([
+            ('GET', '/movie/1', self.headers),
+            ('GET', '/movie/1', self.headers)]))
+        expected = self.app.test_client().get(
+            '/movie/1', headers=self.headers).get_json()
+
+        self.assertEqual([r[1]['x-cache'] for r in results], ['MISS', 'HIT'])
+        self.assertEqual(json.loads(results[0][2]), expected)
+
+        status, _, _ = self.request('GET', '/actor/999', self.headers)
+        self.assertEqual(status, 404)
+
+    def test_other_requests_are_passed_to_the_flask_app(self):
+        wsgi_calls = self.count_wsgi_calls()
+        body = json.dumps({'title': 'Patched'})
+        results = asyncio.run(self.requests([
+            ('GET', '/movie?sort=-title', self.headers),
+            ('GET', '/movie?limit=abc', self.headers),
+            ('PATCH', '/movie/1',
+             dict(self.headers, **{'Content-Type': 'application/json'}),
+             body.encode()),
+            ('GET', '/movie/export?format=ndjson', self.headers)]))
+
+        self.assertEqual(wsgi_calls, ['/movie', '/movie', '/movie/1',
+                                      '/movie/export'])
+        self.assertEqual([result[0] for result in results],
+                         [200, 400, 200, 200])
+        self.assertEqual(json.loads(results[0][2])['movies'][0]['title'],
+                         'Movie 4')
+        self.assertEqual(len(results[3][2].splitlines()), self.movie_count)
+
+    def test_auth_errors_match_the_flask_app(self):
+        status, _, body = self.request('GET', '/movie')
+        expected = self.app.test_client().get('/movie')
+        self.assertEqual(status, 401)
+        self.assertEqual(json.loads(body), expected.get_json())
+
+        token = make_token(self.pem, 'key-1', ['get:actor'])
+        status, _, _ = self.request(
+            'GET', '/movie', {'Authorization': 'Bearer ' + token})
+        self.assertEqual(status, 403)
+
+    def test_preflight_is_answered_without_the_flask_app(self):
+        wsgi_calls = self.count_wsgi_calls()
+        status, headers, body = self.request('OPTIONS', '/movie/1', {
+            'Origin': 'http://localhost:3000',
+            'Access-Control-Request-Method': 'PATCH'})
+
+        self.assertEqual(wsgi_calls, [])
+        self.assertEqual(status, 204)
+        self.assertEqual(body, b'')
+        self.assertIn('access-control-max-age', headers)
+
+    def test_async_responses_are_compressed(self):
+        self.asgi_app.compression_min_size = 0
+        status, headers, body = self.request(
+            'GET', '/movie', dict(self.headers, **{'Accept-Encoding': 'gzip'}))
+        expected = self.app.test_client().get('/movie', headers=self.headers)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['content-encoding'], 'gzip')
+        self.assertEqual(headers['vary'], 'Accept-Encoding')
+        self.assertEqual(json.loads(gzip.decompress(body)),
+                         expected.get_json())
+
+    def test_async_requests_are_counted_in_the_metrics(self):
+        self.request('GET', '/movie/1', self.headers)
+        self.request('GET', '/movie/999', self.headers)
+        counters = self.app.extensions['metrics'].snapshot()['counters']
+        requests = counters['http_requests_total']
+
+        route = 'route="/movie/<int:movie_id>"'
+        self.assertEqual(requests[f'method="GET",{route},status="200"'], 1)
+        self.assertEqual(requests[f'method="GET",{route},status="404"'], 1)
+
+    def test_async_requests_are_flushed_to_the_metrics_directory(self):
+        metrics = self.app.extensions['metrics']
+        metrics.directory = self.tmpdir.name
+        self.request('GET', '/movie/1', self.headers)
+
+        with open(metrics.path()) as snapshot_file:
+            requests = json.load(snapshot_file)['counters'][
+                'http_requests_total']
+        route = 'route="/movie/<int:movie_id>"'
+        self.assertEqual(requests[f'method="GET",{route},status="200"'], 1)
+
+    def test_loading_keys_does_not_block_the_event_loop(self):
+        ticks = []
+
+        async def ticker():
+            for _ in range(10):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.005)
+
+        async def run():
+            # CountingJWKSCache takes 50ms to load the keys
+            return await asyncio.gather(
+                asgi_request(self.asgi_app, 'GET', '/movie', self.headers),
+                ticker())
+
+        (status, _, _), _ = asyncio.run(run())
+        self.assertEqual(status, 200)
+        self.assertEqual(auth.jwks_cache.fetches, 1)
+        # the ticker kept running while the keys were being loaded
+        self.assertLess(max(b - a for a, b in zip(ticks, ticks[1:])), 0.04)
+
+
+@unittest.skipIf(aiosqlite is None or uvicorn is None,
+                 'aiosqlite and uvicorn are needed')
+class AsyncThroughputBenchmark(ASGITestMixin, unittest.TestCase):
+    """Benchmark: requests per second of GET /movie/<id> under concurrent
+    load, served by one sync worker (a single-threaded WSGI server, like a
+    gunicorn sync worker) and by one async worker (uvicorn). Every query
+    waits `db_latency` seconds first, standing in for the round trip to a
+    database server."""
+
+    movie_count = 500
+    clients = 50
+    requests_per_client = 10
+    db_latency = 0.005
+
+    def serve_sync(self):
+        from wsgiref.simple_server import (WSGIRequestHandler, WSGIServer,
+                                           make_server)
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        class Server(WSGIServer):
+            # let every client queue up, as gunicorn's backlog would
+            request_queue_size = 2048
+
+        with self.app.app_context():
+            event.listen(
+                db.get_engine(self.app), 'before_cursor_execute',
+                lambda *args: time.sleep(self.db_latency))
+        server = make_server('127.0.0.1', 0, self.app,
+                             server_class=Server, handler_class=QuietHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server.server_port, server.shutdown
+
+    def serve_async(self):
+        fetch = self.asgi_app.database.fetch
+
+        async def slow_fetch(*args):
+            await asyncio.sleep(self.db_latency)
+            return await fetch(*args)
+
+        self.asgi_app.database.fetch = slow_fetch
+        config = uvicorn.Config(self.asgi_app, host='127.0.0.1', port=0,
+                                log_level='warning', lifespan='on')
+        server = uvicorn.Server(config)
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.01)
+        port = server.servers[0].sockets[0].getsockname()[1]
+
+        def stop():
+            server.should_exit = True
+            thread.join()
+        return port, stop
+
+    def requests_per_second(self, port):
+        def client(offset):
+            connection = http.client.HTTPConnection('127.0.0.1', port)
+            for i in range(self.requests_per_client):
+                movie_id = (offset * self.requests_per_client + i) % \
+                    self.movie_count + 1
+                connection.request(
+                    'GET', f'/movie/{movie_id}', headers=self.headers)
+                response = connection.getresponse()
+                response.read()
+                self.assertEqual(response.status, 200)
+            connection.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(self.clients) as executor:
+            list(executor.map(client, range(self.clients)))
+        elapsed = time.perf_counter() - start
+        return self.clients * self.requests_per_client / elapsed
+
+    def test_benchmark_sync_against_async(self):
+        results = {}
+        for mode, serve in (('sync', self.serve_sync),
+                            ('async', self.serve_async)):
+            # every request misses the record cache and hits the database
+            self.app.extensions['record_cache'].clear()
+            port, stop = serve()
+            try:
+                results[mode] = self.requests_per_second(port)
+            finally:
+                stop()
+        print(f"\nGET /movie/<id>, {self.clients} concurrent clients, "
+              f"{self.db_latency * 1000:.0f}ms per query: "
+              f"sync worker {results['sync']:.0f} req/s, "
+              f"async worker {results['async']:.0f} req/s")
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
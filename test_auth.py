@@ -0,0 +1,331 @@
+# ---------------------------------------------------------
+# Imports
+# ---------------------------------------------------------
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from jose import jwt
+
+# these tests run offline, against a locally generated key
+os.environ.setdefault("AUTH0_DOMAIN", "casting-agency.test")
+os.environ.setdefault("ALGORITHMS", "RS256")
+os.environ.setdefault("API_AUDIENCE", "casting_agency")
+
+import auth  # noqa: E402
+from auth import AuthError, JWKSCache, TokenCache  # noqa: E402
+from app import create_app  # noqa: E402
+from models import db, setup_db  # noqa: E402
+from local_auth import generate_key, make_token, write_jwks  # noqa: E402
+
+
+# ---------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------
+
+class CountingJWKSCache(JWKSCache):
+    """JWKSCache that counts how many times the key set is loaded"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fetches = 0
+
+    def _fetch(self):
+        self.fetches += 1
+        # make concurrent callers overlap with the fetch
+        time.sleep(0.05)
+        return super()._fetch()
+
+
+class LocalAuthMixin:
+    """Serves the signing key 'key-1' from a JWKS file in a temporary
+    directory, through a fresh key cache (of `jwks_cache_class`) and token
+    cache, and restores those of the auth module afterwards. `headers`
+    carry a token with `permissions`"""
+
+    jwks_cache_class = JWKSCache
+    permissions = ['get:movie']
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.pem, cls.jwk = generate_key('key-1')
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.jwks_path = os.path.join(self.tmpdir.name, 'jwks.json')
+        write_jwks(self.jwks_path, [self.jwk])
+        self.original_caches = (auth.jwks_cache, auth.token_cache)
+        auth.jwks_cache = self.jwks_cache_class('file://' + self.jwks_path)
+        auth.token_cache = TokenCache()
+        self.token = make_token(self.pem, 'key-1', self.permissions)
+        self.headers = {'Authorization': 'Bearer ' + self.token}
+
+    def tearDown(self):
+        auth.jwks_cache, auth.token_cache = self.original_caches
+        self.tmpdir.cleanup()
+        super().tearDown()
+
+
+class LocalAppMixin(LocalAuthMixin):
+    """Creates the app on a SQLite database in the temporary directory of
+    LocalAuthMixin, with the tables created and the rows of seed() added"""
+
+    def setUp(self):
+        super().setUp()
+        self.database_path = os.path.join(self.tmpdir.name, 'casting.db')
+        self.app = create_app()
+        setup_db(self.app, 'sqlite:///' + self.database_path)
+        with self.app.app_context():
+            db.create_all()
+            self.seed()
+            db.session.commit()
+        self.client = self.app.test_client()
+
+    def seed(self):
+        pass
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.get_engine(self.app).dispose()
+        super().tearDown()
+
+
+# ---------------------------------------------------------
+# Tests
+# ---------------------------------------------------------
+
+
+class JWKSCacheTestCase(unittest.TestCase):
+    """This class represents the JWKS cache test cases"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pem, cls.jwk = generate_key('key-1')
+        cls.rotated_pem, cls.rotated_jwk = generate_key('key-2')
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.jwks_path = os.path.join(self.tmpdir.name, 'jwks.json')
+        write_jwks(self.jwks_path, [self.jwk])
+        self.url = 'file://' + self.jwks_path
+
+        self.cache = CountingJWKSCache(
+            self.url, ttl=600, min_refresh_interval=0)
+        self.original_cache = auth.jwks_cache
+        auth.jwks_cache = self.cache
+
+    def tearDown(self):
+        auth.jwks_cache = self.original_cache
+        self.tmpdir.cleanup()
+
+    def test_keys_are_fetched_once_within_ttl(self):
+        for _ in range(5):
+            self.assertIsNotNone(self.cache.get_key('key-1'))
+        self.assertEqual(self.cache.fetches, 1)
+
+    def test_keys_are_reloaded_after_ttl(self):
+        self.cache.ttl = 0
+        self.cache.get_key('key-1')
+        self.cache.get_key('key-1')
+        self.assertEqual(self.cache.fetches, 2)
+
+    def test_concurrent_requests_share_one_fetch(self):
+        threads = [
+            threading.Thread(target=self.cache.get_key, args=('key-1',))
+            for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.fetches, 1)
+
+    def test_unknown_kid_forces_a_refresh(self):
+        self.cache.get_key('key-1')
+        write_jwks(self.jwks_path, [self.jwk, self.rotated_jwk])
+
+        self.assertIsNotNone(self.cache.get_key('key-2'))
+        self.assertEqual(self.cache.fetches, 2)
+
+    def test_unknown_kid_refresh_is_rate_limited(self):
+        self.cache.min_refresh_interval = 600
+        self.cache.get_key('key-1')
+        for _ in range(5):
+            self.assertIsNone(self.cache.get_key('missing'))
+        self.assertEqual(self.cache.fetches, 1)
+
+    def test_stale_keys_are_served_when_reload_fails(self):
+        self.cache.get_key('key-1')
+        os.remove(self.jwks_path)
+        self.cache.ttl = 0
+
+        self.assertIsNotNone(self.cache.get_key('key-1'))
+
+    def test_keys_are_parsed_once_per_load(self):
+        key = self.cache.get_key('key-1')
+        self.assertIs(self.cache.get_key('key-1'), key)
+        self.assertNotIsInstance(key, dict)
+
+    def test_non_rsa_keys_are_skipped(self):
+        write_jwks(self.jwks_path, [
+            self.jwk, {'kty': 'oct', 'kid': 'hmac', 'k': 'c2VjcmV0'}])
+        self.assertIsNone(self.cache.get_key('hmac'))
+        self.assertIsNotNone(self.cache.get_key('key-1'))
+
+    def test_verify_decode_jwt_uses_cached_keys(self):
+        token = make_token(self.pem, 'key-1', ['get:movie'])
+        for _ in range(3):
+            payload = auth.verify_decode_jwt(token)
+            self.assertEqual(payload['permissions'], ['get:movie'])
+        self.assertEqual(self.cache.fetches, 1)
+
+    def test_verify_decode_jwt_rejects_unknown_key(self):
+        token = make_token(self.rotated_pem, 'key-2', ['get:movie'])
+        with self.assertRaises(AuthError) as context:
+            auth.verify_decode_jwt(token)
+        self.assertEqual(context.exception.status_code, 400)
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    """This class represents the verified-token cache test cases"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pem, cls.jwk = generate_key('key-1')
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        jwks_path = os.path.join(self.tmpdir.name, 'jwks.json')
+        write_jwks(jwks_path, [self.jwk])
+
+        self.original_caches = (auth.jwks_cache, auth.token_cache)
+        auth.jwks_cache = JWKSCache('file://' + jwks_path)
+        auth.token_cache = TokenCache(maxsize=2)
+
+    def tearDown(self):
+        auth.jwks_cache, auth.token_cache = self.original_caches
+        self.tmpdir.cleanup()
+
+    def test_repeated_token_is_verified_once(self):
+        token = make_token(self.pem, 'key-1', ['get:movie'])
+        with mock.patch.object(
+                auth, 'verify_decode_jwt',
+                wraps=auth.verify_decode_jwt) as verify:
+            for _ in range(5):
+                payload = auth.get_verified_payload(token)
+                self.assertTrue(auth.check_permissions('get:movie', payload))
+        self.assertEqual(verify.call_count, 1)
+
+    def test_cached_payload_still_checks_permissions(self):
+        token = make_token(self.pem, 'key-1', ['get:movie'])
+        auth.get_verified_payload(token)
+        payload = auth.get_verified_payload(token)
+        with self.assertRaises(AuthError) as context:
+            auth.check_permissions('delete:movie', payload)
+        self.assertEqual(context.exception.status_code, 403)
+
+    def test_entries_expire_at_exp_claim(self):
+        cache = TokenCache(maxsize=10)
+        cache.set('expired', {'exp': time.time() - 1})
+        cache.set('valid', {'exp': time.time() + 60})
+        self.assertIsNone(cache.get('expired'))
+        self.assertIsNotNone(cache.get('valid'))
+        self.assertEqual(len(cache), 1)
+
+    def test_tokens_without_exp_are_not_cached(self):
+        cache = TokenCache(maxsize=10)
+        cache.set('no-exp', {'permissions': []})
+        self.assertIsNone(cache.get('no-exp'))
+
+    def test_cache_is_size_capped_lru(self):
+        cache = TokenCache(maxsize=2)
+        expires_at = time.time() + 60
+        cache.set('first', {'exp': expires_at})
+        cache.set('second', {'exp': expires_at})
+        # touch 'first' so 'second' becomes the least recently used
+        cache.get('first')
+        cache.set('third', {'exp': expires_at})
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNotNone(cache.get('first'))
+        self.assertIsNone(cache.get('second'))
+        self.assertIsNotNone(cache.get('third'))
+
+
+class KeyVerificationBenchmark(unittest.TestCase):
+    """Micro-benchmark: verification cost per token, per-request JWK dict
+    (the old code path) against the pre-parsed key index"""
+
+    rounds = 100
+    runs = 7
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pem, cls.jwk = generate_key('key-1')
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        jwks_path = os.path.join(self.tmpdir.name, 'jwks.json')
+        write_jwks(jwks_path, [self.jwk])
+        self.original_cache = auth.jwks_cache
+        auth.jwks_cache = JWKSCache('file://' + jwks_path)
+
+    def tearDown(self):
+        auth.jwks_cache = self.original_cache
+        self.tmpdir.cleanup()
+
+    def time_per_token(self, verifications, tokens):
+        # alternate between the verifications token by token, so that they
+        # all see the same load on the machine
+        totals = [0] * len(verifications)
+        for token in tokens:
+            for index, verify in enumerate(verifications):
+                start = time.perf_counter()
+                payload = verify(token)
+                totals[index] += time.perf_counter() - start
+                self.assertEqual(payload['permissions'], ['get:movie'])
+        return [total / len(tokens) for total in totals]
+
+    def test_benchmark_verification_per_token(self):
+        def verify_with_jwk_dict(token):
+            jwt.get_unverified_header(token)
+            rsa_key = {
+                'kty': self.jwk['kty'],
+                'kid': self.jwk['kid'],
+                'use': self.jwk['use'],
+                'n': self.jwk['n'],
+                'e': self.jwk['e']
+            }
+            return jwt.decode(
+                token,
+                rsa_key,
+                algorithms=auth.ALGORITHMS,
+                audience=auth.API_AUDIENCE,
+                issuer='https://' + auth.AUTH0_DOMAIN + '/')
+
+        # warm the key index so both sides only measure verification, and
+        # keep the best of a few runs to smooth out noise
+        auth.jwks_cache.get_key('key-1')
+        tokens = [
+            make_token(self.pem, 'key-1', ['get:movie'], expires_in=3600 + i)
+            for i in range(self.rounds)]
+        timings = [self.time_per_token(
+            (verify_with_jwk_dict, auth.verify_decode_jwt), tokens)
+            for _ in range(self.runs)]
+        before = min(timing[0] for timing in timings)
+        after = min(timing[1] for timing in timings)
+        print(f"\nJWT verification per token: "
+              f"jwk dict {before * 1e6:.0f}us, "
+              f"pre-parsed key {after * 1e6:.0f}us")
+        self.assertLess(after, before)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+# ---------------------------------------------------------
+# Imports
+# ---------------------------------------------------------
+
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import benchmark
+
+
+# ---------------------------------------------------------
+# Tests
+# ---------------------------------------------------------
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    """This class represents the benchmark suite test cases, on a tiny
+    SQLite database"""
+
+    def test_percentile_is_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmark.percentile(values, 50), 50)
+        self.assertEqual(benchmark.percentile(values, 99), 99)
+        self.assertEqual(benchmark.percentile([7], 95), 7)
+
+    def test_every_endpoint_runs_without_errors(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output = os.path.join(tmpdir, 'results.json')
+            status = benchmark.main([
+                '--movies', '20', '--actors', '20', '--requests', '3',
+                '--warmup', '1', '--output', output])
+            with open(output) as results_file:
+                results = json.load(results_file)
+
+        self.assertEqual(status, 0)
+        self.assertEqual(len(results['endpoints']), len(benchmark.SCENARIOS))
+        for name, stats in results['endpoints'].items():
+            self.assertEqual(stats['errors'], 0, name)
+            self.assertEqual(stats['requests'], 3)
+            self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+
+    def test_report_compares_with_baseline(self):
+        stats = {'rps': 100.0, 'p50_ms': 1.0, 'p95_ms': 2.0,
+                 'p99_ms': 3.0, 'errors': 0}
+        results = {'endpoints': {'GET /movie': stats}}
+        baseline = {'endpoints': {'GET /movie': dict(stats, rps=50.0)}}
+        out = io.StringIO()
+        benchmark.report(results, baseline, out)
+        self.assertIn('+100%', out.getvalue())
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
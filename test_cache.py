@@ -0,0 +1,190 @@
+# ---------------------------------------------------------
+# Imports
+# ---------------------------------------------------------
+
+import json
+import unittest
+from datetime import datetime
+from flask import Flask, jsonify, request
+from cache import LRUCache, LocalClient, ResponseCache, SharedCache
+
+from test_auth import LocalAppMixin
+
+from app import create_app
+from models import Movies, db, setup_db
+
+
+# ---------------------------------------------------------
+# Tests
+# ---------------------------------------------------------
+
+
+class LRUCacheTestCase(unittest.TestCase):
+    """This class represents the in-process cache backend test cases"""
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set('first', 1)
+        cache.set('second', 2)
+        cache.get('first')
+        cache.set('third', 3)
+
+        self.assertEqual(cache.get('first'), 1)
+        self.assertIsNone(cache.get('second'))
+        self.assertEqual(cache.get('third'), 3)
+
+    def test_entries_expire_after_ttl(self):
+        cache = LRUCache(maxsize=2, ttl=0)
+        cache.set('key', 'value')
+        self.assertIsNone(cache.get('key'))
+
+    def test_counters_are_not_evicted(self):
+        cache = LRUCache(maxsize=1, ttl=60)
+        cache.incr('generation:movies')
+        cache.set('first', 1)
+        cache.set('second', 2)
+        self.assertEqual(cache.counter('generation:movies'), 1)
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    """This class represents the response cache test cases, against both
+    backends"""
+
+    def create_app(self, backend):
+        app = Flask(__name__)
+        response_cache = ResponseCache(backend)
+        self.calls = 0
+
+        @app.route('/movie')
+        @response_cache.cached('movies')
+        def get_movies():
+            self.calls += 1
+            return jsonify({'success': True, 'page': request.args.get('p')})
+
+        @app.route('/add-movie', methods=['POST'])
+        def add_movie():
+            response_cache.invalidate('movies')
+            return jsonify({'success': True})
+
+        return app.test_client()
+
+    def check_backend(self, backend):
+        client = self.create_app(backend)
+
+        res = client.get('/movie')
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        res = client.get('/movie')
+        self.assertEqual(res.headers['X-Cache'], 'HIT')
+        self.assertEqual(res.get_json(), {'success': True, 'page': None})
+        self.assertEqual(res.mimetype, 'application/json')
+
+        # the query string is part of the key
+        res = client.get('/movie?p=2')
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertEqual(res.get_json()['page'], '2')
+
+        client.post('/add-movie')
+        res = client.get('/movie')
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertEqual(self.calls, 3)
+
+    def test_lru_backend(self):
+        self.check_backend(LRUCache(maxsize=10, ttl=60))
+
+    def test_shared_backend(self):
+        self.check_backend(SharedCache(LocalClient(), ttl=60))
+
+    def test_disabled_cache_passes_through(self):
+        client = self.create_app(None)
+        client.get('/movie')
+        res = client.get('/movie')
+        self.assertNotIn('X-Cache', res.headers)
+        self.assertEqual(self.calls, 2)
+
+    def test_shared_backend_errors_are_misses(self):
+        class BrokenClient(LocalClient):
+            def get(self, key):
+                raise ConnectionError('cache is down')
+
+        client = self.create_app(SharedCache(BrokenClient(), ttl=60))
+        for _ in range(2):
+            res = client.get('/movie')
+            self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.calls, 2)
+
+    def test_shared_backend_errors_do_not_fail_writes(self):
+        class BrokenClient(LocalClient):
+            def incr(self, key):
+                raise ConnectionError('cache is down')
+
+        client = self.create_app(SharedCache(BrokenClient(), ttl=60))
+        res = client.post('/add-movie')
+        self.assertEqual(res.status_code, 200)
+
+
+class WorkersResponseCacheTestCase(LocalAppMixin, unittest.TestCase):
+    """This class represents the response cache test cases of two workers
+    (two apps, each with its in-process cache) sharing one database"""
+
+    permissions = ['get:movie', 'post:add-movie']
+
+    def setUp(self):
+        super().setUp()
+        self.other_app = create_app()
+        setup_db(self.other_app, 'sqlite:///' + self.database_path)
+
+    def seed(self):
+        Movies(title='Arrival', release_date=datetime(2016, 11, 11)).insert()
+
+    def tearDown(self):
+        with self.other_app.app_context():
+            db.session.remove()
+            db.get_engine(self.other_app).dispose()
+        super().tearDown()
+
+    def test_write_in_another_worker_is_not_served_stale(self):
+        res = self.client.get('/movie', headers=self.headers)
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertEqual(list(res.get_json()['movies'].values()),
+                         ['Arrival'])
+        etag = res.headers['ETag']
+
+        # the other worker only invalidates its own cache
+        res = self.other_app.test_client().post(
+            '/add-movie', headers=self.headers,
+            content_type='application/json',
+            data=json.dumps({'title': 'Dune',
+                             'release_date': '2021-10-22T00:00:00Z'}))
+        self.assertEqual(res.status_code, 200)
+
+        res = self.client.get('/movie', headers=self.headers)
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertNotEqual(res.headers['ETag'], etag)
+        self.assertEqual(list(res.get_json()['movies'].values()),
+                         ['Arrival', 'Dune'])
+
+        # the new body is cached under the new ETag
+        res = self.client.get('/movie', headers=self.headers)
+        self.assertEqual(res.headers['X-Cache'], 'HIT')
+        self.assertEqual(list(res.get_json()['movies'].values()),
+                         ['Arrival', 'Dune'])
+
+    def test_write_outside_the_helpers_changes_the_etag(self):
+        res = self.client.get('/movie', headers=self.headers)
+        etag = res.headers['ETag']
+
+        # the table version is bumped by the database itself
+        with self.other_app.app_context():
+            db.session.execute(
+                Movies.__table__.update().values(title='Arrival (2016)'))
+            db.session.commit()
+
+        res = self.client.get('/movie', headers=self.headers)
+        self.assertNotEqual(res.headers['ETag'], etag)
+        self.assertEqual(list(res.get_json()['movies'].values()),
+                         ['Arrival (2016)'])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
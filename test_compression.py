@@ -0,0 +1,164 @@
+# ---------------------------------------------------------
+# Imports
+# ---------------------------------------------------------
+
+import gzip
+import json
+import unittest
+
+from flask import Flask, Response, jsonify
+
+import compression
+from cache import LRUCache, LocalClient, ResponseCache, SharedCache
+from compression import choose_encoding, compress_body, init_compression
+
+
+# ---------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------
+
+def decompress(data, encoding):
+    if encoding == 'br':
+        return compression.brotli.decompress(data)
+    if encoding == 'zstd':
+        return compression.zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+# ---------------------------------------------------------
+# Tests
+# ---------------------------------------------------------
+
+
+class NegotiationTestCase(unittest.TestCase):
+    """This class represents the Accept-Encoding negotiation test cases"""
+
+    def test_client_preferences_and_ties(self):
+        encodings = ['br', 'zstd', 'gzip']
+        for accept_encoding, expected in (
+                ('gzip', 'gzip'),
+                ('gzip, deflate, br', 'br'),
+                ('br;q=0.5, gzip', 'gzip'),
+                ('zstd, gzip;q=0.9', 'zstd'),
+                ('*', 'br'),
+                ('gzip;q=0', None),
+                ('identity', None),
+                ('', None),
+                (None, None)):
+            self.assertEqual(choose_encoding(accept_encoding, encodings),
+                             expected, accept_encoding)
+
+    def test_small_bodies_are_sent_as_they_are(self):
+        body = b'{"success":true}'
+        self.assertEqual(compress_body(body, 'gzip', ['gzip'], 1024),
+                         (body, None))
+        data, encoding = compress_body(body * 100, 'gzip', ['gzip'], 1024)
+        self.assertEqual(encoding, 'gzip')
+        self.assertEqual(gzip.decompress(data), body * 100)
+
+
+class CompressionTestCase(unittest.TestCase):
+    """This class represents the response compression test cases"""
+
+    def setUp(self):
+        self.compressions = []
+        self.original_compressors = dict(compression.COMPRESSORS)
+        for name, compress in self.original_compressors.items():
+            compression.COMPRESSORS[name] = self.counting(name, compress)
+
+    def tearDown(self):
+        compression.COMPRESSORS.clear()
+        compression.COMPRESSORS.update(self.original_compressors)
+
+    def counting(self, name, compress):
+        def counting_compress(data):
+            self.compressions.append(name)
+            return compress(data)
+        return counting_compress
+
+    def create_client(self, backend, encodings=('br', 'zstd', 'gzip')):
+        app = Flask(__name__)
+        response_cache = ResponseCache(backend)
+        app.extensions['response_cache'] = response_cache
+        init_compression(app, min_size=1024, encodings=encodings)
+        self.movies = {i: f'Movie {i}' for i in range(200)}
+
+        @app.route('/movie')
+        @response_cache.cached('movies')
+        def get_movies():
+            return jsonify({'success': True, 'movies': self.movies})
+
+        @app.route('/movie/1')
+        def get_movie():
+            return jsonify({'success': True, 'movie': self.movies[1]})
+
+        @app.route('/movie/export')
+        def export_movies():
+            return Response((json.dumps(self.movies) for _ in range(1)),
+                            mimetype='application/json')
+
+        return app.test_client()
+
+    def get(self, client, path, accept_encoding):
+        return client.get(path, headers={'Accept-Encoding': accept_encoding})
+
+    def test_large_responses_are_compressed(self):
+        client = self.create_client(LRUCache())
+        for encoding in compression.available_encodings(['br', 'zstd',
+                                                         'gzip']):
+            res = self.get(client, '/movie', encoding)
+            self.assertEqual(res.headers['Content-Encoding'], encoding)
+            self.assertEqual(res.headers['Vary'], 'Accept-Encoding')
+            self.assertEqual(int(res.headers['Content-Length']),
+                             len(res.data))
+            self.assertEqual(
+                json.loads(decompress(res.data, encoding))['movies']['1'],
+                'Movie 1')
+
+    def test_small_streamed_and_unaccepted_responses_are_not(self):
+        client = self.create_client(LRUCache())
+        res = self.get(client, '/movie/1', 'gzip')
+        self.assertNotIn('Content-Encoding', res.headers)
+        self.assertEqual(res.headers['Vary'], 'Accept-Encoding')
+        res = self.get(client, '/movie/export', 'gzip')
+        self.assertNotIn('Content-Encoding', res.headers)
+        res = self.get(client, '/movie', 'identity')
+        self.assertNotIn('Content-Encoding', res.headers)
+        self.assertEqual(self.compressions, [])
+
+    def test_cached_responses_are_compressed_once(self):
+        for backend in (LRUCache(), SharedCache(LocalClient())):
+            self.compressions.clear()
+            client = self.create_client(backend, encodings=['gzip'])
+            bodies = [self.get(client, '/movie', 'gzip') for _ in range(3)]
+
+            self.assertEqual([res.headers['X-Cache'] for res in bodies],
+                             ['MISS', 'HIT', 'HIT'])
+            self.assertEqual(self.compressions, ['gzip'])
+            self.assertEqual(len({res.data for res in bodies}), 1)
+            # clients that do not accept it still get the plain body
+            res = self.get(client, '/movie', 'identity')
+            self.assertEqual(res.get_json()['movies']['1'], 'Movie 1')
+
+    def test_cached_entries_are_replaced_not_changed(self):
+        backend = LRUCache()
+        client = self.create_client(backend, encodings=['gzip'])
+        self.get(client, '/movie', 'identity')
+        (entry, _), = backend._entries.values()
+
+        self.get(client, '/movie', 'gzip')
+        (compressed, _), = backend._entries.values()
+        self.assertNotIn('encoded', entry)
+        self.assertEqual(set(compressed['encoded']), {'gzip'})
+        self.assertEqual(compressed['body'], entry['body'])
+
+    def test_no_encodings_turns_compression_off(self):
+        client = self.create_client(LRUCache(), encodings=[])
+        res = self.get(client, '/movie', 'gzip')
+        self.assertNotIn('Content-Encoding', res.headers)
+        self.assertNotIn('Vary', res.headers)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+# ---------------------------------------------------------
+# Imports
+# ---------------------------------------------------------
+
+import time
+import unittest
+
+from flask import Flask, jsonify
+
+import cors
+from cors import init_cors
+from metrics import init_metrics
+
+PREFLIGHT = {'Origin': 'http://localhost:3000',
+             'Access-Control-Request-Method': 'PATCH',
+             'Access-Control-Request-Headers': 'authorization,content-type'}
+
+
+# ---------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------
+
+class CORSTestMixin:
+    """Creates a Flask app with the CORS middleware and its metrics, that
+    records the hooks and views it runs"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.metrics = init_metrics(self.app, directory=None)
+        init_cors(self.app)
+        self.calls = []
+
+        @self.app.before_request
+        def before_request():
+            self.calls.append('before_request')
+
+        @self.app.route('/movie/<int:movie_id>', methods=['GET', 'PATCH'])
+        def patch_movie(movie_id):
+            self.calls.append('view')
+            return jsonify({'success': True})
+
+        self.client = self.app.test_client()
+
+
+# ---------------------------------------------------------
+# Tests
+# ---------------------------------------------------------
+
+
+class CORSTestCase(CORSTestMixin, unittest.TestCase):
+    """This class represents the CORS headers and preflight test cases"""
+
+    def test_preflight_is_answered_before_flask(self):
+        res = self.client.open('/movie/1', method='OPTIONS', headers=PREFLIGHT)
+
+        self.assertEqual(res.status_code, 204)
+        self.assertEqual(res.data, b'')
+        self.assertEqual(res.headers['Access-Control-Max-Age'],
+                         str(cors.CORS_MAX_AGE))
+        self.assertEqual(res.headers['Access-Control-Allow-Origin'],
+                         cors.CORS_ALLOW_ORIGIN)
+        self.assertIn('PATCH', res.headers['Access-Control-Allow-Methods'])
+        self.assertEqual(self.calls, [])
+        counters = self.metrics.snapshot()['counters']
+        self.assertEqual(counters['http_requests_total'][
+            'method="OPTIONS",route="preflight",status="204"'], 1)
+
+    def test_other_options_requests_reach_flask(self):
+        res = self.client.open('/movie/1', method='OPTIONS')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('PATCH', res.headers['Allow'])
+        self.assertEqual(self.calls, ['before_request'])
+
+    def test_every_response_has_the_headers_once(self):
+        for res in (self.client.get('/movie/1'), self.client.get('/nope')):
+            for name, value in cors.CORS_HEADERS:
+                self.assertEqual(res.headers.getlist(name), [value])
+
+
+class PreflightBenchmark(CORSTestMixin, unittest.TestCase):
+    """Benchmark: preflight requests per second answered by the middleware
+    and by the whole Flask pipeline (automatic OPTIONS response)"""
+
+    requests = 2000
+
+    def requests_per_second(self, headers):
+        start = time.perf_counter()
+        for _ in range(self.requests):
+            self.client.open('/movie/1', method='OPTIONS', headers=headers)
+        return self.requests / (time.perf_counter() - start)
+
+    def test_benchmark_preflight(self):
+        fast = self.requests_per_second(PREFLIGHT)
+        full = self.requests_per_second({'Origin': 'http://localhost:3000'})
+        print(f"\nOPTIONS /movie/1: preflight fast path {fast:.0f} req/s, "
+              f"Flask pipeline {full:.0f} req/s")
+        self.assertGreater(fast, full)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+# ---------------------------------------------------------
+# Imports
+# ---------------------------------------------------------
+
+import json
+import multiprocessing
+import os
+import unittest
+
+from flask import Flask, abort, jsonify
+
+from test_auth import LocalAuthMixin
+
+import auth
+from metrics import Metrics, init_metrics, merge, render
+from models import setup_db
+
+
+# ---------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------
+
+def parse_metrics(text):
+    """Exposition text as {'name{labels}': value}, comments left out"""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            sample, value = line.rsplit(' ', 1)
+            samples[sample] = float(value)
+    return samples
+
+
+def record_in_worker(directory):
+    """Run in a child process: count one request and write it out"""
+    metrics = Metrics(directory)
+    metrics.observe_request(
+        'GET', '/movie/<int:movie_id>', 'get:movie', 200, 0.002)
+    snapshot = metrics.snapshot()
+    snapshot['gauges']['db_pool_size'] = {'': 5}
+    metrics.flush(snapshot)
+
+
+# ---------------------------------------------------------
+# Tests
+# ---------------------------------------------------------
+
+
+class RenderTestCase(unittest.TestCase):
+    """This class represents the exposition format test cases"""
+
+    def test_histograms_are_exported_in_seconds(self):
+        metrics = Metrics(directory=None)
+        metrics.observe_request('GET', '/movie', 'get:movie', 200, 0.004)
+        metrics.observe_request('GET', '/movie', 'get:movie', 404, 0.2)
+        samples = parse_metrics(render(merge([metrics.snapshot()])))
+
+        prefix = 'http_request_duration_seconds'
+        labels = 'route="/movie",permission="get:movie"'
+        self.assertEqual(samples[f'{prefix}_bucket{{{labels},le="0.005"}}'],
+                         1)
+        self.assertEqual(samples[f'{prefix}_bucket{{{labels},le="+Inf"}}'],
+                         2)
+        self.assertEqual(samples[f'{prefix}_count{{{labels}}}'], 2)
+        self.assertAlmostEqual(samples[f'{prefix}_sum{{{labels}}}'], 0.204)
+        self.assertEqual(samples['http_errors_total{status="404"}'], 1)
+        self.assertEqual(samples['workers'], 1)
+
+    def test_label_values_are_escaped(self):
+        metrics = Metrics(directory=None)
+        metrics.inc('http_errors_total', 'status="a\\"b"')
+        self.assertIn('http_errors_total{status="a\\"b"} 1',
+                      render(merge([metrics.snapshot()])))
+
+
+class FlaskMetricsTestCase(LocalAuthMixin, unittest.TestCase):
+    """This class represents the request metrics test cases"""
+
+    def create_app(self, directory=None):
+        app = Flask(__name__)
+        setup_db(app, 'sqlite://')
+        metrics = init_metrics(app, directory, flush_interval=60)
+
+        @app.route('/movie/<int:movie_id>')
+        @auth.requires_auth('get:movie')
+        def get_movie(payload, movie_id):
+            if movie_id > 10:
+                abort(404)
+            return jsonify({'success': True})
+
+        @app.route('/metrics')
+        def get_metrics():
+            return metrics.render()
+
+        @app.errorhandler(404)
+        def not_found(error):
+            return jsonify({'success': False}), 404
+
+        @app.errorhandler(auth.AuthError)
+        def auth_error(error):
+            return jsonify({'success': False}), error.status_code
+
+        return app
+
+    def test_requests_errors_and_caches_are_counted(self):
+        client = self.create_app().test_client()
+        client.get('/movie/1', headers=self.headers)
+        client.get('/movie/2', headers=self.headers)
+        client.get('/movie/11', headers=self.headers)
+        client.get('/movie/1')
+        client.get('/unknown')
+        samples = parse_metrics(client.get('/metrics').data.decode())
+
+        route = 'route="/movie/<int:movie_id>"'
+        self.assertEqual(samples[
+            f'http_requests_total{{method="GET",{route},status="200"}}'], 2)
+        # errors answered by the errorhandlers
+        self.assertEqual(samples['http_errors_total{status="401"}'], 1)
+        self.assertEqual(samples['http_errors_total{status="404"}'], 2)
+        self.assertEqual(samples[
+            f'http_request_duration_seconds_count{{{route},'
+            f'permission="get:movie"}}'], 4)
+        self.assertEqual(samples[
+            'http_request_duration_seconds_count{route="unmatched",'
+            'permission="none"}'], 1)
+        self.assertEqual(samples[
+            'auth_cache_requests_total{cache="token",result="hit"}'], 2)
+        self.assertEqual(samples[
+            'auth_cache_requests_total{cache="token",result="miss"}'], 1)
+        self.assertEqual(samples[
+            'auth_cache_requests_total{cache="jwks",result="miss"}'], 1)
+
+    def test_workers_are_merged_through_the_directory(self):
+        directory = os.path.join(self.tmpdir.name, 'metrics')
+        app = self.create_app(directory)
+        client = app.test_client()
+
+        # a worker that has since exited
+        worker = multiprocessing.Process(
+            target=record_in_worker, args=(directory,))
+        worker.start()
+        worker.join()
+        # a live one, whose gauges count
+        with open(os.path.join(directory, f'metrics-{os.getppid()}.json'),
+                  'w') as snapshot_file:
+            json.dump({'pid': os.getppid(), 'counters': {},
+                       'histograms': {}, 'gauges': {'db_pool_size': {'': 5}}},
+                      snapshot_file)
+
+        client.get('/movie/1', headers=self.headers)
+        samples = parse_metrics(client.get('/metrics').data.decode())
+
+        self.assertEqual(samples[
+            'http_request_duration_seconds_count{'
+            'route="/movie/<int:movie_id>",permission="get:movie"}'], 2)
+        self.assertEqual(samples['workers'], 2)
+        self.assertEqual(samples['db_pool_size'], 5)
+        # this worker wrote its snapshot on its first request
+        self.assertTrue(os.path.exists(app.extensions['metrics'].path()))
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
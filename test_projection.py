@@ -0,0 +1,195 @@
+# ---------------------------------------------------------
+# Imports
+# ---------------------------------------------------------
+
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from test_auth import LocalAppMixin
+
+from models import db, keyset_page, Actors, Movies, MAX_PAGE_SIZE
+
+
+# ---------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------
+
+class ProjectionTestMixin(LocalAppMixin):
+    """Creates the app on a SQLite database holding `movie_count` movies and
+    `actor_count` actors, behind a local JWKS"""
+
+    permissions = ['get:movie', 'get:actor']
+    movie_count = 3
+    actor_count = 3
+
+    def seed(self):
+        start = datetime(2021, 3, 1)
+        db.session.execute(Movies.__table__.insert(), [
+            {'title': f'Movie {i}',
+             'release_date': start + timedelta(days=i)}
+            for i in range(self.movie_count)])
+        db.session.execute(Actors.__table__.insert(), [
+            {'name': f'Actor {i}', 'age': 20 + i % 50,
+             'gender': 'female' if i % 2 else 'male'}
+            for i in range(self.actor_count)])
+
+
+# ---------------------------------------------------------
+# Tests
+# ---------------------------------------------------------
+
+
+class ProjectionTestCase(ProjectionTestMixin, unittest.TestCase):
+    """This class represents the list endpoints' column projection test
+    cases"""
+
+    def test_lists_do_not_build_orm_instances(self):
+        loaded = []
+
+        def on_load(target, context):
+            loaded.append(target)
+
+        for model in (Movies, Actors):
+            event.listen(model, 'load', on_load)
+        try:
+            res = self.client.get('/movie', headers=self.headers)
+            self.client.get('/actor?fields=name,age', headers=self.headers)
+        finally:
+            for model in (Movies, Actors):
+                event.remove(model, 'load', on_load)
+
+        self.assertEqual(res.get_json()['movies'],
+                         {'1': 'Movie 0', '2': 'Movie 1', '3': 'Movie 2'})
+        self.assertEqual(loaded, [])
+
+    def test_fields_select_the_columns_id_first(self):
+        res = self.client.get(
+            '/actor?fields=gender,name,gender&limit=2', headers=self.headers)
+        data = res.get_json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['actors'], [
+            {'id': 1, 'gender': 'male', 'name': 'Actor 0'},
+            {'id': 2, 'gender': 'female', 'name': 'Actor 1'}])
+        self.assertEqual(data['next_cursor'], 2)
+
+    def test_fields_work_with_sorting_and_filters(self):
+        res = self.client.get(
+            '/movie?fields=release_date&sort=-release_date'
+            '&released_after=2021-03-02', headers=self.headers)
+        movies = res.get_json()['movies']
+
+        self.assertEqual([movie['id'] for movie in movies], [3, 2])
+        self.assertEqual(set(movies[0]), {'id', 'release_date'})
+
+    def test_sorted_lists_are_lists(self):
+        res = self.client.get('/movie?sort=-title', headers=self.headers)
+        self.assertEqual(res.get_json()['movies'], [
+            {'id': 3, 'title': 'Movie 2'},
+            {'id': 2, 'title': 'Movie 1'},
+            {'id': 1, 'title': 'Movie 0'}])
+
+        res = self.client.get('/actor?sort=name&limit=1',
+                              headers=self.headers)
+        self.assertEqual(res.get_json()['actors'],
+                         [{'id': 1, 'name': 'Actor 0'}])
+
+    def test_sorted_pages_do_not_depend_on_the_cursor_row(self):
+        res = self.client.get(
+            '/movie?fields=title&sort=-release_date&limit=2',
+            headers=self.headers)
+        data = res.get_json()
+        self.assertEqual([movie['id'] for movie in data['movies']], [3, 2])
+
+        # the last row of the page is deleted before the next one is read
+        with self.app.app_context():
+            Movies.delete_by_id(2)
+        res = self.client.get(
+            f"/movie?fields=title&sort=-release_date&limit=2"
+            f"&after={data['next_cursor']}", headers=self.headers)
+        data = res.get_json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([movie['id'] for movie in data['movies']], [1])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_sort_column_is_read_for_the_cursor(self):
+        res = self.client.get(
+            '/actor?fields=age&sort=name&limit=1', headers=self.headers)
+        data = res.get_json()
+        self.assertEqual(data['actors'], [{'id': 1, 'age': 20}])
+
+        res = self.client.get(
+            f"/actor?fields=age&sort=name&limit=1"
+            f"&after={data['next_cursor']}", headers=self.headers)
+        self.assertEqual(res.get_json()['actors'], [{'id': 2, 'age': 21}])
+
+    def test_invalid_cursors_are_rejected(self):
+        for after in ('2', 'WzEsMl0', 'not-a-cursor'):
+            res = self.client.get(
+                f'/movie?sort=title&after={after}', headers=self.headers)
+            self.assertEqual(res.status_code, 400, after)
+
+    def test_unknown_or_empty_fields_are_rejected(self):
+        for fields in ('budget', 'title,', ''):
+            res = self.client.get(
+                f'/movie?fields={fields}', headers=self.headers)
+            self.assertEqual(res.status_code, 400, fields)
+
+
+class ProjectionThroughputBenchmark(ProjectionTestMixin, unittest.TestCase):
+    """Benchmark: rows per second read from a 100k row table, page by
+    page, as ORM instances and as plain rows of the listed columns, and
+    through GET /movie"""
+
+    movie_count = 100000
+    actor_count = 1
+
+    def walk_pages(self, query):
+        rows = 0
+        after = None
+        while True:
+            page, after = keyset_page(query, Movies.id, after, MAX_PAGE_SIZE)
+            rows += len(page)
+            db.session.expunge_all()
+            if after is None:
+                return rows
+
+    def rows_per_second(self, read):
+        start = time.perf_counter()
+        rows = read()
+        elapsed = time.perf_counter() - start
+        self.assertEqual(rows, self.movie_count)
+        return rows / elapsed
+
+    def read_endpoint(self):
+        rows = 0
+        url = '/movie'
+        while url:
+            data = self.client.get(url, headers=self.headers).get_json()
+            rows += len(data['movies'])
+            url = f"/movie?after={data['next_cursor']}" \
+                if data['next_cursor'] else None
+        return rows
+
+    def test_benchmark_entities_against_projection(self):
+        with self.app.app_context():
+            entities = self.rows_per_second(
+                lambda: self.walk_pages(Movies.query))
+            projected = self.rows_per_second(lambda: self.walk_pages(
+                db.session.query(Movies.id, Movies.title)))
+        endpoint = self.rows_per_second(self.read_endpoint)
+
+        print(f"\n{self.movie_count} movies, {MAX_PAGE_SIZE} per page: "
+              f"ORM instances {entities:.0f} rows/s, "
+              f"id and title columns {projected:.0f} rows/s, "
+              f"GET /movie {endpoint:.0f} rows/s")
+        self.assertGreater(projected, entities)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+# ---------------------------------------------------------
+# Imports
+# ---------------------------------------------------------
+
+import unittest
+from search import InvertedIndex, escape_like, tokenize
+
+
+# ---------------------------------------------------------
+# Tests
+# ---------------------------------------------------------
+
+
+class InvertedIndexTestCase(unittest.TestCase):
+    """This class represents the in-memory search fallback test cases"""
+
+    def setUp(self):
+        self.index = InvertedIndex([
+            (1, "Mortal Kombat"),
+            (2, "Mortal Engines"),
+            (3, "Coming 2 America"),
+            (4, "Mortality"),
+            (5, None)
+        ])
+
+    def test_rows_matching_more_words_rank_first(self):
+        results = self.index.search("mortal kombat", limit=10)
+        self.assertEqual([row[0] for row in results], [1, 2, 4])
+        self.assertEqual(results[0], (1, "Mortal Kombat", 1.0))
+
+    def test_exact_words_rank_above_prefixes(self):
+        results = self.index.search("MORTAL", limit=10)
+        self.assertEqual([row[0] for row in results], [1, 2, 4])
+        self.assertEqual(results[2][2], 0.5)
+
+    def test_results_are_paginated(self):
+        first = self.index.search("mort", limit=2)
+        second = self.index.search("mort", limit=2, offset=2)
+        self.assertEqual([row[0] for row in first + second], [1, 2, 4])
+
+    def test_no_match_and_empty_query(self):
+        self.assertEqual(self.index.search("titanic", limit=10), [])
+        self.assertEqual(self.index.search("  ?! ", limit=10), [])
+
+    def test_helpers(self):
+        self.assertEqual(tokenize("Coming 2 America!"),
+                         ["coming", "2", "america"])
+        self.assertEqual(escape_like("100%_a/b"), "100/%/_a//b")
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
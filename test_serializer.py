@@ -0,0 +1,155 @@
+# ---------------------------------------------------------
+# Imports
+# ---------------------------------------------------------
+
+import json
+import time
+import unittest
+from datetime import date, datetime
+
+from flask import Flask, json as flask_json, jsonify
+from flask.json import JSONEncoder
+
+import serializer
+from serializer import (SerializerJSONEncoder, dumps, encode_rows, row_encoder,
+                        template_row_encoder, use_backend)
+
+BACKENDS = ['stdlib'] + (['orjson'] if serializer.orjson else [])
+
+
+# ---------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------
+
+class BackendMixin:
+    """Restores the JSON backend selected from the environment"""
+
+    def setUp(self):
+        self.original_backend = serializer.backend
+
+    def tearDown(self):
+        serializer.backend = self.original_backend
+
+
+def movie_rows(count):
+    return [(i, f'Movie {i}', datetime(2021, 3, 1, 21, 30, i % 60))
+            for i in range(count)]
+
+
+# ---------------------------------------------------------
+# Tests
+# ---------------------------------------------------------
+
+
+class SerializerTestCase(BackendMixin, unittest.TestCase):
+    """This class represents the JSON serializer test cases"""
+
+    def test_backends_encode_alike(self):
+        payload = {
+            'success': True,
+            'movies': {1: 'Amélie', 2: 'Say "hi"\n'},
+            'movie': {'release_date': datetime(2021, 3, 1, 21, 30),
+                      'premiere': date(2021, 2, 1), 'score': 0.5,
+                      'budget': None},
+        }
+        outputs = set()
+        for name in BACKENDS:
+            use_backend(name)
+            outputs.add(dumps(payload))
+
+        self.assertEqual(len(outputs), 1)
+        self.assertEqual(json.loads(outputs.pop()), {
+            'success': True,
+            'movies': {'1': 'Amélie', '2': 'Say "hi"\n'},
+            'movie': {'release_date': '2021-03-01T21:30:00',
+                      'premiere': '2021-02-01', 'score': 0.5,
+                      'budget': None},
+        })
+
+    def test_rows_are_encoded_as_objects(self):
+        rows = [(1, 'Amélie', datetime(2021, 3, 1)), (2, 'Say "%s"', None)]
+        expected = [
+            {'id': 1, 'title': 'Amélie',
+             'release_date': '2021-03-01T00:00:00'},
+            {'id': 2, 'title': 'Say "%s"', 'release_date': None}]
+        for name in BACKENDS:
+            use_backend(name)
+            names = ('id', 'title', 'release_date')
+            self.assertEqual(json.loads(encode_rows(rows, names)), expected)
+            encode = row_encoder(names)
+            self.assertEqual([json.loads(encode(row)) for row in rows],
+                             expected)
+
+    def test_raw_json_is_spliced_into_the_response(self):
+        for name in BACKENDS:
+            use_backend(name)
+            text = dumps({'success': True,
+                          'movies': encode_rows([(1, 'A')], ('id', 'title')),
+                          'next_cursor': None})
+            self.assertEqual(text, '{"success":true,'
+                             '"movies":[{"id":1,"title":"A"}],'
+                             '"next_cursor":null}')
+
+    def test_unknown_backend_is_rejected(self):
+        with self.assertRaises(ValueError):
+            use_backend('simplejson')
+
+    def test_jsonify_uses_the_serializer(self):
+        app = Flask(__name__)
+        app.json_encoder = SerializerJSONEncoder
+        with app.app_context():
+            res = jsonify({'release_date': datetime(2021, 3, 1)})
+        self.assertEqual(res.get_data(as_text=True),
+                         '{"release_date":"2021-03-01T00:00:00"}\n')
+
+
+class SerializerThroughputBenchmark(BackendMixin, unittest.TestCase):
+    """Benchmark: rows per second encoded in a 100k movie payload, as the
+    dicts of format() through Flask's default encoder, and as rows through
+    each backend of the serializer"""
+
+    row_count = 100000
+    names = ('id', 'title', 'release_date')
+
+    def rows_per_second(self, encode):
+        start = time.perf_counter()
+        text = encode()
+        elapsed = time.perf_counter() - start
+        self.assertEqual(len(json.loads(text)), self.row_count)
+        return self.row_count / elapsed
+
+    def test_benchmark_large_list_payload(self):
+        rows = movie_rows(self.row_count)
+        app = Flask(__name__)
+        app.json_encoder = JSONEncoder
+        with app.app_context():
+            results = {'flask': self.rows_per_second(lambda: flask_json.dumps(
+                [dict(zip(self.names, row)) for row in rows]))}
+        for name in BACKENDS:
+            use_backend(name)
+            results[name] = self.rows_per_second(
+                lambda: encode_rows(rows, self.names))
+
+        print(f"\n{self.row_count} movies: " + ', '.join(
+            f'{name} {result:.0f} rows/s' for name, result in results.items()))
+        self.assertGreater(results['stdlib'], results['flask'])
+
+    @unittest.skipIf(serializer.orjson is None, 'orjson is needed')
+    def test_benchmark_orjson_dicts_against_template(self):
+        # the orjson backend zips each row into a dict for one orjson call,
+        # rather than filling in the template of the stdlib backend
+        rows = movie_rows(self.row_count)
+        use_backend('orjson')
+        encode_row = template_row_encoder(self.names)
+        template = self.rows_per_second(
+            lambda: '[' + ','.join(map(encode_row, rows)) + ']')
+        dicts = self.rows_per_second(lambda: encode_rows(rows, self.names))
+
+        print(f"\n{self.row_count} movies with orjson: template "
+              f"{template:.0f} rows/s, dicts {dicts:.0f} rows/s")
+        self.assertGreater(dicts, template)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
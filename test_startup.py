@@ -0,0 +1,137 @@
+# ---------------------------------------------------------
+# Imports
+# ---------------------------------------------------------
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from test_auth import CountingJWKSCache, LocalAuthMixin
+
+import auth
+from app import create_app, warm_up
+from models import db, setup_db
+
+try:
+    import flask_script
+except ImportError:
+    flask_script = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+# ---------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------
+
+def run_python(code):
+    """Runs `code` in a new interpreter, in the repository, and returns
+    what it printed as JSON"""
+    output = subprocess.run(
+        [sys.executable, '-c', code], cwd=HERE, check=True,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE).stdout
+    return json.loads(output.decode().splitlines()[-1])
+
+
+# ---------------------------------------------------------
+# Tests
+# ---------------------------------------------------------
+
+
+class StartupTestCase(unittest.TestCase):
+    """This class represents the lazy app construction test cases"""
+
+    def test_importing_creates_nothing(self):
+        loaded = run_python(
+            'import json, sys, app, asgi, models\n'
+            'print(json.dumps([app._app is None, asgi._asgi_app is None,\n'
+            '                  models.db.app is None,\n'
+            '                  "jose" in sys.modules]))')
+        self.assertEqual(loaded, [True, True, True, False])
+
+    def test_app_is_created_once_on_first_use(self):
+        same = run_python(
+            'import json, app, asgi\n'
+            'print(json.dumps([app.APP is app.get_app(),\n'
+            '                  asgi.ASGI_APP is asgi.get_asgi_app(),\n'
+            '                  asgi.ASGI_APP.wsgi_app is app.APP]))')
+        self.assertEqual(same, [True, True, True])
+        with self.assertRaises(subprocess.CalledProcessError):
+            run_python('import app; app.APPS')
+
+    @unittest.skipIf(flask_script is None, 'Flask-Script is needed')
+    def test_manage_creates_the_app_for_commands_only(self):
+        created = run_python(
+            'import json, app, manage\n'
+            'print(json.dumps(app._app is None))')
+        self.assertTrue(created)
+
+
+class WarmUpTestCase(LocalAuthMixin, unittest.TestCase):
+    """This class represents the warm up test cases"""
+
+    jwks_cache_class = CountingJWKSCache
+
+    def test_warm_up_loads_the_keys_without_connecting(self):
+        app = create_app()
+        setup_db(app, 'sqlite:///' + os.path.join(self.tmpdir.name,
+                                                  'casting.db'))
+        connections = []
+
+        def count_connection(dbapi_connection, connection_record):
+            connections.append(dbapi_connection)
+
+        event.listen(Engine, 'connect', count_connection)
+        try:
+            warm_up(app)
+            warm_up(app)
+            self.assertEqual(auth.jwks_cache.fetches, 1)
+            self.assertIsNotNone(auth.jwks_cache.peek('key-1'))
+            self.assertEqual(connections, [])
+        finally:
+            event.remove(Engine, 'connect', count_connection)
+            with app.app_context():
+                db.get_engine(app).dispose()
+
+
+class ImportTimeBenchmark(unittest.TestCase):
+    """Benchmark: milliseconds to import, in a new interpreter, the
+    libraries the app is built on (the baseline), then the app's own
+    modules on top of them, then to do what is left for the first use
+    (create the app, import python-jose), best of a few runs. The app's
+    own modules must take less than IMPORT_TIME_BUDGET percent of the
+    baseline (default 30), which an eager import of python-jose exceeds"""
+
+    runs = 5
+    budget = float(os.getenv("IMPORT_TIME_BUDGET", 30))
+
+    def test_benchmark_import_time(self):
+        timings = [run_python(
+            'import json, time\n'
+            'start = time.perf_counter()\n'
+            'import flask, flask_sqlalchemy, sqlalchemy.orm\n'
+            'libraries = time.perf_counter()\n'
+            'import app\n'
+            'imported = time.perf_counter()\n'
+            'app.APP\n'
+            'from jose import jwt\n'
+            'print(json.dumps([(libraries - start) * 1000,\n'
+            '                  (imported - libraries) * 1000,\n'
+            '                  (time.perf_counter() - imported) * 1000]))')
+            for _ in range(self.runs)]
+        baseline, imported, deferred = (
+            min(timing[phase] for timing in timings) for phase in range(3))
+        print(f"\nFlask and SQLAlchemy: {baseline:.0f} ms, then import app: "
+              f"{imported:.0f} ms ({imported / baseline:.0%}), left for the "
+              f"first use: {deferred:.0f} ms")
+        self.assertLess(imported, baseline * self.budget / 100)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+# ---------------------------------------------------------
+# Imports
+# ---------------------------------------------------------
+
+import unittest
+
+from flask import Flask, jsonify
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+from test_auth import LocalAuthMixin
+
+import auth
+from timing import Histogram, init_timing, timed
+
+
+# ---------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------
+
+def parse_server_timing(header):
+    """Server-Timing header as {name: {'dur': ..., 'desc': ...}}"""
+    metrics = {}
+    for entry in header.split(','):
+        name, *params = entry.strip().split(';')
+        metrics[name] = dict(param.split('=', 1) for param in params)
+    return metrics
+
+
+# ---------------------------------------------------------
+# Tests
+# ---------------------------------------------------------
+
+
+class HistogramTestCase(unittest.TestCase):
+    """This class represents the histogram test cases"""
+
+    def test_counts_are_cumulative(self):
+        histogram = Histogram((1, 10))
+        for value in (0.5, 1, 5, 50):
+            histogram.observe(value)
+        snapshot = histogram.snapshot()
+
+        self.assertEqual(snapshot['buckets'], {'1': 2, '10': 3, '+Inf': 4})
+        self.assertEqual(snapshot['count'], 4)
+        self.assertEqual(snapshot['sum'], 56.5)
+
+
+class RequestTimingTestCase(LocalAuthMixin, unittest.TestCase):
+    """This class represents the per-request timing test cases"""
+
+    def setUp(self):
+        super().setUp()
+        self.engine = create_engine('sqlite://')
+
+    def tearDown(self):
+        self.engine.dispose()
+        super().tearDown()
+
+    def create_client(self, enabled):
+        app = Flask(__name__)
+        self.histograms = init_timing(app, enabled)
+
+        @app.route('/movie')
+        @auth.requires_auth('get:movie')
+        def get_movies(payload):
+            with self.engine.connect() as connection:
+                connection.execute('SELECT 1').fetchall()
+                connection.execute('SELECT 2').fetchall()
+            return jsonify({'success': True, 'movies': list(range(100))})
+
+        @app.route('/broken')
+        def get_broken():
+            with self.engine.connect() as connection:
+                with self.assertRaises(OperationalError):
+                    connection.execute('SELECT * FROM missing')
+                connection.execute('SELECT 1').fetchall()
+            return jsonify({'success': True})
+
+        @app.errorhandler(auth.AuthError)
+        def auth_error(error):
+            return jsonify({'success': False}), error.status_code
+
+        return app.test_client()
+
+    def test_phases_are_reported_in_server_timing(self):
+        client = self.create_client(enabled=True)
+
+        res = client.get('/movie', headers=self.headers)
+        metrics = parse_server_timing(res.headers['Server-Timing'])
+        self.assertEqual(
+            set(metrics), {'auth', 'jwks', 'jwt', 'db', 'serialize', 'total'})
+        self.assertEqual(metrics['db']['desc'], '"2 queries"')
+        self.assertGreaterEqual(float(metrics['auth']['dur']),
+                                float(metrics['jwt']['dur']))
+
+        # the keys and the verified token are cached from now on
+        res = client.get('/movie', headers=self.headers)
+        metrics = parse_server_timing(res.headers['Server-Timing'])
+        self.assertNotIn('jwks', metrics)
+        self.assertNotIn('jwt', metrics)
+
+    def test_timings_are_aggregated_in_histograms(self):
+        client = self.create_client(enabled=True)
+        for _ in range(3):
+            client.get('/movie', headers=self.headers)
+        # errors produced by errorhandlers are timed too
+        client.get('/movie')
+
+        snapshot = self.histograms.snapshot()
+        self.assertEqual(snapshot['total']['count'], 4)
+        self.assertEqual(snapshot['auth']['count'], 4)
+        self.assertEqual(snapshot['jwks']['count'], 1)
+        self.assertEqual(snapshot['db_statement']['count'], 6)
+        self.assertEqual(snapshot['db_queries']['buckets']['0'], 1)
+        self.assertEqual(snapshot['db_queries']['buckets']['2'], 4)
+
+    def test_statements_that_raise_are_timed(self):
+        client = self.create_client(enabled=True)
+        for _ in range(2):
+            res = client.get('/broken')
+            metrics = parse_server_timing(res.headers['Server-Timing'])
+            self.assertEqual(metrics['db']['desc'], '"2 queries"')
+
+        # no start is left behind for the next statements
+        with self.engine.connect() as connection:
+            self.assertEqual(connection.info['_timing_starts'], [])
+        self.assertEqual(
+            self.histograms.snapshot()['db_statement']['count'], 4)
+
+    def test_timing_is_off_by_default(self):
+        client = self.create_client(enabled=False)
+        res = client.get('/movie', headers=self.headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('Server-Timing', res.headers)
+        self.assertEqual(self.histograms.snapshot(), {})
+
+    def test_timed_outside_of_a_request_is_a_no_op(self):
+        with timed('auth'):
+            pass
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,246 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Get necessary Environment Variables:
+# time the phases of every request (auth, SQL, serialization), report them
+# in a Server-Timing header and aggregate them in histograms
+REQUEST_TIMING = os.getenv(
+    "REQUEST_TIMING", "false").lower() in ('1', 'true', 'yes')
+
+# upper bounds of the histogram buckets, in milliseconds
+TIMING_BUCKETS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+# upper bounds of the buckets for the number of statements per request
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+
+
+# ----------------------------------------------------------------- #
+# Histograms.
+# ----------------------------------------------------------------- #
+
+'''
+Histogram
+    counts observations in fixed buckets, plus their number and sum.
+    snapshot() reports cumulative counts, the number of observations
+    less than or equal to each bound, as Prometheus does.
+'''
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self.counts)
+            count, total = self.count, self.sum
+        buckets = {}
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += bucket_count
+            buckets[str(bound)] = cumulative
+        return {'buckets': buckets, 'count': count, 'sum': round(total, 3)}
+
+
+'''
+TimingHistograms
+    the histograms of one worker: one per phase of a request (in
+    milliseconds), one of the duration of each SQL statement and one of
+    the number of statements per request
+'''
+
+
+class TimingHistograms:
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, buckets=TIMING_BUCKETS):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(
+                    name, Histogram(buckets))
+        return histogram
+
+    def snapshot(self):
+        return {name: histogram.snapshot()
+                for name, histogram in sorted(self._histograms.items())}
+
+
+# ----------------------------------------------------------------- #
+# Per-request timings.
+# ----------------------------------------------------------------- #
+
+'''
+RequestTimings
+    seconds spent in each phase of the current request, kept in flask.g.
+    Phases may nest: 'auth' includes 'jwks' (loading the signing keys) and
+    'jwt' (checking the signature).
+'''
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phases = {}
+        self.statements = []
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0) + seconds
+
+    def server_timing(self, total):
+        # e.g. auth;dur=1.2, db;dur=3.4;desc="2 queries", total;dur=5.1
+        entries = []
+        for phase, seconds in self.phases.items():
+            entry = f'{phase};dur={seconds * 1000:.3f}'
+            if phase == 'db':
+                entry += f';desc="{len(self.statements)} queries"'
+            entries.append(entry)
+        entries.append(f'total;dur={total * 1000:.3f}')
+        return ', '.join(entries)
+
+
+def current_timings():
+    # the timings of the request being served, None when timing is off or
+    # outside of a request
+    if has_request_context():
+        return g.get('_timings')
+    return None
+
+
+@contextmanager
+def timed(phase):
+    timings = current_timings()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(phase, time.perf_counter() - start)
+
+
+# ----------------------------------------------------------------- #
+# SQL statements.
+# ----------------------------------------------------------------- #
+
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    if current_timings() is not None:
+        conn.info.setdefault('_timing_starts', []).append(
+            (context, time.perf_counter()))
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    record_statement(conn, context)
+
+
+def handle_error(exception_context):
+    # a statement that raised gets no after_cursor_execute; errors raised
+    # elsewhere (connecting, fetching rows) have no start of their own
+    if exception_context.connection is not None:
+        record_statement(exception_context.connection,
+                         exception_context.execution_context)
+
+
+def record_statement(conn, context):
+    timings = current_timings()
+    starts = conn.info.get('_timing_starts')
+    if starts and starts[-1][0] is context:
+        seconds = time.perf_counter() - starts.pop()[1]
+        if timings is not None:
+            timings.add('db', seconds)
+            timings.statements.append(seconds)
+
+
+_listening = False
+_listening_lock = threading.Lock()
+
+
+def listen_to_statements():
+    # on every engine, once per process; statements outside of a timed
+    # request cost a context lookup
+    global _listening
+    with _listening_lock:
+        if not _listening:
+            event.listen(Engine, 'before_cursor_execute',
+                         before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+            event.listen(Engine, 'handle_error', handle_error)
+            _listening = True
+
+
+# ----------------------------------------------------------------- #
+# Flask integration.
+# ----------------------------------------------------------------- #
+
+def timed_json_encoder(base):
+    # JSON encoder counting its time as the 'serialize' phase
+    class TimedJSONEncoder(base):
+        def encode(self, o):
+            with timed('serialize'):
+                return super().encode(o)
+    return TimedJSONEncoder
+
+
+'''
+init_timing(app, enabled)
+    when enabled, times every request of `app`: adds the Server-Timing
+    header and feeds app.extensions['timing'], the histograms of this
+    worker. Disabled, it only creates the (empty) histograms.
+'''
+
+
+def init_timing(app, enabled=REQUEST_TIMING):
+    histograms = TimingHistograms()
+    app.extensions['timing'] = histograms
+    app.config['REQUEST_TIMING'] = enabled
+    if not enabled:
+        return histograms
+
+    listen_to_statements()
+    app.json_encoder = timed_json_encoder(app.json_encoder)
+
+    @app.before_request
+    def start_timing():
+        g._timings = RequestTimings()
+
+    @app.after_request
+    def finish_timing(response):
+        timings = g.pop('_timings', None)
+        if timings is None:
+            return response
+        total = time.perf_counter() - timings.started_at
+        response.headers['Server-Timing'] = timings.server_timing(total)
+
+        for phase, seconds in timings.phases.items():
+            histograms.histogram(phase).observe(seconds * 1000)
+        histograms.histogram('total').observe(total * 1000)
+        statement_histogram = histograms.histogram('db_statement')
+        for seconds in timings.statements:
+            statement_histogram.observe(seconds * 1000)
+        histograms.histogram('db_queries', QUERY_COUNT_BUCKETS).observe(
+            len(timings.statements))
+        return response
+
+    return histograms